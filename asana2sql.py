@@ -2,15 +2,23 @@
 
 import argparse
 import copy
+import os
 import pyodbc
 import requests
+import time
 
+from asana2sql import cassette
+from asana2sql import latency
+from asana2sql import sharding
+from asana2sql import util
+from asana2sql.events import ProjectEvents
 from asana2sql.fields import default_fields, default_story_fields
 from asana2sql.Project import Project
 from asana2sql.Story import Story
 from asana2sql.workspace import Workspace
 from asana2sql.db_wrapper import DatabaseWrapper
-from asana import Client, session
+from asana2sql.commit_controller import CommitController
+from asana2sql.client import build_asana_client
 
 def arg_parser():
     parser = argparse.ArgumentParser()
@@ -32,12 +40,50 @@ def arg_parser():
             help=("Name of the SQL table to use for tasks."
                   "If not specified it will be derived from the project name."))
 
+    parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help=("Number of processes to export or synchronize a workspace "
+                  "with.  Each worker has its own Asana client and database "
+                  "connection, and commits after every task; writes to the "
+                  "shared tables (users, projects, custom fields) are merged "
+                  "by the main process at the end."))
+
+    parser.add_argument(
+            '--cache_size',
+            type=int,
+            help=("Keep at most this many users and projects in memory, "
+                  "loading them from the database as needed, instead of "
+                  "loading the whole tables up front."))
+
+    parser.add_argument(
+            '--pipeline_depth',
+            type=int,
+            default=2,
+            help=("Number of task pages to fetch ahead of the database writes "
+                  "on a background thread.  0 fetches and writes in turn."))
+
+    parser.add_argument(
+            '--max_runtime',
+            type=float,
+            help=("Stop an export cleanly, at the end of a page of tasks or "
+                  "of a task's stories, once it has run for this many "
+                  "seconds.  Continue it later with export --resume."))
+
     parser.add_argument(
             '--dump_perf',
             action="store_true",
             default=False,
             help="Print performance information on completion.")
 
+    parser.add_argument(
+            '--perf_json',
+            metavar="FILE",
+            help=("Write the API and database counters and latency "
+                  "percentiles, by endpoint and by SQL statement, to FILE "
+                  "as JSON on completion."))
+
     parser.add_argument(
         '--with_subtasks',
         action="store_true",
@@ -50,6 +96,21 @@ def arg_parser():
         default=False,
         help="Fetch and store task stories (comments and edit history) as well as task and project details.")
 
+    parser.add_argument(
+        '--incremental',
+        action="store_true",
+        default=False,
+        help=("Only fetch and write tasks modified since the last export or "
+              "synchronize of the project (subtasks are only refreshed with "
+              "their parent)."))
+
+    parser.add_argument(
+        '--skip_unchanged_rows',
+        action="store_true",
+        default=False,
+        help=("Skip rewriting task rows whose direct field values haven't "
+              "changed, by their fingerprints stored on every write."))
+
     parser.add_argument("--projects_table_name")
     parser.add_argument("--project_memberships_table_name")
     parser.add_argument("--users_table_name")
@@ -58,6 +119,11 @@ def arg_parser():
     parser.add_argument("--custom_field_enum_values_table_name")
     parser.add_argument("--custom_field_values_table_name")
     parser.add_argument("--stories_table_name")
+    parser.add_argument("--sync_state_table_name")
+    parser.add_argument("--event_sync_tokens_table_name")
+    parser.add_argument("--row_fingerprints_table_name")
+    parser.add_argument("--export_progress_table_name")
+    parser.add_argument("--exported_tasks_table_name")
 
     # Asana Client options
     asana_args = parser.add_argument_group('Asana Client Options')
@@ -85,6 +151,71 @@ def arg_parser():
             default=False,
             help="Dump API requests to STDOUT")
 
+    asana_args.add_argument(
+            "--requests_per_minute",
+            type=int,
+            help=("Maximum number of Asana API requests to issue per minute. "
+                  "429 responses are always honored."))
+
+    asana_args.add_argument(
+            "--page_size",
+            type=int,
+            default=100,
+            help="Number of tasks or stories to fetch per API request (at most 100).")
+
+    asana_args.add_argument(
+            "--api_concurrency",
+            type=int,
+            default=1,
+            help="Maximum number of Asana API requests to run in parallel.")
+
+    asana_args.add_argument(
+            "--async_engine",
+            action="store_true",
+            default=False,
+            help=("Fetch projects, tasks, subtasks, stories and custom fields "
+                  "with an aiohttp client sharing --api_concurrency "
+                  "connections, instead of a blocking request per thread."))
+
+    asana_args.add_argument(
+            "--http_pool_size",
+            type=int,
+            help=("Number of HTTP connections to keep open to the Asana API. "
+                  "Defaults to --api_concurrency, and at least 10."))
+
+    asana_args.add_argument(
+            "--no_keep_alive",
+            dest="keep_alive",
+            default=True,
+            action="store_false",
+            help="Open a new HTTP connection for every API request.")
+
+    asana_args.add_argument(
+            "--no_compression",
+            dest="compression",
+            default=True,
+            action="store_false",
+            help="Don't ask for gzip compressed API responses.")
+
+    cassette_args = asana_args.add_mutually_exclusive_group()
+
+    cassette_args.add_argument(
+            "--record",
+            metavar="DIR",
+            help="Record every API response to a cassette in DIR.")
+
+    cassette_args.add_argument(
+            "--replay",
+            metavar="DIR",
+            help=("Serve the API responses recorded in DIR instead of "
+                  "calling Asana, failing on any request not recorded."))
+
+    asana_args.add_argument(
+            "--replay_latency",
+            type=cassette.replay_latency,
+            help=("Delay each replayed response by this many seconds, or by "
+                  "the time it took when recorded with `recorded'."))
+
     # DB options
     db_args = parser.add_argument_group('Database Options')
 
@@ -104,6 +235,35 @@ def arg_parser():
             default=False,
             help="Dry run.  Do not actually run any writes to the database.")
 
+    db_args.add_argument(
+            "--write_batch_size",
+            type=int,
+            default=0,
+            help=("Buffer consecutive writes of the same statement and "
+                  "execute them in batches of up to this many rows.  0 "
+                  "executes every write immediately."))
+
+    db_args.add_argument(
+            "--commit_every",
+            type=int,
+            default=None,
+            help=("Commit after every this many tasks (or stories of a task) "
+                  "instead of once per project."))
+
+    db_args.add_argument(
+            "--commit_interval",
+            type=float,
+            help="Also commit once this many seconds have passed since the last commit.")
+
+    db_args.add_argument(
+            "--busy_timeout",
+            type=float,
+            default=60,
+            help=("With --workers, how many seconds a worker waits for "
+                  "another worker's write lock on the database before "
+                  "failing.  Workers commit after every task unless "
+                  "--commit_every says otherwise."))
+
     # Commands
     subparsers = parser.add_subparsers(
             title="Commands",
@@ -118,65 +278,91 @@ def arg_parser():
             help="Export the tasks in the project, "
                  "not deleting deleted tasks from the database.")
 
+    export_parser.add_argument(
+            "--resume",
+            action="store_true",
+            default=False,
+            help=("Continue an interrupted export, skipping the projects, "
+                  "task pages and stories it finished, and record progress "
+                  "so this export can be resumed in turn."))
+
     export_parser = subparsers.add_parser(
             'synchronize',
             help="Syncrhonize the tasks in the project with the database.")
 
-    return parser
+    subparsers.add_parser(
+            'migrate_stories',
+            help=("Move the stories in the per-task stories tables of the "
+                  "tasks in the database into --stories_table_name."))
+
+    subparsers.add_parser(
+            'ensure_indexes',
+            help=("Add the indexes `create' makes to a database created "
+                  "without them."))
+
+    watch_parser = subparsers.add_parser(
+            'watch',
+            help="Keep the database in sync by applying the Asana event "
+                 "stream of each project, refetching only the changed tasks.")
+
+    watch_parser.add_argument(
+            "--poll_interval",
+            type=float,
+            default=60,
+            help="Seconds to wait between polls of the event stream.")
+
+    watch_parser.add_argument(
+            "--once",
+            action="store_true",
+            default=False,
+            help="Poll each project once and exit.")
 
-def build_asana_client(args):
-    options = {
-        'session': session.AsanaOAuth2Session(
-            token={'access_token': args.access_token})}
-
-    if args.base_url:
-        options['base_url'] = args.base_url
-    if args.verify is not None:
-        # urllib3.disable_warnings()
-        options['verify'] = args.verify
-    if args.dump_api:
-        options['dump_api'] = args.dump_api
-
-    return RequestCountingClient(**options);
-
-class RequestCountingClient(Client):
-    def __init__(self, dump_api=False, session=None, auth=None, **options):
-        Client.__init__(self, session=session, auth=auth, **options)
-        self._dump_api = dump_api
-        self._num_requests = 0
-
-    @property
-    def num_requests(self):
-        return self._num_requests
-
-    def request(self, method, path, **options):
-        if self._dump_api:
-            print("{}: {}".format(method, path))
-        self._num_requests += 1
-        return Client.request(self, method, path, **options)
+    return parser
 
 def main():
     parser = arg_parser()
     args = parser.parse_args()
 
-    if args.command == 'synchronize' and args.table_name and args.workspace_id:
+    if args.command in ('synchronize', 'watch') and args.table_name and args.workspace_id:
         raise parser.error("To synchronize a workspace, table_name must be omitted; each project requires its own table. Consider using export for workspaces instead.")
 
-    if args.command == 'synchronize' and args.stories_table_name:
-        raise parser.error("To synchronize stories, stories_table_name must be omitted; each task requires its own table. Consider using export for stories instead.")
+    if args.command == 'migrate_stories' and not args.stories_table_name:
+        raise parser.error("migrate_stories moves the per-task stories tables into --stories_table_name, which must be given.")
+
+    if args.workers > 1 and not args.workspace_id:
+        raise parser.error("--workers only applies to workspaces.")
+
+    if args.async_engine and (args.record or args.replay):
+        raise parser.error("--record and --replay only apply to the blocking client, not --async_engine.")
+
+    if args.max_runtime is not None and args.command != 'export':
+        raise parser.error("--max_runtime only applies to export.")
+
+    vars(args)["deadline"] = (
+            time.time() + args.max_runtime if args.max_runtime is not None else None)
 
     client = build_asana_client(args)
+    try:
+        command_main(args, client)
+    finally:
+        client.close()
+
 
+def command_main(args, client):
     db_client = None
     if args.odbc_string:
         print("Connecting to database.")
         db_client = pyodbc.connect(args.odbc_string)
 
-    db_wrapper = DatabaseWrapper(db_client, dump_sql=args.dump_sql, dry=args.dry)
+    db_wrapper = CommitController(
+            DatabaseWrapper(db_client, dump_sql=args.dump_sql, dry=args.dry,
+                            batch_size=args.write_batch_size),
+            commit_every=args.commit_every, commit_interval=args.commit_interval)
 
     workspace = Workspace(client, db_wrapper, args)
     project_singleton = Project(client, db_wrapper, workspace, args, default_fields(workspace))
     story_singleton = Story(client, db_wrapper, None, args, default_story_fields(None))
+    worker_counters = []
 
     if args.command == 'create':
 
@@ -189,21 +375,183 @@ def main():
         if args.with_stories and args.stories_table_name:
             story_singleton.create_table()
 
-        if not args.dry:
-            db_client.commit()
+        db_wrapper.commit()
+    elif args.command == 'ensure_indexes':
+        workspace.create_indexes()
+        if args.stories_table_name:
+            story_singleton.create_indexes()
+        db_wrapper.commit()
+    elif args.command == 'watch':
+        watch_main(args, client, db_wrapper, workspace)
+    elif args.command == 'migrate_stories':
+        migrate_stories_main(args, client, db_wrapper, workspace,
+                             project_singleton, story_singleton)
     elif args.project_id:
         project_main(args, client, db_client, db_wrapper, project_singleton)
+    elif args.workspace_id and args.workers > 1 and args.command in ('export', 'synchronize'):
+        project_ids = [asana_project.get("id") for asana_project in
+                       client.projects.find_by_workspace(args.workspace_id)]
+        worker_counters = sharded_main(args, project_ids, db_wrapper)
     elif args.workspace_id:
         projects = list(client.projects.find_by_workspace(args.workspace_id))
         for asana_project in projects:
             project_id = asana_project.get("id")
+            if _out_of_time(args):
+                print("Stopped at --max_runtime before project {}; "
+                      "run `export --resume' to continue.".format(project_id))
+                break
             project_args = copy.copy(args)
             vars(project_args)["project_id"] = project_id
             a2s_project = Project(client, db_wrapper, workspace, project_args, default_fields(workspace))
             project_main(project_args, client, db_client, db_wrapper, a2s_project)
 
+    if args.perf_json:
+        latency.write_perf_json(args.perf_json, client, db_wrapper, worker_counters)
+
+
+def _out_of_time(args):
+    deadline = vars(args).get("deadline")
+    return deadline is not None and time.time() >= deadline
+
+
+# Per-process state of a --workers process, built once by _init_worker.
+_worker = None
+
+def _init_worker(args):
+    global _worker
+    client = build_asana_client(args)
+    db_client = pyodbc.connect(args.odbc_string) if args.odbc_string else None
+    db_wrapper = sharding.worker_db_wrapper(
+            db_client, args.busy_timeout,
+            commit_every=args.commit_every, commit_interval=args.commit_interval,
+            dump_sql=args.dump_sql, dry=args.dry, batch_size=args.write_batch_size)
+    shared_writes = sharding.SharedTableWrites()
+    workspace = Workspace(client, db_wrapper, args, shared_db_client=shared_writes)
+    _worker = (args, client, db_client, db_wrapper, workspace, shared_writes)
+
+def _worker_project_main(project_id):
+    """Returns the shared table writes of the project, and the worker's
+    process id and perf_counters so far."""
+    args, client, db_client, db_wrapper, workspace, shared_writes = _worker
+    if not _out_of_time(args):
+        project_args = copy.copy(args)
+        vars(project_args)["project_id"] = project_id
+        a2s_project = Project(client, db_wrapper, workspace, project_args, default_fields(workspace))
+        project_main(project_args, client, db_client, db_wrapper, a2s_project)
+    return (shared_writes.drain(),
+            (os.getpid(), latency.perf_counters(client, db_wrapper)))
+
+def sharded_main(args, project_ids, db_wrapper):
+    """Returns the final perf_counters of each worker."""
+    shared_writes = []
+    worker_counters = {}
+    for writes, (pid, counters) in sharding.run_sharded(
+            _init_worker, (args,), _worker_project_main, project_ids, args.workers):
+        shared_writes.append(writes)
+        # A worker's counters add up over its projects, and its results
+        # arrive in order, so the last ones cover all its work.
+        worker_counters[pid] = counters
+
+    # Merge the shared tables from this process only, once every worker is
+    # done, so workers never contend for the same rows.
+    num_merged = sharding.merge_shared_writes(db_wrapper, shared_writes)
+    db_wrapper.commit()
+
+    if args.dump_perf:
+        print("Merged {} shared table writes from {} projects in {} workers.".format(
+            num_merged, len(project_ids), args.workers))
+
+    return list(worker_counters.values())
+
+
+def watch_main(args, client, db_wrapper, workspace):
+    if args.project_id:
+        project_ids = [args.project_id]
+    else:
+        project_ids = [asana_project.get("id") for asana_project in
+                       client.projects.find_by_workspace(args.workspace_id)]
+
+    watched = []
+    for project_id in project_ids:
+        project_args = copy.copy(args)
+        vars(project_args)["project_id"] = project_id
+        a2s_project = Project(client, db_wrapper, workspace, project_args, default_fields(workspace))
+        watched.append((project_args, a2s_project,
+                        ProjectEvents(client, workspace, a2s_project, project_id)))
+
+    while True:
+        for project_args, a2s_project, project_events in watched:
+            refreshed = project_events.poll()
+            if args.with_stories:
+                tasks = a2s_project.tasks() if refreshed is None else refreshed
+                for task in tasks:
+                    story = Story(client, db_wrapper, task, project_args, default_story_fields(task))
+                    story.synchronize()
+                    db_wrapper.checkpoint()
+
+            db_wrapper.commit()
+
+            if args.dump_perf:
+                print("Polled events for project {} ({}): {}".format(
+                    a2s_project.project_name(), project_args.project_id,
+                    "resynchronized" if refreshed is None
+                        else "{} tasks refreshed".format(len(refreshed))))
+                print("API Requests: {}".format(client.num_requests))
+
+        if args.once:
+            break
+        time.sleep(args.poll_interval)
+
+
+def migrate_stories_main(args, client, db_wrapper, workspace, project_singleton,
+                         story_singleton):
+    """Move the stories in the per-task stories tables of every task in the
+    tasks table(s) into the --stories_table_name table, dropping them."""
+    story_singleton.create_table()
+
+    if args.table_name:
+        tasks = project_singleton.db_select_all()
+    else:
+        if args.project_id:
+            project_ids = [args.project_id]
+        else:
+            project_ids = [asana_project.get("id") for asana_project in
+                           client.projects.find_by_workspace(args.workspace_id)]
+        tasks = []
+        for project_id in project_ids:
+            project_args = copy.copy(args)
+            vars(project_args)["project_id"] = project_id
+            tasks.extend(Project(client, db_wrapper, workspace, project_args,
+                                 default_fields(workspace)).db_select_all())
+
+    per_task_args = copy.copy(args)
+    vars(per_task_args)["stories_table_name"] = None
+    table_names = set()
+    for task in tasks:
+        table_name = Story(client, db_wrapper, task, per_task_args,
+                           default_story_fields(task)).stories_table_name()
+        if table_name == story_singleton.stories_table_name():
+            continue
+        table_names.add(table_name)
+
+    num_migrated = 0
+    for table_name in sorted(table_names):
+        if db_wrapper.table_exists(table_name):
+            story_singleton.merge_table(table_name)
+            db_wrapper.checkpoint()
+            num_migrated += 1
+    db_wrapper.commit()
+
+    print("Migrated {} per-task stories tables of {} tasks into {}.".format(
+        num_migrated, len(tasks), story_singleton.stories_table_name()))
+
 
 def project_main(args, client, db_client, db_wrapper, project):
+    if args.command == 'export' and project.export_completed():
+        if args.dump_perf:
+            print("Skipping project {}, already exported.".format(args.project_id))
+        return
+
     if args.command == 'create' and args.table_name is None:
         project.create_table()
     elif args.command == 'export':
@@ -211,24 +559,81 @@ def project_main(args, client, db_client, db_wrapper, project):
     elif args.command == 'synchronize':
         project.synchronize()
 
-    if args.with_stories:
-        stories = [Story(client, db_wrapper, task, args, default_story_fields(task)) for task in project.tasks()]
-        for story in stories:
+    if args.with_stories and not project.interrupted:
+        tasks = project.tasks()
+        if args.command in ('export', 'synchronize'):
+            tasks = project.story_tasks()
+        # Stories are built as they are needed, and each one is dropped once
+        # written, so only a few tasks' stories are held at a time.
+        stories = (Story(client, db_wrapper, task, args, default_story_fields(task))
+                   for task in tasks)
+        if args.command in ('export', 'synchronize'):
+            # Fetch stories concurrently, but write them from this thread in
+            # task order.
+            stories = util.parallel_map(Story.prefetch, stories, args.api_concurrency)
+        for task, story in zip(tasks, stories):
             if args.command == 'create' and args.stories_table_name is None:
                 story.create_table()
             elif args.command == 'export':
                 story.export()
+                project.record_stories_exported(task)
             elif args.command == 'synchronize':
                 story.synchronize()
+            db_wrapper.checkpoint()
+            if args.command == 'export' and project.check_deadline():
+                break
+
+    if args.command == 'export':
+        project.complete_export()
+    db_wrapper.commit()
 
-    if not args.dry:
-        db_client.commit()
+    if project.interrupted:
+        print("Stopped `export' of project {} at --max_runtime; "
+              "run `export --resume' to continue.".format(args.project_id))
 
     if args.dump_perf:
         print("Finished `{}' on project {} ({})".format(args.command, project.project_name(), args.project_id))
         print("API Requests: {}".format(client.num_requests))
-        print("DB Commands: reads = {}, writes = {}, executed = {}".format(
-            db_wrapper.num_reads, db_wrapper.num_writes, db_wrapper.num_executed))
+        print("API Throttling: 429s = {}, slow = {}, server errors = {}, "
+              "retry-after wait = {:.1f}s, rate limit wait = {:.1f}s, "
+              "concurrency = {} (min {})".format(
+            client.scheduler.num_throttled, client.scheduler.num_slow,
+            client.scheduler.num_server_errors,
+            client.scheduler.throttle_wait_seconds,
+            client.scheduler.rate_wait_seconds,
+            client.scheduler.concurrency_limit,
+            client.scheduler.min_concurrency_limit))
+        print("HTTP Connections: opened = {}, requests = {}, reused = {}, compressed responses = {}".format(
+            client.connection_stats.num_connections,
+            client.connection_stats.num_requests,
+            client.connection_stats.num_reused,
+            client.connection_stats.num_compressed))
+        print("Task rows: written = {}, skipped unchanged = {}, skipped duplicate = {}, "
+              "skipped resumed = {}".format(
+            project.num_rows_written, project.num_rows_skipped,
+            project.num_tasks_deduplicated, project.num_tasks_resumed))
+        print("Task pipeline: fetch busy = {:.1f}s, idle = {:.1f}s; "
+              "write busy = {:.1f}s, idle = {:.1f}s".format(
+            project.fetch_times.busy_seconds, project.fetch_times.idle_seconds,
+            project.write_times.busy_seconds, project.write_times.idle_seconds))
+        print("Workspace caches: users hits = {}, misses = {}, evictions = {}; "
+              "projects hits = {}, misses = {}, evictions = {}".format(
+            project.workspace.users.num_hits, project.workspace.users.num_misses,
+            project.workspace.users.num_evictions,
+            project.workspace.projects.num_hits, project.workspace.projects.num_misses,
+            project.workspace.projects.num_evictions))
+        print("Commits: {} (total {:.2f}s, max {:.3f}s)".format(
+            db_wrapper.num_commits, db_wrapper.commit_seconds,
+            db_wrapper.max_commit_seconds))
+        print("DB Commands: reads = {}, writes = {}, executed = {} (batches = {})".format(
+            db_wrapper.num_reads, db_wrapper.num_writes, db_wrapper.num_executed,
+            db_wrapper.num_batches))
+        print("API Latency by endpoint:")
+        for line in client.request_latency.format_lines():
+            print(line)
+        print("DB Latency by statement:")
+        for line in db_wrapper.statement_latency.format_lines():
+            print(line)
 
 if __name__ == '__main__':
     main()
@@ -1,6 +1,8 @@
 from asana2sql import util
 import asana.error
+import hashlib
 import itertools
+import time
 
 from asana2sql import fields
 from asana2sql import workspace
@@ -23,6 +25,9 @@ SELECT_JOIN_WHERE_TEMPLATE = (
 DELETE_TEMPLATE = (
         """DELETE FROM "{table_name}" WHERE {id_column} = ?;""")
 
+# Asana returns at most 100 items per page.
+DEFAULT_PAGE_SIZE = 100
+
 class NoSuchProjectException(Exception):
     def __init__(self, project_id):
         super(NoSuchProjectException, self).__init__(
@@ -43,13 +48,77 @@ class Project(object):
 
         self._project_id = vars(self._config).get("project_id", None)
         self._table_name = self._config.table_name
+        self._incremental = vars(self._config).get("incremental", False)
+        self._skip_unchanged_rows = vars(self._config).get("skip_unchanged_rows", False)
+        self._pipeline_depth = vars(self._config).get("pipeline_depth", 0)
+        self._resume = vars(self._config).get("resume", False)
+        self._deadline = vars(self._config).get("deadline", None)
 
         self._project_data_cache = None
+        self._safe_table_name = None
+        self._statements = {}
         self._task_cache = None
+        self._task_summaries = None
+        self._newest_modified_at = None
+        self._stored_fingerprints = {}
+
+        # Tasks recorded by an earlier, interrupted export being resumed:
+        # task_id -> (name, stories_done).
+        self._exported_tasks = {}
+        self._pages_done = 0
+        self._interrupted = False
+
+        self._num_rows_written = 0
+        self._num_rows_skipped = 0
+        self._num_tasks_deduplicated = 0
+        self._num_tasks_resumed = 0
+        self._fetch_times = util.StageTimes()
+        self._write_times = util.StageTimes()
 
         for field in fields:
             self._add_field(field)
 
+    @property
+    def workspace(self):
+        return self._workspace
+
+    @property
+    def num_rows_written(self):
+        """Number of task rows written to the tasks table."""
+        return self._num_rows_written
+
+    @property
+    def num_rows_skipped(self):
+        """Number of task rows not written because they were unchanged."""
+        return self._num_rows_skipped
+
+    @property
+    def num_tasks_deduplicated(self):
+        """Number of tasks not processed because another project already
+        wrote them this run."""
+        return self._num_tasks_deduplicated
+
+    @property
+    def num_tasks_resumed(self):
+        """Number of tasks not processed because the export being resumed
+        already wrote them."""
+        return self._num_tasks_resumed
+
+    @property
+    def interrupted(self):
+        """Whether the last export stopped at its deadline before finishing."""
+        return self._interrupted
+
+    @property
+    def fetch_times(self):
+        """Busy and idle time of fetching task pages from Asana."""
+        return self._fetch_times
+
+    @property
+    def write_times(self):
+        """Busy and idle time of writing task pages to the database."""
+        return self._write_times
+
     def _project_data(self):
         """Fetch the project data from Asana and cache it."""
         if self._project_data_cache is None:
@@ -61,33 +130,183 @@ class Project(object):
         return self._project_data_cache
 
     def _required_fields(self):
-        return set(field_names for field in self._direct_fields + self._indirect_fields
-                               for field_names in field.required_fields())
+        required = set(field_names for field in self._direct_fields + self._indirect_fields
+                                   for field_names in field.required_fields())
+        if self._incremental:
+            required.add("modified_at")
+        return required
 
     def tasks(self):
+        """The project's tasks.
+
+        After an export or synchronize this is only a summary (id and name)
+        of each task written, so the full task data never has to be held in
+        memory all at once.
+        """
+        if self._task_summaries is not None:
+            return self._task_summaries
         return self._tasks()
 
     def _tasks(self):
         if self._task_cache is None:
-            result = list(
-                self._asana_client.tasks.find_by_project(
-                    self._project_id, fields=",".join(self._required_fields())))
-            if len(result) >= 50:
-                print("Warning: large unpaginated request may be truncated (fetched {} tasks).".format(len(result)))
+            self._task_cache = list(itertools.chain.from_iterable(
+                    self._task_pages(self._modified_since())))
+        return self._task_cache
 
+    def _task_pages(self, modified_since):
+        """Fetch the project's tasks from Asana one page at a time, only
+        those modified since modified_since if given.
+
+        Each page of top-level tasks is yielded together with their subtasks,
+        so at most one page of tasks is held in memory.  This may run on a
+        background thread, so it must not use the database.
+        """
+        page_size = self._page_size()
+        if self._task_cache is not None:
+            for page in util.chunks(self._task_cache, page_size):
+                yield page
+            return
+
+        options = {"fields": ",".join(self._required_fields()),
+                   "page_size": page_size}
+        if modified_since:
+            options["modified_since"] = modified_since
+        tasks = self._asana_client.tasks.find_by_project(self._project_id, **options)
+
+        for page in util.chunks(tasks, page_size):
             if self._config.with_subtasks:
-                subtask_lists = [
-                    self._asana_client.tasks.subtasks(
-                        task.get("id"), fields=",".join(self._required_fields()))
-                    for task in result]
-                result.extend(itertools.chain.from_iterable(subtask_lists))
-
-            self._task_cache = result
-
-        return self._task_cache
+                # Subtasks of tasks written by an earlier project this run
+                # were written along with them.
+                parents = [task for task in page
+                           if not self._task_already_written(task)]
+                subtask_lists = list(util.parallel_map(
+                    self._subtasks, parents, self._api_concurrency()))
+                page.extend(itertools.chain.from_iterable(subtask_lists))
+            yield page
+
+    def clear_task_cache(self):
+        """Forget the fetched tasks so the next access refetches them."""
+        self._task_cache = None
+        self._task_summaries = None
+
+    def _subtasks(self, task):
+        return list(self._asana_client.tasks.subtasks(
+            task.get("id"), fields=",".join(self._required_fields()),
+            page_size=self._page_size()))
+
+    def _dedupes_tasks(self):
+        """Tasks are only written once per run when every project shares one
+        tasks table.  A multihomed task's memberships in all its projects
+        are recorded the first time it is written."""
+        return bool(self._table_name)
+
+    def _task_already_written(self, task):
+        if task.get("id") in self._exported_tasks:
+            return True
+        return self._dedupes_tasks() and self._workspace.task_claimed(task.get("id"))
+
+    def story_tasks(self):
+        """The tasks whose stories this project should write: a multihomed
+        task's stories are only written for the first project it's seen in,
+        and a resumed export skips the tasks whose stories it already
+        wrote."""
+        return [task for task in self.tasks()
+                if not self._stories_exported(task.get("id")) and
+                   self._workspace.claim_task_stories(task.get("id"))]
+
+    # Export progress
+    def _tracks_progress(self):
+        """Exports record their progress when they may be resumed, i.e. when
+        resuming or running against a deadline."""
+        return bool(self._resume) or self._deadline is not None
+
+    def export_completed(self):
+        """Whether the export being resumed already finished this project."""
+        if not self._resume:
+            return False
+        progress = self._workspace.get_export_progress(self._project_id)
+        return bool(progress and progress[1])
+
+    def _load_progress(self):
+        """Pick up where an interrupted export of the project left off, or
+        start recording its progress afresh."""
+        self._exported_tasks = {}
+        self._pages_done = 0
+        self._interrupted = False
+        if not self._tracks_progress():
+            return
+
+        if self._resume:
+            progress = self._workspace.get_export_progress(self._project_id)
+            self._pages_done = progress[0] if progress else 0
+            self._exported_tasks = {
+                    task_id: (name, stories_done) for task_id, name, stories_done
+                    in self._workspace.get_exported_tasks(self._project_id)}
+        else:
+            self._workspace.clear_export_progress(self._project_id)
+
+    def _stories_exported(self, task_id):
+        return self._exported_tasks.get(task_id, (None, False))[1]
+
+    def record_stories_exported(self, task):
+        """Record that the task's stories have been written."""
+        if self._tracks_progress():
+            self._workspace.record_exported_stories(self._project_id, task.get("id"))
+
+    def complete_export(self):
+        """Record that the project's export finished, stories included."""
+        if self._tracks_progress() and not self._interrupted:
+            self._workspace.complete_export(self._project_id, self._pages_done)
+
+    def check_deadline(self):
+        """Returns True, and marks the export interrupted, once the deadline
+        has passed."""
+        if self._deadline is not None and time.time() >= self._deadline:
+            self._interrupted = True
+        return self._interrupted
+
+    def _modified_since(self):
+        """In incremental mode, the watermark recorded by the last export."""
+        if not self._incremental:
+            return None
+        return self._workspace.get_sync_watermark(self._project_id)
+
+    def _update_watermark(self):
+        """Record the newest modified_at written so the next incremental run
+        only fetches tasks changed since."""
+        if not self._incremental:
+            return
+        modified_ats = [modified_at for modified_at in
+                        (self._newest_modified_at, self._modified_since())
+                        if modified_at]
+        if modified_ats:
+            self._workspace.set_sync_watermark(self._project_id, max(modified_ats))
+
+    def _api_concurrency(self):
+        return vars(self._config).get("api_concurrency", 1)
+
+    def _page_size(self):
+        return vars(self._config).get("page_size", None) or DEFAULT_PAGE_SIZE
 
     def table_name(self):
-        return util.sql_safe_name(self._table_name if self._table_name else self.project_name())
+        if self._safe_table_name is None:
+            self._safe_table_name = util.sql_safe_name(
+                    self._table_name if self._table_name else self.project_name())
+        return self._safe_table_name
+
+    def _statement(self, template):
+        """The SQL of a statement on the tasks table, built once per
+        template.  Reusing the same string lets the database driver reuse
+        its prepared statement."""
+        sql = self._statements.get(template)
+        if sql is None:
+            sql = template.format(
+                    table_name=self.table_name(),
+                    columns=",".join(field.sql_name for field in self._direct_fields),
+                    values=",".join("?" for field in self._direct_fields),
+                    id_column=self._id_field().sql_name)
+            self._statements[template] = sql
+        return sql
 
     def project_name(self):
         return self._project_data()["name"]
@@ -106,49 +325,199 @@ class Project(object):
         self._db_client.write(sql)
 
     def export(self):
-        for task in self._tasks():
-            self.insert_or_replace(task)
+        self._load_progress()
+        self._write_task_pages()
+        # A resumed export didn't see every task it wrote, so it can't tell
+        # the newest modified_at.
+        if not self._interrupted and not self._exported_tasks:
+            self._update_watermark()
+
+    def _write_task_pages(self):
+        """Stream the project's tasks from Asana into the database a page at
+        a time, keeping only a summary of each task written.
+
+        With a pipeline_depth, pages are fetched on a background thread up to
+        pipeline_depth pages ahead of the writes.  The database is only used
+        from this thread: the watermark the fetch starts from is read before
+        the fetch does.
+
+        When tracking progress, the tasks of each page are recorded once
+        written, and the export stops after the page during which the
+        deadline passes.
+        """
+        self._task_summaries = [
+                {"id": task_id, "name": name}
+                for task_id, (name, _) in self._exported_tasks.items()]
+        pages = util.pipelined(self._task_pages(self._modified_since()),
+                               self._pipeline_depth,
+                               self._fetch_times, self._write_times)
+        for page_number, page in enumerate(pages, 1):
+            new_tasks = [task for task in page
+                         if not self._task_already_written(task)]
+            page_task_ids = [task.get("id") for task in new_tasks]
+
+            # Load the existing join-table rows for the whole page up front
+            # so the indirect fields don't issue one read per task.
+            if self._indirect_fields:
+                self._workspace.prefetch_task_relations(page_task_ids)
+            self._workspace.prefetch_task_references(new_tasks)
+            if self._skip_unchanged_rows:
+                self._stored_fingerprints = self._workspace.get_row_fingerprints(
+                        self.table_name(), page_task_ids)
+
+            for task in page:
+                if task.get("id") in self._exported_tasks:
+                    self._num_tasks_resumed += 1
+                    continue
+
+                self._task_summaries.append(
+                        {"id": task.get("id"), "name": task.get("name")})
+
+                modified_at = task.get("modified_at")
+                if modified_at and (self._newest_modified_at is None or
+                                    modified_at > self._newest_modified_at):
+                    self._newest_modified_at = modified_at
+
+                if self._dedupes_tasks() and not self._workspace.claim_task(task.get("id")):
+                    self._num_tasks_deduplicated += 1
+                    continue
+
+                self.insert_or_replace(task)
+                self._db_client.checkpoint()
+
+            self._workspace.clear_prefetched()
+            self._stored_fingerprints = {}
+
+            if self._tracks_progress():
+                # A resumed export lists the project from its first page
+                # again, so only pages past those already done add to it.
+                self._pages_done = max(self._pages_done, page_number)
+                self._workspace.record_exported_page(
+                        self._project_id, self._pages_done,
+                        [task for task in page
+                         if task.get("id") not in self._exported_tasks])
+                self._db_client.checkpoint()
+                if self.check_deadline():
+                    break
 
     def insert_or_replace(self, task):
-        columns = ",".join(field.sql_name for field in self._direct_fields)
-        values = ",".join("?" for field in self._direct_fields)
         params = [field.get_data_from_object(task) for field in self._direct_fields]
-        self._db_client.write(
-                INSERT_OR_REPLACE_TEMPLATE.format(
-                    table_name=self.table_name(),
-                    columns=columns,
-                    values=values),
-                *params)
+        task_id = params[0]
+        fingerprint = self._fingerprint(params)
+
+        if (self._skip_unchanged_rows and
+                self._stored_fingerprints.get(task_id) == fingerprint):
+            self._num_rows_skipped += 1
+        else:
+            self._db_client.write(
+                    self._statement(INSERT_OR_REPLACE_TEMPLATE), *params)
+            self._num_rows_written += 1
+
+            # The fingerprint is kept up to date on every write, so a later
+            # run with skip_unchanged_rows never trusts a stale one.
+            self._workspace.set_row_fingerprint(self.table_name(), task_id, fingerprint)
+            self._stored_fingerprints[task_id] = fingerprint
 
         for field in self._indirect_fields:
             field.get_data_from_object(task)
 
+    def _fingerprint(self, params):
+        """A hash of the row's direct field values, used to detect rows that
+        haven't changed since they were last written."""
+        columns = [field.sql_name for field in self._direct_fields]
+        return hashlib.sha1(
+                repr(list(zip(columns, params))).encode("utf-8")).hexdigest()
+
     def delete(self, task_id):
-        id_field = self._id_field()
-        self._db_client.write(
-                DELETE_TEMPLATE.format(
-                    table_name=self.table_name(),
-                    id_column=id_field.sql_name),
-                task_id)
+        self._db_client.write(self._statement(DELETE_TEMPLATE), task_id)
+        self._workspace.remove_row_fingerprint(self.table_name(), task_id)
 
     def synchronize(self):
         db_task_ids = self.db_task_ids()
-        asana_task_ids = self.asana_task_ids()
 
-        ids_to_remove = db_task_ids.difference(asana_task_ids)
+        self._write_task_pages()
 
-        for task in self._tasks():
-            self.insert_or_replace(task)
+        if self._incremental:
+            asana_task_ids = self._live_task_ids(db_task_ids)
+        else:
+            asana_task_ids = self.asana_task_ids()
+
+        ids_to_remove = db_task_ids.difference(asana_task_ids)
 
         for id_to_remove in ids_to_remove:
             self.delete(id_to_remove)
+            self._db_client.checkpoint()
+
+        self._update_watermark()
+
+    def refresh_tasks(self, task_ids):
+        """Refetch the given tasks from Asana and bring their rows up to date,
+        deleting the ones that no longer exist or have left the project.
+
+        Returns the tasks that are still in the project.
+        """
+        required_fields = self._required_fields() | {"id", "parent", "projects.id"}
+        refreshed = []
+        for task_id in task_ids:
+            try:
+                task = self._asana_client.tasks.find_by_id(
+                        task_id, fields=",".join(required_fields))
+            except asana.error.NotFoundError:
+                task = None
+
+            if task is not None and self._in_project(task):
+                self.insert_or_replace(task)
+                refreshed.append(task)
+            else:
+                self.delete(task_id)
+            self._db_client.checkpoint()
+        return refreshed
+
+    def _in_project(self, task):
+        if self._config.with_subtasks and task.get("parent"):
+            return True
+        return any(project.get("id") == self._project_id
+                   for project in task.get("projects") or [])
 
     def asana_task_ids(self):
-        return set(task.get("id") for task in self._tasks())
+        return set(task.get("id") for task in self.tasks())
+
+    def _live_task_ids(self, db_task_ids):
+        """The ids of every task still in the project, found with a cheap
+        id-only listing rather than the full incremental fetch.
+
+        Subtasks are not listed by project, so with_subtasks keeps the stored
+        subtasks whose parent is still live.
+        """
+        live_ids = set(task["id"] for task in
+                self._asana_client.tasks.find_by_project(
+                    self._project_id, fields="id", page_size=self._page_size()))
+        live_ids.update(self.asana_task_ids())
+
+        if self._config.with_subtasks:
+            parent_field = self._parent_field()
+            if parent_field is None:
+                # Without parents we can't tell subtasks apart; keep them all.
+                live_ids.update(db_task_ids)
+            else:
+                live_ids.update(task_id for task_id, parent_id in self._db_task_parents(parent_field)
+                                if parent_id in live_ids)
+
+        return live_ids
 
     def _id_field(self):
         return self._direct_fields[0]  # TODO: make the id field special.
 
+    def _parent_field(self):
+        return next((field for field in self._direct_fields
+                     if field.sql_name == "parent_id"), None)
+
+    def _db_task_parents(self, parent_field):
+        return [(row[0], row[1]) for row in self._db_client.read(
+                SELECT_TEMPLATE.format(
+                    table_name=self.table_name(),
+                    columns="{},{}".format(self._id_field().sql_name, parent_field.sql_name)))]
+
     def db_task_ids(self):
         id_field = self._id_field()
         return set(row[0] for row in self._db_client.read(
@@ -17,9 +17,28 @@ SELECT_TEMPLATE = (
 SELECT_WHERE_TEMPLATE = (
         """SELECT {columns} FROM "{stories_table_name}" WHERE {where};""")
 
+SELECT_FOR_TARGET_TEMPLATE = (
+        """SELECT {id_column} FROM "{stories_table_name}" WHERE target_id = ?;""")
+
 DELETE_TEMPLATE = (
         """DELETE FROM "{stories_table_name}" WHERE {id_column} = ?;""")
 
+CREATE_INDEX_TEMPLATE = (
+        """CREATE INDEX IF NOT EXISTS "{index_name}" ON "{stories_table_name}" ({column});""")
+
+MERGE_TABLE_TEMPLATE = (
+        """INSERT OR REPLACE INTO "{stories_table_name}" ({columns}) SELECT {columns} FROM "{source_table_name}";""")
+
+DROP_TABLE_TEMPLATE = (
+        """DROP TABLE "{table_name}";""")
+
+# Columns indexed in a stories table shared by every task, for the per-task
+# lookups of synchronize and sql2asana and for time range queries.
+INDEXED_COLUMNS = ("target_id", "created_at")
+
+# Asana returns at most 100 items per page.
+DEFAULT_PAGE_SIZE = 100
+
 class NoSuchStoryException(Exception):
     def __init__(self, story_id):
         super(NoSuchStoryException, self).__init__(
@@ -28,6 +47,10 @@ class NoSuchStoryException(Exception):
 class Story(object):
     """Represents a story on Asana.  The class executes commands to bring the
     database into sync with the story data.
+
+    Stories are stored in one table per task, named after the task, unless a
+    stories_table_name is configured, in which case every task's stories
+    share that table and are told apart by their target_id.
     """
 
     def __init__(self, asana_client, db_client, task, config, fields):
@@ -41,6 +64,8 @@ class Story(object):
         self._stories_table_name = self._config.stories_table_name
 
         self._story_cache = None
+        self._safe_table_name = None
+        self._statements = {}
 
         for field in fields:
             self._add_field(field)
@@ -48,20 +73,52 @@ class Story(object):
     def _stories(self):
         """Fetch all the task's story data from Asana and cache it."""
         if self._story_cache is None:
-            self._story_cache = list(
-                    self._asana_client.stories.find_by_task(
-                        self._task.get("id"), fields=",".join(self._required_fields())))
-            if len(self._story_cache) >= 50:
-                print("Warning: large unpaginated request may be truncated (fetched {} stories).".format(len(self._story_cache)))
+            self._story_cache = list(self._iter_stories())
 
         return self._story_cache
 
+    def _iter_stories(self):
+        """Iterate over the task's stories, from the cache if they were
+        already fetched, and otherwise streamed from Asana page by page."""
+        if self._story_cache is not None:
+            return iter(self._story_cache)
+        return self._asana_client.stories.find_by_task(
+                self._task.get("id"), fields=",".join(self._required_fields()),
+                page_size=self._page_size())
+
+    def _page_size(self):
+        return vars(self._config).get("page_size", None) or DEFAULT_PAGE_SIZE
+
+    def prefetch(self):
+        """Fetch the task's stories from Asana ahead of writing them.
+
+        Safe to call from a worker thread, as it does not touch the database.
+        """
+        self._stories()
+        return self
+
     def _required_fields(self):
         return set(field_names for field in self._direct_fields + self._indirect_fields
                                for field_names in field.required_fields())
 
     def stories_table_name(self):
-        return util.sql_safe_name(self._stories_table_name if self._stories_table_name else self._task.get("name"))
+        if self._safe_table_name is None:
+            self._safe_table_name = util.sql_safe_name(
+                    self._stories_table_name if self._stories_table_name else self._task.get("name"))
+        return self._safe_table_name
+
+    def _statement(self, template):
+        """The SQL of a statement on the stories table, built once per
+        template."""
+        sql = self._statements.get(template)
+        if sql is None:
+            sql = template.format(
+                    stories_table_name=self.stories_table_name(),
+                    columns=",".join(field.sql_name for field in self._direct_fields),
+                    values=",".join("?" for field in self._direct_fields),
+                    id_column=self._id_field().sql_name)
+            self._statements[template] = sql
+        return sql
 
     def _add_field(self, field):
         if field.sql_name:
@@ -69,6 +126,9 @@ class Story(object):
         else:
             self._indirect_fields.append(field)
 
+    def _shares_table(self):
+        return bool(self._stories_table_name)
+
     def create_table(self):
         sql = CREATE_TABLE_TEMPLATE.format(
                 stories_table_name=self.stories_table_name(),
@@ -76,40 +136,52 @@ class Story(object):
                         field.field_definition_sql() for field in self._direct_fields]))
         self._db_client.write(sql)
 
+        if self._shares_table():
+            self.create_indexes()
+
+    def create_indexes(self):
+        columns = [field.sql_name for field in self._direct_fields]
+        for column in INDEXED_COLUMNS:
+            if column in columns:
+                self._db_client.write(CREATE_INDEX_TEMPLATE.format(
+                        index_name=util.index_name(self.stories_table_name(), column),
+                        stories_table_name=self.stories_table_name(),
+                        column=column))
+
+    def merge_table(self, source_table_name):
+        """Move the stories in another stories table, e.g. a per-task one,
+        into this one with a single statement, and drop it."""
+        columns = ",".join(field.sql_name for field in self._direct_fields)
+        self._db_client.write(MERGE_TABLE_TEMPLATE.format(
+                stories_table_name=self.stories_table_name(),
+                columns=columns,
+                source_table_name=source_table_name))
+        self._db_client.write(DROP_TABLE_TEMPLATE.format(
+                table_name=source_table_name))
+
     def export(self):
-        for story in self._stories():
+        for story in self._iter_stories():
             self.insert_or_replace(story)
 
     def insert_or_replace(self, story):
-        columns = ",".join(field.sql_name for field in self._direct_fields)
-        values = ",".join("?" for field in self._direct_fields)
         params = [field.get_data_from_object(story) for field in self._direct_fields]
-        self._db_client.write(
-                INSERT_OR_REPLACE_TEMPLATE.format(
-                    stories_table_name=self.stories_table_name(),
-                    columns=columns,
-                    values=values),
-                *params)
+        self._db_client.write(self._statement(INSERT_OR_REPLACE_TEMPLATE), *params)
 
         for field in self._indirect_fields:
             field.get_data_from_object(story)
 
     def delete(self, task_id):
-        id_field = self._id_field()
-        self._db_client.write(
-                DELETE_TEMPLATE.format(
-                    stories_table_name=self.stories_table_name(),
-                    id_column=id_field.sql_name),
-                task_id)
+        self._db_client.write(self._statement(DELETE_TEMPLATE), task_id)
 
     def synchronize(self):
         db_story_ids = self.db_story_ids()
-        asana_story_ids = self.asana_story_ids()
-
-        ids_to_remove = db_story_ids.difference(asana_story_ids)
+        asana_story_ids = set()
 
-        for story in self._stories():
+        for story in self._iter_stories():
             self.insert_or_replace(story)
+            asana_story_ids.add(story.get("id"))
+
+        ids_to_remove = db_story_ids.difference(asana_story_ids)
 
         for id_to_remove in ids_to_remove:
             self.delete(id_to_remove)
@@ -121,6 +193,12 @@ class Story(object):
         return self._direct_fields[0]  # TODO: make the id field special.
 
     def db_story_ids(self):
+        """The ids of the task's stories in the database."""
+        if self._shares_table():
+            return set(row[0] for row in self._db_client.read(
+                    self._statement(SELECT_FOR_TARGET_TEMPLATE),
+                    self._task.get("id")))
+
         id_field = self._id_field()
         return set(row[0] for row in self._db_client.read(
                 SELECT_TEMPLATE.format(
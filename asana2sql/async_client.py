@@ -0,0 +1,315 @@
+import asyncio
+import json
+import threading
+import time
+import urllib.parse
+
+import aiohttp
+import asana.client
+import asana.error
+
+from asana2sql import http_pool
+from asana2sql import latency
+
+DEFAULT_BASE_URL = "https://app.asana.com/api/1.0"
+DEFAULT_CONCURRENCY = 10
+
+# Retries for rate limits and server errors, as in asana.Client.
+MAX_RETRIES = 5
+RETRY_DELAY = 1.0
+RETRY_BACKOFF = 2.0
+
+
+class _Response(object):
+    """Enough of a requests.Response for the asana.error exceptions."""
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.status_code = status
+        self.headers = headers
+        self.content = body
+
+    def json(self):
+        return json.loads(self.content.decode("utf-8"))
+
+
+def _query_params(params):
+    """Convert asana Client style options into query parameters."""
+    query = {}
+    for key, value in params.items():
+        if value is None:
+            continue
+        if key == "fields":
+            key = "opt_fields"
+        elif key == "page_size":
+            key = "limit"
+        if isinstance(value, (list, tuple)):
+            value = ",".join(value)
+        elif isinstance(value, bool):
+            value = json.dumps(value)
+        query[key] = value
+    return query
+
+
+class AsyncAsanaClient(object):
+    """An asyncio client for the Asana API endpoints asana2sql reads from,
+    over an aiohttp session.
+
+    At most `concurrency` requests are in flight at once; the connections
+    they used are kept alive and reused, and counted in connection_stats.
+    The latency of each request is recorded in request_latency by endpoint.
+    Responses are requested compressed unless compression is False.  Rate
+    limited requests and server errors are retried like the asana Client
+    does, and other errors are raised as the same asana.error exceptions.
+
+    Collection endpoints return every item, fetching the pages in turn.
+    """
+
+    def __init__(self, access_token, base_url=DEFAULT_BASE_URL,
+                 concurrency=DEFAULT_CONCURRENCY, verify=True, dump_api=False,
+                 max_retries=MAX_RETRIES, compression=True,
+                 connection_stats=None, request_latency=None):
+        self._base_url = base_url.rstrip("/")
+        self._base_path = urllib.parse.urlsplit(base_url).path.rstrip("/")
+        self._access_token = access_token
+        self._concurrency = max(1, concurrency or 1)
+        self._verify = verify
+        self._dump_api = dump_api
+        self._max_retries = max_retries
+        self._compression = compression
+        self._connection_stats = connection_stats or http_pool.ConnectionStats()
+        self._request_latency = request_latency or latency.LatencyRecorder(
+                latency.path_template)
+
+        # Created on first use, so they belong to the loop making requests.
+        self._semaphore = None
+        self._session = None
+
+        self._num_requests = 0
+        self._num_throttled = 0
+
+    @property
+    def num_requests(self):
+        """Number of HTTP requests sent."""
+        return self._num_requests
+
+    @property
+    def num_throttled(self):
+        """Number of requests rejected with a 429."""
+        return self._num_throttled
+
+    @property
+    def connection_stats(self):
+        return self._connection_stats
+
+    @property
+    def request_latency(self):
+        return self._request_latency
+
+    # Endpoints
+    async def projects_by_workspace(self, workspace_id, **params):
+        return await self.get_collection(
+                "/workspaces/{}/projects".format(workspace_id), **params)
+
+    async def tasks_by_project(self, project_id, **params):
+        return await self.get_collection(
+                "/projects/{}/tasks".format(project_id), **params)
+
+    async def subtasks(self, task_id, **params):
+        return await self.get_collection(
+                "/tasks/{}/subtasks".format(task_id), **params)
+
+    async def stories_by_task(self, task_id, **params):
+        return await self.get_collection(
+                "/tasks/{}/stories".format(task_id), **params)
+
+    async def custom_field(self, custom_field_id, **params):
+        return await self.get("/custom_fields/{}".format(custom_field_id), **params)
+
+    # Requests
+    async def get(self, path, **params):
+        """Returns the data of a single object."""
+        return (await self.request("GET", path, _query_params(params)))["data"]
+
+    async def get_collection(self, path, **params):
+        """Returns all the items of a collection."""
+        items = []
+        offset = None
+        while True:
+            page, offset = await self.get_page(path, offset, **params)
+            items.extend(page)
+            if not offset:
+                return items
+
+    async def get_page(self, path, offset=None, **params):
+        """Returns one page of a collection and the offset of the next one,
+        or None if it is the last."""
+        query = _query_params(params)
+        if offset:
+            query["offset"] = offset
+        payload = await self.request("GET", path, query)
+        next_page = payload.get("next_page")
+        return payload["data"], next_page and next_page.get("offset")
+
+    async def request(self, method, path, query=None):
+        """Send a request and return its full JSON payload."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+
+        retry_count = 0
+        while True:
+            async with self._semaphore:
+                start = time.perf_counter()
+                response = await self._send(method, path, query or {})
+                self._request_latency.record(
+                        "{} {}".format(method.upper(), path),
+                        time.perf_counter() - start)
+
+            if response.status in asana.client.STATUS_MAP:
+                error = asana.client.STATUS_MAP[response.status](response)
+            elif 500 <= response.status < 600:
+                error = asana.error.ServerError(response)
+            else:
+                return response.json()
+
+            throttled = isinstance(error, asana.error.RateLimitEnforcedError)
+            if throttled:
+                self._num_throttled += 1
+            if (not isinstance(error, asana.error.RetryableAsanaError) or
+                    retry_count >= self._max_retries):
+                raise error
+
+            if throttled:
+                await asyncio.sleep(error.retry_after)
+            else:
+                await asyncio.sleep(RETRY_DELAY * (RETRY_BACKOFF ** retry_count))
+            retry_count += 1
+
+    async def _send(self, method, path, query):
+        if self._dump_api:
+            target = self._base_path + path
+            if query:
+                target += "?" + urllib.parse.urlencode(query)
+            print("{}: {}".format(method.lower(), target))
+        self._num_requests += 1
+
+        async with self._session_or_new().request(
+                method, self._base_url + path, params=query) as response:
+            body = await response.read()
+
+        self._connection_stats.response_received(
+                bool(response.headers.get("Content-Encoding")))
+        return _Response(response.status, response.headers, body)
+
+    def _session_or_new(self):
+        """The aiohttp session, which keeps up to `concurrency` connections
+        alive and decompresses the responses."""
+        if self._session is None:
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_create_end.append(self._connection_opened)
+            self._session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(
+                        limit=self._concurrency,
+                        ssl=None if self._verify else False),
+                    headers={
+                        "Authorization": "Bearer {}".format(self._access_token),
+                        "Accept": "application/json",
+                        "Accept-Encoding": (http_pool.COMPRESSED_ENCODINGS
+                                            if self._compression else "identity"),
+                    },
+                    trace_configs=[trace_config])
+        return self._session
+
+    async def _connection_opened(self, session, context, params):
+        self._connection_stats.connection_opened()
+
+    async def close(self):
+        """Close the connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class _Endpoint(object):
+    """The methods of one asana Client resource (e.g. client.tasks) that the
+    async engine implements.  The others fall through to the asana Client."""
+
+    def __init__(self, fallback, **methods):
+        self._fallback = fallback
+        self.__dict__.update(methods)
+
+    def __getattr__(self, name):
+        return getattr(self._fallback, name)
+
+
+class BlockingAsyncClient(object):
+    """Exposes an AsyncAsanaClient with the blocking interface of the asana
+    Client, so Project and Story can use it unchanged.
+
+    The engine runs on an event loop in a background thread.  Calls from any
+    number of threads share its connections and concurrency limit.
+    Collections are streamed a page at a time.  Anything the engine doesn't
+    implement, e.g. writes and events, goes to fallback_client.
+    """
+
+    def __init__(self, engine, fallback_client):
+        self._engine = engine
+        self._fallback = fallback_client
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+        self.projects = _Endpoint(
+                fallback_client.projects,
+                find_by_workspace=lambda workspace_id, **params: self._iterate(
+                    "/workspaces/{}/projects".format(workspace_id), params))
+        self.tasks = _Endpoint(
+                fallback_client.tasks,
+                find_by_project=lambda project_id, **params: self._iterate(
+                    "/projects/{}/tasks".format(project_id), params),
+                subtasks=lambda task_id, **params: self._iterate(
+                    "/tasks/{}/subtasks".format(task_id), params))
+        self.stories = _Endpoint(
+                fallback_client.stories,
+                find_by_task=lambda task_id, **params: self._iterate(
+                    "/tasks/{}/stories".format(task_id), params))
+        self.custom_fields = _Endpoint(
+                fallback_client.custom_fields,
+                find_by_id=lambda custom_field_id, **params: self.run(
+                    self._engine.custom_field(custom_field_id, **params)))
+
+    @property
+    def engine(self):
+        return self._engine
+
+    @property
+    def num_requests(self):
+        return self._engine.num_requests + self._fallback.num_requests
+
+    def __getattr__(self, name):
+        return getattr(self._fallback, name)
+
+    def run(self, coroutine):
+        """Run a coroutine on the engine's loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def get(self, path, query, **options):
+        return self.run(self._engine.get(path, **options))
+
+    def _iterate(self, path, params):
+        offset = None
+        while True:
+            page, offset = self.run(self._engine.get_page(path, offset, **params))
+            for item in page:
+                yield item
+            if not offset:
+                return
+
+    def close(self):
+        """Close the engine's connections and stop its loop, and close the
+        fallback client."""
+        self.run(self._engine.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._fallback.close()
@@ -0,0 +1,117 @@
+import asana.error
+import asyncio
+import unittest
+import mock
+
+from asana2sql.async_client import AsyncAsanaClient, BlockingAsyncClient
+from asana2sql import test_fixtures as fixtures
+
+TASKS = [fixtures.task(id=i) for i in range(5)]
+
+
+class AsyncAsanaClientTestCase(unittest.TestCase):
+    def run_with_server(self, server, test_fn, **client_options):
+        async def run():
+            await server.start()
+            client = AsyncAsanaClient("token", base_url=server.base_url,
+                                      **client_options)
+            try:
+                return await test_fn(client)
+            finally:
+                await client.close()
+                await server.stop()
+        return asyncio.run(run())
+
+    def test_tasks_by_project_pages(self):
+        server = fixtures.FakeAsanaServer(collections={"/projects/1/tasks": TASKS})
+
+        async def test(client):
+            tasks = await client.tasks_by_project(1, fields="id,name", page_size=2)
+            self.assertEqual(tasks, TASKS)
+            self.assertEqual(client.num_requests, 3)
+            self.assertEqual(client.connection_stats.num_connections, 1)
+            self.assertEqual(client.connection_stats.num_reused, 2)
+
+        self.run_with_server(server, test)
+
+        self.assertEqual(server.requests, [
+            ("/projects/1/tasks", {"opt_fields": "id,name", "limit": "2"}),
+            ("/projects/1/tasks", {"opt_fields": "id,name", "limit": "2", "offset": "2"}),
+            ("/projects/1/tasks", {"opt_fields": "id,name", "limit": "2", "offset": "4"}),
+            ])
+        self.assertEqual(server.num_connections, 1)
+
+    def test_concurrency_limit(self):
+        server = fixtures.FakeAsanaServer(
+                collections={"/tasks/{}/subtasks".format(i): [] for i in range(10)},
+                delay=0.01)
+
+        async def test(client):
+            await asyncio.gather(*[client.subtasks(i) for i in range(10)])
+
+        self.run_with_server(server, test, concurrency=3)
+
+        self.assertEqual(len(server.requests), 10)
+        self.assertEqual(server.max_in_flight, 3)
+        self.assertLessEqual(server.num_connections, 3)
+
+    def test_retries_rate_limited_requests(self):
+        server = fixtures.FakeAsanaServer(
+                objects={"/custom_fields/1": {"id": 1, "name": "Priority"}})
+        server.throttle = 2
+
+        async def test(client):
+            self.assertEqual(await client.custom_field(1),
+                             {"id": 1, "name": "Priority"})
+            self.assertEqual(client.num_throttled, 2)
+
+        self.run_with_server(server, test)
+
+        self.assertEqual(len(server.requests), 3)
+
+    def test_raises_asana_errors(self):
+        server = fixtures.FakeAsanaServer()
+
+        async def test(client):
+            with self.assertRaises(asana.error.NotFoundError):
+                await client.stories_by_task(1)
+
+        self.run_with_server(server, test)
+
+
+class BlockingAsyncClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = fixtures.FakeAsanaServer(collections={
+            "/projects/1/tasks": TASKS,
+            "/tasks/1/stories": [{"id": 10}],
+            })
+        self.fallback = mock.Mock()
+        self.fallback.num_requests = 4
+
+    def test_blocking_endpoints(self):
+        self.server.start_in_thread()
+        client = BlockingAsyncClient(
+                AsyncAsanaClient("token", base_url=self.server.base_url),
+                self.fallback)
+        try:
+            tasks = client.tasks.find_by_project(1, fields="id", page_size=2)
+            self.assertEqual(next(tasks), TASKS[0])
+            # Collections are streamed a page at a time.
+            self.assertEqual(len(self.server.requests), 1)
+            self.assertEqual(list(tasks), TASKS[1:])
+
+            self.assertEqual(list(client.stories.find_by_task(1)), [{"id": 10}])
+            self.assertEqual(client.num_requests, 4 + 4)
+
+            # Other endpoints go to the asana Client.
+            client.tasks.find_by_id(1)
+            self.fallback.tasks.find_by_id.assert_called_once_with(1)
+        finally:
+            client.close()
+            self.server.stop_thread()
+
+        self.fallback.close.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
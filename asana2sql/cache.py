@@ -1,54 +1,166 @@
+import collections
+import operator
+
+# Cached in bounded mode for keys the backing store doesn't have.
+_ABSENT = object()
+
+
 class Cache(object):
     """A cache with a backing store.
 
+    By default the whole backing store is loaded with seed_fn on first use and
+    kept in memory.  Given a lookup_fn and a max_size, the cache is bounded
+    instead: rows are loaded on demand with lookup_fn(keys), which returns the
+    rows for those keys, and only the max_size most recently used keys are
+    kept.
+
+    Values are cached as compact records of the given columns, or of the
+    backing store's columns if none are given, so comparing a new value with
+    the cached one only compares those columns.
     """
 
-    def __init__(self, seed_fn, insert_fn, key_name="id"):
+    def __init__(self, seed_fn, insert_fn, key_name="id", lookup_fn=None,
+                 max_size=None, columns=None):
         self._seed_fn = seed_fn
         self._insert_fn = insert_fn
         self._key_name = key_name
 
-        self._cache = None
+        # The record type and how to build one from a database row, resolved
+        # from the first row or value seen.
+        self._columns = tuple(columns) if columns else None
+        self._record_type = None
+        self._key_index = None
+        self._row_getter = None
+        self._lookup_fn = lookup_fn
+        self._max_size = max_size if lookup_fn else None
+
+        self._cache = collections.OrderedDict() if self._max_size else None
         self._touched = set()
 
-    @staticmethod
-    def _row_to_dict(row):
-        """Converts a PyODBC row into a dictionary."""
-        # (name, type_code, display_size, internal_size, precision, scale,
-        # null_ok)
-        return {name: getattr(row, name)
-                for (name, _, _, _, _, _, _) in row.cursor_description}
+        self._num_hits = 0
+        self._num_misses = 0
+        self._num_evictions = 0
+
+    @property
+    def num_hits(self):
+        """Number of lookups answered from memory."""
+        return self._num_hits
+
+    @property
+    def num_misses(self):
+        """Number of lookups of keys that weren't in memory."""
+        return self._num_misses
+
+    @property
+    def num_evictions(self):
+        """Number of keys evicted to stay within max_size."""
+        return self._num_evictions
+
+    def _resolve_layout(self, columns):
+        if self._columns is None:
+            self._columns = tuple(columns)
+        self._record_type = collections.namedtuple(
+                "Record", self._columns, rename=True)
+        self._key_index = self._columns.index(self._key_name)
+
+    def _row_to_record(self, row):
+        """Converts a PyODBC row into a record."""
+        if self._row_getter is None:
+            # (name, type_code, display_size, internal_size, precision, scale,
+            # null_ok)
+            row_columns = [name for (name, _, _, _, _, _, _) in row.cursor_description]
+            if self._record_type is None:
+                self._resolve_layout(row_columns)
+            indices = [row_columns.index(column) if column in row_columns else None
+                       for column in self._columns]
+            if None in indices:
+                # Columns the table doesn't have read as None.
+                self._row_getter = lambda row: tuple(
+                        None if index is None else row[index] for index in indices)
+            elif len(indices) == 1:
+                index = indices[0]
+                self._row_getter = lambda row: (row[index],)
+            else:
+                self._row_getter = operator.itemgetter(*indices)
+        return self._record_type._make(self._row_getter(row))
+
+    def _value_to_record(self, value):
+        if self._record_type is None:
+            self._resolve_layout(value.keys())
+        return self._record_type._make(
+                value.get(column) for column in self._columns)
 
     def _prime_cache(self):
         self._cache = {}
         for row in self._seed_fn():
-            dict_row = self._row_to_dict(row)
-            self._cache[dict_row[self._key_name]] = dict_row
+            record = self._row_to_record(row)
+            self._cache[record[self._key_index]] = record
 
-    def _insert_and_cache(self, key, value):
+    def _insert_and_cache(self, key, value, record):
         self._insert_fn(value)
-        self._cache[key] = value
+        self._store(key, record)
 
     def _touch(self, key):
         self._touched.add(key)
 
-    def get(self, key):
+    def _store(self, key, value):
+        self._cache[key] = value
+        if self._max_size:
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+                self._num_evictions += 1
+
+    def _load(self, keys):
+        """Look up keys in the backing store and cache the results, including
+        which keys it doesn't have."""
+        found = {}
+        for row in self._lookup_fn(keys):
+            record = self._row_to_record(row)
+            found[record[self._key_index]] = record
+        for key in keys:
+            self._store(key, found.get(key, _ABSENT))
+
+    def _lookup(self, key):
         if self._cache is None:
             self._prime_cache()
 
-        self._touch(key)
+        if key in self._cache:
+            self._num_hits += 1
+            if self._max_size:
+                self._cache.move_to_end(key)
+        else:
+            self._num_misses += 1
+            if self._max_size:
+                self._load([key])
 
-        return self._cache.get(key)
+        value = self._cache.get(key)
+        return None if value is _ABSENT else value
 
-    def add(self, new_value):
+    def prefetch(self, keys):
+        """Load the given keys with a single lookup_fn call, in bounded mode.
+        Otherwise this just loads the whole backing store if needed."""
         if self._cache is None:
             self._prime_cache()
+        if not self._max_size:
+            return
 
-        key = new_value[self._key_name]
-        old_value = self._cache.get(key)
+        missing = [key for key in collections.OrderedDict.fromkeys(keys)
+                   if key not in self._cache]
+        if missing:
+            self._load(missing)
 
+    def get(self, key):
         self._touch(key)
 
-        if old_value != new_value:
-            self._insert_and_cache(key, new_value)
+        return self._lookup(key)
+
+    def add(self, new_value):
+        key = new_value[self._key_name]
+        old_record = self._lookup(key)
+
+        self._touch(key)
 
+        new_record = self._value_to_record(new_value)
+        if old_record != new_record:
+            self._insert_and_cache(key, new_value, new_record)
@@ -18,7 +18,7 @@ class CacheTestCase(unittest.TestCase):
 
         self.cache.add({"id": 3})
 
-        self.assertEqual(self.cache.get(3), {"id": 3})
+        self.assertEqual(self.cache.get(3)._asdict(), {"id": 3})
 
         self.seed_fn.assert_called_once()
         self.insert_fn.assert_called_once_with({"id": 3})
@@ -28,27 +28,104 @@ class CacheTestCase(unittest.TestCase):
 
         self.assertIsNone(self.cache.get(3))
 
-        self.assertEqual(self.cache.get(1), {"id": 1})
-        self.assertEqual(self.cache.get(2), {"id": 2})
-        self.assertEqual(self.cache.get(1), {"id": 1})
-        self.assertEqual(self.cache.get(2), {"id": 2})
+        self.assertEqual(self.cache.get(1)._asdict(), {"id": 1})
+        self.assertEqual(self.cache.get(2)._asdict(), {"id": 2})
+        self.assertEqual(self.cache.get(1)._asdict(), {"id": 1})
+        self.assertEqual(self.cache.get(2)._asdict(), {"id": 2})
 
         self.seed_fn.assert_called_once()
         self.insert_fn.assert_not_called()
 
+    def test_compares_cached_columns(self):
+        self.seed_fn.return_value = [row(id=1, name="one")]
+
+        self.cache.add({"id": 1, "name": "one", "resource_type": "user"})
+        self.insert_fn.assert_not_called()
+
+        self.cache.add({"id": 1, "name": "uno"})
+        self.insert_fn.assert_called_once_with({"id": 1, "name": "uno"})
+        self.assertEqual(self.cache.get(1), (1, "uno"))
+
+    def test_column_layout(self):
+        self.seed_fn.return_value = [row(name="one", archived=False, id=1)]
+        self.cache = Cache(self.seed_fn, self.insert_fn,
+                           columns=["id", "name", "archived"])
+
+        self.assertEqual(self.cache.get(1), (1, "one", False))
+        self.assertEqual(self.cache.get(1).name, "one")
+
+        self.cache.add({"id": 2, "name": "two", "archived": True})
+        self.assertEqual(self.cache.get(2), (2, "two", True))
+
     def test_custom_key(self):
         self.seed_fn.return_value = [row(foo=1), row(foo=2)]
         self.cache = Cache(self.seed_fn, self.insert_fn, key_name="foo")
 
-        self.assertEqual(self.cache.get(1), {"foo": 1})
+        self.assertEqual(self.cache.get(1)._asdict(), {"foo": 1})
         self.assertIsNone(self.cache.get(3))
 
         self.cache.add({"foo": 3})
 
-        self.assertEqual(self.cache.get(3), {"foo": 3})
+        self.assertEqual(self.cache.get(3)._asdict(), {"foo": 3})
 
         self.seed_fn.assert_called_once()
         self.insert_fn.assert_called_once_with({"foo": 3})
 
+
+class BoundedCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.seed_fn = mock.Mock()
+        self.insert_fn = mock.Mock()
+        self.rows = {1: row(id=1, name="one"), 2: row(id=2, name="two"),
+                     3: row(id=3, name="three")}
+        self.lookup_fn = mock.Mock(side_effect=lambda keys: [
+            self.rows[key] for key in keys if key in self.rows])
+
+        self.cache = Cache(self.seed_fn, self.insert_fn,
+                           lookup_fn=self.lookup_fn, max_size=2)
+
+    def test_loads_on_demand(self):
+        self.assertEqual(self.cache.get(1)._asdict(), {"id": 1, "name": "one"})
+        self.assertEqual(self.cache.get(1)._asdict(), {"id": 1, "name": "one"})
+        self.assertIsNone(self.cache.get(4))
+        self.assertIsNone(self.cache.get(4))
+
+        self.seed_fn.assert_not_called()
+        self.assertEqual(self.lookup_fn.mock_calls,
+                         [mock.call([1]), mock.call([4])])
+        self.assertEqual(self.cache.num_hits, 2)
+        self.assertEqual(self.cache.num_misses, 2)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.get(1)
+        self.cache.get(2)
+        self.cache.get(1)
+        self.cache.get(3)
+
+        self.assertEqual(self.cache.num_evictions, 1)
+
+        self.lookup_fn.reset_mock()
+        self.cache.get(1)
+        self.cache.get(3)
+        self.lookup_fn.assert_not_called()
+
+        self.cache.get(2)
+        self.lookup_fn.assert_called_once_with([2])
+
+    def test_prefetch(self):
+        self.cache.prefetch([1, 2, 1])
+        self.cache.prefetch([2])
+
+        self.lookup_fn.assert_called_once_with([1, 2])
+        self.assertEqual(self.cache.get(2)._asdict(), {"id": 2, "name": "two"})
+        self.assertEqual(self.cache.num_misses, 0)
+
+    def test_add(self):
+        self.cache.add({"id": 1, "name": "one"})
+        self.cache.add({"id": 4, "name": "four"})
+
+        self.insert_fn.assert_called_once_with({"id": 4, "name": "four"})
+        self.assertEqual(self.cache.get(4)._asdict(), {"id": 4, "name": "four"})
+
 if __name__ == '__main__':
     unittest.main()
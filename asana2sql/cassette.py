@@ -0,0 +1,174 @@
+import collections
+import copy
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+
+import asana.client
+import asana.error
+
+CASSETTE_GLOB = "cassette-*.jsonl.gz"
+
+
+class MissingRecordingError(Exception):
+    def __init__(self, method, path, params):
+        super(MissingRecordingError, self).__init__(
+                "No recorded response for {} {} {}".format(
+                    method.upper(), path, json.dumps(params, sort_keys=True)))
+
+
+def request_key(method, path, options):
+    """What identifies a request: its method, path, query and body, and
+    whether the full payload or just the data was asked for."""
+    return json.dumps([method.lower(), path, options.get("params"),
+                       options.get("data"), bool(options.get("full_payload"))],
+                      sort_keys=True, default=str)
+
+
+class RecordedResponse(object):
+    """The parts of an HTTP error response the asana.error classes read."""
+
+    def __init__(self, status, body, headers):
+        self.status_code = self.status = status
+        self.headers = headers
+        self._body = body
+
+    def json(self):
+        if self._body is None:
+            raise ValueError("The response had no JSON body")
+        return self._body
+
+
+def _error_entry(error):
+    response = error.response
+    try:
+        body = response.json()
+    except Exception:
+        body = None
+    headers = getattr(response, "headers", None) or {}
+    return {"status": error.status,
+            "body": body,
+            "headers": {name: headers[name] for name in ("Retry-After",)
+                        if name in headers}}
+
+
+def _replayed_error(entry):
+    """The asana.error exception Client.request raised for the response."""
+    status = entry["status"]
+    response = RecordedResponse(status, entry["body"], entry["headers"])
+    if status in asana.client.STATUS_MAP:
+        return asana.client.STATUS_MAP[status](response)
+    if status is not None and 500 <= status < 600:
+        return asana.error.ServerError(response)
+    return asana.error.AsanaError("Recorded error", status, response)
+
+
+class Cassette(object):
+    """API responses recorded to, or replayed from, a directory.
+
+    Each process records to its own file in the directory, as a gzip member
+    per response, so a cassette stays readable if the run is interrupted.
+
+    Replayed requests get the responses recorded for the same request in
+    the order they were recorded, and the last one once they run out.
+    Error responses are recorded too, and replayed by raising the
+    asana.error exception the request raised.
+    `latency` is the delay of each replayed response: None for none, a
+    number of seconds, or "recorded" for the time the request took when
+    recorded.
+    """
+
+    def __init__(self, directory, replay=False, latency=None):
+        self._directory = directory
+        self._replay = replay
+        self._latency = latency
+        self._lock = threading.Lock()
+        self._recordings = None
+        self._file = None
+
+        self._num_recorded = 0
+        self._num_replayed = 0
+
+    @property
+    def replaying(self):
+        return self._replay
+
+    @property
+    def num_recorded(self):
+        return self._num_recorded
+
+    @property
+    def num_replayed(self):
+        return self._num_replayed
+
+    def record(self, method, path, options, response, seconds):
+        self._write({"key": request_key(method, path, options),
+                     "response": response,
+                     "seconds": round(seconds, 4)})
+
+    def record_error(self, method, path, options, error, seconds):
+        """Record the error response that made the request raise error, an
+        asana.error.AsanaError."""
+        self._write({"key": request_key(method, path, options),
+                     "error": _error_entry(error),
+                     "seconds": round(seconds, 4)})
+
+    def _write(self, entry):
+        line = json.dumps(entry, separators=(",", ":"), default=str)
+        member = gzip.compress((line + "\n").encode("utf-8"))
+        with self._lock:
+            if self._file is None:
+                os.makedirs(self._directory, exist_ok=True)
+                self._file = open(os.path.join(
+                    self._directory, "cassette-{}.jsonl.gz".format(os.getpid())), "ab")
+            self._file.write(member)
+            self._file.flush()
+            self._num_recorded += 1
+
+    def replay(self, method, path, options):
+        """Returns the recorded response to the request, or raises the
+        recorded error."""
+        with self._lock:
+            if self._recordings is None:
+                self._recordings = self._load()
+            responses = self._recordings.get(request_key(method, path, options))
+            if not responses:
+                raise MissingRecordingError(method, path, options.get("params"))
+            entry = responses.popleft() if len(responses) > 1 else responses[0]
+            self._num_replayed += 1
+
+        delay = entry["seconds"] if self._latency == "recorded" else self._latency
+        if delay:
+            time.sleep(delay)
+        if "error" in entry:
+            raise _replayed_error(copy.deepcopy(entry["error"]))
+        return copy.deepcopy(entry["response"])
+
+    def _load(self):
+        recordings = collections.defaultdict(collections.deque)
+        for path in sorted(glob.glob(os.path.join(self._directory, CASSETTE_GLOB))):
+            with gzip.open(path, "rt", encoding="utf-8") as cassette_file:
+                try:
+                    for line in cassette_file:
+                        entry = json.loads(line)
+                        recordings[entry.pop("key")].append(entry)
+                except (EOFError, OSError, ValueError):
+                    # A response cut short by an interrupted recording.
+                    pass
+        return recordings
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def replay_latency(value):
+    """Parses --replay_latency: "recorded" or a number of seconds."""
+    if value == "recorded":
+        return value
+    return float(value)
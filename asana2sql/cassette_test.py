@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from asana2sql import cassette
+
+GET_TASKS = {"params": {"limit": 100, "opt_fields": "id"}, "full_payload": True}
+
+
+class CassetteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_replays_recorded_responses_in_order(self):
+        recorder = cassette.Cassette(self.directory)
+        recorder.record("get", "/projects/1/tasks", GET_TASKS, {"data": [1]}, 0.5)
+        recorder.record("get", "/projects/1/tasks", GET_TASKS, {"data": [2]}, 0.5)
+        recorder.record("get", "/projects/2", {"params": {}}, {"id": 2}, 0.5)
+        recorder.close()
+        self.assertEqual(recorder.num_recorded, 3)
+
+        player = cassette.Cassette(self.directory, replay=True)
+        self.assertEqual(player.replay("get", "/projects/1/tasks", GET_TASKS), {"data": [1]})
+        self.assertEqual(player.replay("get", "/projects/1/tasks", GET_TASKS), {"data": [2]})
+        # The last response is repeated once they run out.
+        self.assertEqual(player.replay("get", "/projects/1/tasks", GET_TASKS), {"data": [2]})
+        self.assertEqual(player.replay("get", "/projects/2", {"params": {}}), {"id": 2})
+        self.assertEqual(player.num_replayed, 4)
+
+    def test_missing_recording(self):
+        player = cassette.Cassette(self.directory, replay=True)
+
+        with self.assertRaises(cassette.MissingRecordingError):
+            player.replay("get", "/projects/1/tasks", GET_TASKS)
+
+    def test_request_options_distinguish_recordings(self):
+        recorder = cassette.Cassette(self.directory)
+        recorder.record("get", "/projects/1/tasks", GET_TASKS, {"data": [1]}, 0)
+        recorder.close()
+
+        player = cassette.Cassette(self.directory, replay=True)
+        with self.assertRaises(cassette.MissingRecordingError):
+            player.replay("get", "/projects/1/tasks",
+                          {"params": {"limit": 100, "opt_fields": "id,name"},
+                           "full_payload": True})
+
+    def test_interrupted_recording(self):
+        recorder = cassette.Cassette(self.directory)
+        recorder.record("get", "/projects/1", {}, {"id": 1}, 0)
+        recorder.record("get", "/projects/2", {}, {"id": 2}, 0)
+        recorder.close()
+
+        path = os.path.join(self.directory, os.listdir(self.directory)[0])
+        with open(path, "rb+") as cassette_file:
+            cassette_file.truncate(os.path.getsize(path) - 10)
+
+        player = cassette.Cassette(self.directory, replay=True)
+        self.assertEqual(player.replay("get", "/projects/1", {}), {"id": 1})
+        with self.assertRaises(cassette.MissingRecordingError):
+            player.replay("get", "/projects/2", {})
+
+    def test_replay_latency(self):
+        self.assertEqual(cassette.replay_latency("recorded"), "recorded")
+        self.assertEqual(cassette.replay_latency("0.25"), 0.25)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import threading
+import time
+
+import asana.error
+from asana import Client, session
+
+from asana2sql import cassette
+from asana2sql import http_pool
+from asana2sql import latency
+from asana2sql.scheduler import RequestScheduler
+
+
+def build_asana_client(args):
+    asana_session = session.AsanaOAuth2Session(
+            token={'access_token': args.access_token})
+    api_concurrency = vars(args).get("api_concurrency", 1)
+    connection_stats = http_pool.configure_session(
+            asana_session,
+            pool_size=(vars(args).get("http_pool_size") or
+                       max(http_pool.DEFAULT_POOL_SIZE, api_concurrency)),
+            keep_alive=vars(args).get("keep_alive", True),
+            compression=vars(args).get("compression", True))
+
+    request_latency = latency.LatencyRecorder(latency.path_template)
+
+    options = {
+        'session': asana_session,
+        'connection_stats': connection_stats,
+        'request_latency': request_latency}
+
+    if args.base_url:
+        options['base_url'] = args.base_url
+    if args.verify is not None:
+        # urllib3.disable_warnings()
+        options['verify'] = args.verify
+    if args.dump_api:
+        options['dump_api'] = args.dump_api
+
+    options['scheduler'] = RequestScheduler(
+            max_concurrency=api_concurrency,
+            requests_per_minute=vars(args).get("requests_per_minute"))
+
+    if vars(args).get("record"):
+        options['cassette'] = cassette.Cassette(args.record)
+    elif vars(args).get("replay"):
+        options['cassette'] = cassette.Cassette(
+                args.replay, replay=True,
+                latency=vars(args).get("replay_latency"))
+
+    client = RequestCountingClient(**options)
+
+    if vars(args).get("async_engine"):
+        # Reads go through the asyncio engine; everything else still uses
+        # the asana Client.  It needs aiohttp, which is only imported here.
+        from asana2sql.async_client import (
+                AsyncAsanaClient, BlockingAsyncClient, DEFAULT_BASE_URL)
+        engine = AsyncAsanaClient(
+                args.access_token,
+                base_url=args.base_url or DEFAULT_BASE_URL,
+                concurrency=api_concurrency,
+                verify=args.verify is not False,
+                dump_api=args.dump_api,
+                compression=vars(args).get("compression", True),
+                connection_stats=connection_stats,
+                request_latency=request_latency)
+        return BlockingAsyncClient(engine, client)
+
+    return client
+
+class RequestCountingClient(Client):
+    """An Asana client that counts the requests it makes.
+
+    Requests may be issued from several threads at once; the count is kept
+    under a lock.  Every request goes through a RequestScheduler, which
+    handles rate limiting and retries in place of the asana Client's own
+    fixed retries.  The HTTP connections the requests use are counted in
+    connection_stats, and the latency of each attempt is recorded in
+    request_latency by endpoint.
+
+    Given a cassette, responses are recorded to it or, when it is replaying,
+    served from it without sending any request.
+    """
+
+    def __init__(self, dump_api=False, scheduler=None, connection_stats=None,
+                 request_latency=None, cassette=None, session=None, auth=None,
+                 **options):
+        Client.__init__(self, session=session, auth=auth, **options)
+        self._dump_api = dump_api
+        self._scheduler = scheduler or RequestScheduler()
+        self._connection_stats = connection_stats or http_pool.ConnectionStats()
+        self._request_latency = request_latency or latency.LatencyRecorder(
+                latency.path_template)
+        self._cassette = cassette
+        self._num_requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def num_requests(self):
+        return self._num_requests
+
+    @property
+    def scheduler(self):
+        return self._scheduler
+
+    @property
+    def connection_stats(self):
+        return self._connection_stats
+
+    @property
+    def request_latency(self):
+        return self._request_latency
+
+    @property
+    def cassette(self):
+        return self._cassette
+
+    def close(self):
+        """Close the HTTP connections, and the cassette being recorded."""
+        self.session.close()
+        if self._cassette is not None:
+            self._cassette.close()
+
+    def request(self, method, path, **options):
+        if self._dump_api:
+            print("{}: {}".format(method, path))
+        with self._lock:
+            self._num_requests += 1
+        if self._cassette is not None and self._cassette.replaying:
+            return self._cassette.replay(method, path, options)
+
+        max_retries = options.get('max_retries', self.options['max_retries'])
+        options['max_retries'] = 0
+        start = time.monotonic()
+        try:
+            response = self._scheduler.call(
+                    lambda: self._request_latency.timed(
+                        "{} {}".format(method.upper(), path),
+                        Client.request, self, method, path, **options),
+                    max_retries=max_retries)
+        except asana.error.AsanaError as e:
+            if self._cassette is not None:
+                self._cassette.record_error(method, path, options, e,
+                                            time.monotonic() - start)
+            raise
+        if self._cassette is not None:
+            self._cassette.record(method, path, options, response,
+                                  time.monotonic() - start)
+        return response
@@ -0,0 +1,187 @@
+import argparse
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import asana.error
+import requests
+
+from asana2sql import cassette
+from asana2sql.async_client import BlockingAsyncClient
+from asana2sql.client import RequestCountingClient, build_asana_client
+from asana2sql.scheduler import RequestScheduler
+
+
+class StubAsanaServer(object):
+    """A local HTTP server that answers each request with the next of a list
+    of canned (status, headers, body) responses."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.paths = []
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.paths.append(self.path)
+                status, headers, body = stub.responses.pop(0)
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = HTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:{}".format(self._server.server_address[1])
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class RequestCountingClientTestCase(unittest.TestCase):
+    def test_retries_rate_limited_requests(self):
+        responses = [
+                (429, {"Retry-After": "0.05"}, {"errors": [{"message": "slow down"}]}),
+                (429, {"Retry-After": "0"}, {"errors": [{"message": "slow down"}]}),
+                (200, {}, {"data": {"id": 1, "name": "Project"}}),
+                ]
+        with StubAsanaServer(responses) as server:
+            scheduler = RequestScheduler(max_concurrency=4)
+            client = RequestCountingClient(
+                    session=requests.Session(), base_url=server.base_url,
+                    scheduler=scheduler)
+
+            project = client.projects.find_by_id(1)
+
+        self.assertEqual(project, {"id": 1, "name": "Project"})
+        self.assertEqual(len(server.paths), 3)
+        self.assertEqual(client.num_requests, 1)
+        self.assertEqual(scheduler.num_throttled, 2)
+        self.assertGreater(scheduler.throttle_wait_seconds, 0)
+        self.assertEqual(scheduler.min_concurrency_limit, 1)
+
+    def test_records_latency_by_endpoint(self):
+        responses = [
+                (200, {}, {"data": {"id": 1, "name": "One"}}),
+                (200, {}, {"data": {"id": 2, "name": "Two"}}),
+                ]
+        with StubAsanaServer(responses) as server:
+            client = RequestCountingClient(
+                    session=requests.Session(), base_url=server.base_url)
+
+            client.projects.find_by_id(1)
+            client.projects.find_by_id(2)
+
+        summary = client.request_latency.summary()
+        self.assertEqual(list(summary), ["GET /projects/{id}"])
+        self.assertEqual(summary["GET /projects/{id}"]["count"], 2)
+
+    def test_record_and_replay(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        responses = [
+                (200, {}, {"data": [{"id": 1}], "next_page": {"offset": "a"}}),
+                (200, {}, {"data": [{"id": 2}], "next_page": None}),
+                ]
+        with StubAsanaServer(responses) as server:
+            recorder = RequestCountingClient(
+                    session=requests.Session(), base_url=server.base_url,
+                    cassette=cassette.Cassette(directory))
+            recorded = list(recorder.tasks.find_by_project(1, page_size=1))
+            recorder.cassette.close()
+
+        # The server is gone; the responses come from the cassette.
+        player = RequestCountingClient(
+                session=requests.Session(), base_url=server.base_url,
+                cassette=cassette.Cassette(directory, replay=True))
+        replayed = list(player.tasks.find_by_project(1, page_size=1))
+
+        self.assertEqual(recorded, [{"id": 1}, {"id": 2}])
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(player.cassette.num_replayed, 2)
+
+    def record_and_replay_error(self, responses, request_fn):
+        """The errors request_fn raises when recorded, and when replayed."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with StubAsanaServer(responses) as server:
+            recorder = RequestCountingClient(
+                    session=requests.Session(), base_url=server.base_url,
+                    cassette=cassette.Cassette(directory))
+            with self.assertRaises(asana.error.AsanaError) as recorded:
+                request_fn(recorder)
+            recorder.cassette.close()
+
+        player = RequestCountingClient(
+                session=requests.Session(), base_url=server.base_url,
+                cassette=cassette.Cassette(directory, replay=True))
+        with self.assertRaises(asana.error.AsanaError) as replayed:
+            request_fn(player)
+        return recorded.exception, replayed.exception
+
+    def test_record_and_replay_invalid_sync_token(self):
+        recorded, replayed = self.record_and_replay_error(
+                [(412, {}, {"sync": "new-token",
+                            "errors": [{"message": "Sync token invalid"}]})],
+                lambda client: client.events.get({"resource": 1, "sync": "old"}))
+
+        self.assertIsInstance(replayed, asana.error.InvalidTokenError)
+        self.assertEqual(replayed.sync, "new-token")
+        self.assertEqual(str(replayed), str(recorded))
+
+    def test_record_and_replay_not_found(self):
+        recorded, replayed = self.record_and_replay_error(
+                [(404, {}, {"errors": [{"message": "task: Unknown object"}]})],
+                lambda client: client.tasks.find_by_id(1))
+
+        self.assertIsInstance(replayed, asana.error.NotFoundError)
+        self.assertEqual(replayed.status, 404)
+        self.assertEqual(str(replayed), str(recorded))
+
+
+class BuildAsanaClientTestCase(unittest.TestCase):
+    def args(self, **kwargs):
+        args = argparse.Namespace(access_token="token", base_url=None,
+                                  verify=True, dump_api=False,
+                                  api_concurrency=4)
+        vars(args).update(kwargs)
+        return args
+
+    def test_blocking_client(self):
+        client = build_asana_client(self.args())
+
+        self.assertIsInstance(client, RequestCountingClient)
+        self.assertEqual(client.scheduler.concurrency_limit, 4)
+
+    def test_async_engine(self):
+        client = build_asana_client(self.args(async_engine=True))
+        try:
+            self.assertIsInstance(client, BlockingAsyncClient)
+            self.assertEqual(client.num_requests, 0)
+            self.assertEqual(client.scheduler.concurrency_limit, 4)
+        finally:
+            client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
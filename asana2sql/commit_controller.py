@@ -0,0 +1,65 @@
+import time
+
+
+class CommitController(object):
+    """Wraps a DatabaseWrapper and decides when to commit.
+
+    Callers mark the end of each unit of work (e.g. a task and its join
+    rows) with checkpoint().  A commit happens at the first checkpoint after
+    commit_every checkpoints, or after commit_interval seconds, whichever
+    comes first.  With neither set, only explicit commit() calls commit.
+
+    Everything else is passed through to the wrapped DatabaseWrapper.
+    """
+
+    def __init__(self, db_wrapper, commit_every=None, commit_interval=None,
+                 clock=time.monotonic):
+        self._db_wrapper = db_wrapper
+        self._commit_every = commit_every
+        self._commit_interval = commit_interval
+        self._clock = clock
+
+        self._checkpoints_since_commit = 0
+        self._last_commit = clock()
+
+        self._num_commits = 0
+        self._commit_seconds = 0.0
+        self._max_commit_seconds = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self._db_wrapper, name)
+
+    @property
+    def num_commits(self):
+        """Number of commits made."""
+        return self._num_commits
+
+    @property
+    def commit_seconds(self):
+        """Total time spent committing, including flushing batched writes."""
+        return self._commit_seconds
+
+    @property
+    def max_commit_seconds(self):
+        """Time taken by the slowest commit."""
+        return self._max_commit_seconds
+
+    def checkpoint(self):
+        """Mark the end of a unit of work, committing if the policy says so."""
+        self._checkpoints_since_commit += 1
+        if ((self._commit_every and
+                self._checkpoints_since_commit >= self._commit_every) or
+            (self._commit_interval is not None and
+                self._clock() - self._last_commit >= self._commit_interval)):
+            self.commit()
+
+    def commit(self):
+        start = self._clock()
+        self._db_wrapper.commit()
+        self._last_commit = self._clock()
+
+        latency = self._last_commit - start
+        self._num_commits += 1
+        self._commit_seconds += latency
+        self._max_commit_seconds = max(self._max_commit_seconds, latency)
+        self._checkpoints_since_commit = 0
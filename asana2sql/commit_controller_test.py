@@ -0,0 +1,74 @@
+import unittest
+import mock
+
+from asana2sql.commit_controller import CommitController
+from asana2sql.db_wrapper import DatabaseWrapper
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CommitControllerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db_wrapper = mock.Mock(DatabaseWrapper)
+        self.clock = FakeClock()
+
+    def test_passes_through(self):
+        controller = CommitController(self.db_wrapper)
+
+        controller.write("SQL", 1)
+        controller.checkpoint()
+
+        self.db_wrapper.write.assert_called_once_with("SQL", 1)
+        self.db_wrapper.commit.assert_not_called()
+
+    def test_commit_every(self):
+        controller = CommitController(self.db_wrapper, commit_every=2)
+
+        controller.checkpoint()
+        self.db_wrapper.commit.assert_not_called()
+        controller.checkpoint()
+        self.assertEqual(self.db_wrapper.commit.call_count, 1)
+        controller.checkpoint()
+        controller.checkpoint()
+        self.assertEqual(self.db_wrapper.commit.call_count, 2)
+        self.assertEqual(controller.num_commits, 2)
+
+    def test_commit_interval(self):
+        controller = CommitController(self.db_wrapper, commit_interval=10,
+                                      clock=self.clock)
+
+        self.clock.now = 5
+        controller.checkpoint()
+        self.db_wrapper.commit.assert_not_called()
+
+        self.clock.now = 10
+        controller.checkpoint()
+        self.assertEqual(self.db_wrapper.commit.call_count, 1)
+
+        self.clock.now = 15
+        controller.checkpoint()
+        self.assertEqual(self.db_wrapper.commit.call_count, 1)
+
+    def test_commit_latency(self):
+        controller = CommitController(self.db_wrapper, clock=self.clock)
+
+        def slow_commit():
+            self.clock.now += 0.5
+        self.db_wrapper.commit.side_effect = slow_commit
+
+        controller.commit()
+        controller.commit()
+
+        self.assertEqual(controller.num_commits, 2)
+        self.assertEqual(controller.commit_seconds, 1.0)
+        self.assertEqual(controller.max_commit_seconds, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
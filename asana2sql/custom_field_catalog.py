@@ -0,0 +1,104 @@
+class CustomFieldCatalog(object):
+    """The custom field definitions and their enum options, loaded once from
+    the backing store.
+
+    Definitions are only written when a custom field seen on a task differs
+    from the stored one, and enum options are only refreshed, and diffed in
+    memory, when the field's definition fingerprint changes.
+    """
+
+    def __init__(self, seed_fields_fn, seed_enum_options_fn,
+                 fetch_definition_fn, insert_field_fn, insert_enum_option_fn,
+                 delete_enum_option_fn):
+        self._seed_fields_fn = seed_fields_fn
+        self._seed_enum_options_fn = seed_enum_options_fn
+        self._fetch_definition_fn = fetch_definition_fn
+        self._insert_field_fn = insert_field_fn
+        self._insert_enum_option_fn = insert_enum_option_fn
+        self._delete_enum_option_fn = delete_enum_option_fn
+
+        # custom_field_id -> (name, type)
+        self._fields = None
+        # custom_field_id -> {enum_option_id -> (name, enabled, color)}
+        self._enum_options = None
+        # Fields already checked this run.
+        self._checked = set()
+
+    def _prime(self):
+        self._fields = {}
+        self._enum_options = {}
+        for row in self._seed_fields_fn():
+            self._fields[row.id] = (row.name, row.type)
+        for row in self._seed_enum_options_fn():
+            self._enum_options.setdefault(row.custom_field_id, {})[row.id] = (
+                    row.name, row.enabled, row.color)
+
+    def get(self, custom_field_id):
+        """Returns the stored (name, type) of the custom field, or None."""
+        if self._fields is None:
+            self._prime()
+        return self._fields.get(custom_field_id)
+
+    def enum_options(self, custom_field_id):
+        """Returns the stored enum options of the custom field, keyed by
+        option id."""
+        if self._enum_options is None:
+            self._prime()
+        return dict(self._enum_options.get(custom_field_id, {}))
+
+    def add(self, custom_field):
+        """Record a custom field as it appears on a task.
+
+        NB: This depends on the data for the custom field being available in
+        the custom_field parameter, which is true if custom_fields are fetched
+        via the task API.
+        """
+        if self._fields is None:
+            self._prime()
+
+        custom_field_id = custom_field["id"]
+        if custom_field_id in self._checked:
+            return
+        self._checked.add(custom_field_id)
+
+        definition = (custom_field["name"], custom_field["type"])
+        definition_changed = self._fields.get(custom_field_id) != definition
+        if definition_changed:
+            self._insert_field_fn(custom_field_id, *definition)
+            self._fields[custom_field_id] = definition
+
+        if custom_field["type"] != "enum":
+            return
+
+        new_options = custom_field.get("enum_options")
+        if new_options is not None:
+            self._update_enum_options(custom_field_id, new_options)
+        elif definition_changed or self._has_unknown_enum_value(custom_field):
+            # The task didn't carry the options, so fetch the definition.
+            definition = self._fetch_definition_fn(custom_field_id)
+            self._update_enum_options(
+                    custom_field_id, definition.get("enum_options", []))
+
+    def _has_unknown_enum_value(self, custom_field):
+        enum_value = custom_field.get("enum_value")
+        return (enum_value is not None and
+                enum_value.get("id") not in
+                    self._enum_options.get(custom_field["id"], {}))
+
+    def _update_enum_options(self, custom_field_id, new_options):
+        old_options = self._enum_options.get(custom_field_id, {})
+        options = {}
+
+        for enum_option in new_options:
+            option = (enum_option["name"], enum_option["enabled"],
+                      enum_option["color"])
+            options[enum_option["id"]] = option
+            if old_options.get(enum_option["id"]) != option:
+                self._insert_enum_option_fn(
+                        custom_field_id, enum_option["id"], *option)
+
+        for option_id in old_options:
+            if option_id not in options:
+                self._delete_enum_option_fn(custom_field_id, option_id)
+
+        self._enum_options[custom_field_id] = options
@@ -0,0 +1,80 @@
+import unittest
+import mock
+
+from asana2sql.custom_field_catalog import CustomFieldCatalog
+from asana2sql.test_fixtures import row
+
+
+def enum_option(id, name="Option", enabled=True, color="red"):
+    return {"id": id, "name": name, "enabled": enabled, "color": color}
+
+
+class CustomFieldCatalogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.seed_fields_fn = mock.Mock()
+        self.seed_enum_options_fn = mock.Mock()
+        self.fetch_definition_fn = mock.Mock()
+        self.insert_field_fn = mock.Mock()
+        self.insert_enum_option_fn = mock.Mock()
+        self.delete_enum_option_fn = mock.Mock()
+
+        self.seed_fields_fn.return_value = [
+                row(id=1, name="Text", type="text"),
+                row(id=2, name="Enum", type="enum")]
+        self.seed_enum_options_fn.return_value = [
+                row(custom_field_id=2, id=20, name="Option", enabled=1, color="red"),
+                row(custom_field_id=2, id=21, name="Option", enabled=1, color="red")]
+
+        self.catalog = CustomFieldCatalog(
+                self.seed_fields_fn, self.seed_enum_options_fn,
+                self.fetch_definition_fn, self.insert_field_fn,
+                self.insert_enum_option_fn, self.delete_enum_option_fn)
+
+    def test_unchanged_fields_are_not_written(self):
+        self.catalog.add({"id": 1, "name": "Text", "type": "text"})
+        self.catalog.add({"id": 2, "name": "Enum", "type": "enum",
+                          "enum_value": enum_option(20)})
+
+        self.seed_fields_fn.assert_called_once_with()
+        self.seed_enum_options_fn.assert_called_once_with()
+        self.fetch_definition_fn.assert_not_called()
+        self.insert_field_fn.assert_not_called()
+        self.insert_enum_option_fn.assert_not_called()
+        self.delete_enum_option_fn.assert_not_called()
+
+    def test_new_field(self):
+        self.catalog.add({"id": 3, "name": "Number", "type": "number"})
+        self.catalog.add({"id": 3, "name": "Number", "type": "number"})
+
+        self.insert_field_fn.assert_called_once_with(3, "Number", "number")
+        self.assertEqual(self.catalog.get(3), ("Number", "number"))
+
+    def test_unknown_enum_value_refreshes_options(self):
+        self.fetch_definition_fn.return_value = {
+                "enum_options": [enum_option(20), enum_option(22, name="New")]}
+
+        self.catalog.add({"id": 2, "name": "Enum", "type": "enum",
+                          "enum_value": enum_option(22, name="New")})
+
+        self.fetch_definition_fn.assert_called_once_with(2)
+        self.insert_field_fn.assert_not_called()
+        self.insert_enum_option_fn.assert_called_once_with(
+                2, 22, "New", True, "red")
+        self.delete_enum_option_fn.assert_called_once_with(2, 21)
+        self.assertEqual(self.catalog.enum_options(2), {
+                20: ("Option", True, "red"),
+                22: ("New", True, "red")})
+
+    def test_enum_options_on_task_are_diffed_without_fetching(self):
+        self.catalog.add({"id": 2, "name": "Enum", "type": "enum",
+                          "enum_options": [enum_option(20),
+                                           enum_option(21, color="blue")]})
+
+        self.fetch_definition_fn.assert_not_called()
+        self.insert_enum_option_fn.assert_called_once_with(
+                2, 21, "Option", True, "blue")
+        self.delete_enum_option_fn.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,21 +1,40 @@
+import time
+
+from asana2sql import latency
+
 
 class DatabaseWrapper(object):
     """A simple wrapper for a DB API 2.0 connection.
 
-    It supports two additional options:
+    It supports three additional options:
       dump_sql will print all SQL commands to STDOUT.
       dry will prevent any write commands from actuallye executing.
+      batch_size will buffer consecutive parameterized writes of the same
+        statement and execute them with a single executemany() once there are
+        batch_size of them.  A write of a different statement, any read and
+        commit flush the pending writes first, so writes run in the order
+        they were issued.
+
+    The time each command takes to execute, and for reads to fetch its rows,
+    is recorded in statement_latency by statement.  A batch counts once.
     """
 
-    def __init__(self, db_conn, dump_sql=False, dry=False):
+    def __init__(self, db_conn, dump_sql=False, dry=False, batch_size=0):
         self._db_conn = db_conn
         self._dump_sql = dump_sql
         self._dry = dry
+        self._batch_size = batch_size
         self._cursor = None
 
+        # The statement of the buffered writes, and their parameter rows.
+        self._pending_sql = None
+        self._pending_rows = []
+
         self._num_reads = 0
         self._num_writes = 0
         self._num_executed = 0
+        self._num_batches = 0
+        self._statement_latency = latency.LatencyRecorder(latency.statement_template)
 
     @property
     def num_reads(self):
@@ -32,6 +51,15 @@ class DatabaseWrapper(object):
         """Number of SQL commands executed."""
         return self._num_executed
 
+    @property
+    def num_batches(self):
+        """Number of batched (executemany) commands executed."""
+        return self._num_batches
+
+    @property
+    def statement_latency(self):
+        return self._statement_latency
+
     def read(self, sql, *params):
         """Execute a read-only SQL statement and return the result rows."""
         self._num_reads += 1
@@ -39,9 +67,27 @@ class DatabaseWrapper(object):
         if self._dump_sql:
             print(sql + " " + repr(params))
 
-        self._execute_sql(sql, *params)
+        self.flush()
+        return self._execute_sql(sql, *params, fetch=True)
+
+    def table_exists(self, table_name):
+        """Whether the database has a table with exactly this name.
+
+        The ODBC catalog takes the name as a search pattern, in which the
+        _ of table names matches any character, so the tables it finds are
+        compared by name.
+        """
+        self._num_reads += 1
 
-        return self._cursor.fetchall()
+        if self._dump_sql:
+            print("-- tables(table={!r})".format(table_name))
+
+        self.flush()
+        cursor = self._cursor_or_new()
+        self._num_executed += 1
+        rows = self._statement_latency.timed(
+                "-- tables()", lambda: cursor.tables(table=table_name).fetchall())
+        return any(row.table_name == table_name for row in rows)
 
     def write(self, sql, *params):
         """Execute a write SQL statement."""
@@ -53,11 +99,66 @@ class DatabaseWrapper(object):
             else:
                 print(sql + " " + repr(params))
 
-        if not self._dry:
+        if self._dry:
+            return
+
+        if self._batch_size > 1 and params:
+            self._buffer_write(sql, params)
+        else:
+            self.flush()
             self._execute_sql(sql, *params)
 
-    def _execute_sql(self, sql, *params):
+    def flush(self):
+        """Execute all buffered writes."""
+        if self._pending_rows:
+            sql, rows = self._pending_sql, self._pending_rows
+            self._pending_sql, self._pending_rows = None, []
+            self._execute_many(sql, rows)
+
+    def checkpoint(self):
+        """Mark the end of a unit of work.  Plain connections only commit
+        when asked; see CommitController."""
+        pass
+
+    def commit(self):
+        """Flush buffered writes and commit the connection."""
+        self.flush()
+        if not self._dry:
+            self._db_conn.commit()
+
+    def _buffer_write(self, sql, params):
+        # Writes may pass their parameters either spread out or as a single
+        # sequence, as DB API execute() accepts both.
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            row = tuple(params[0])
+        else:
+            row = params
+
+        if sql != self._pending_sql:
+            self.flush()
+            self._pending_sql = sql
+        self._pending_rows.append(row)
+        if len(self._pending_rows) >= self._batch_size:
+            self.flush()
+
+    def _cursor_or_new(self):
         if not self._cursor:
             self._cursor = self._db_conn.cursor()
+        return self._cursor
+
+    def _execute_sql(self, sql, *params, fetch=False):
+        cursor = self._cursor_or_new()
+        self._num_executed += 1
+        start = time.perf_counter()
+        cursor.execute(sql, *params)
+        rows = cursor.fetchall() if fetch else None
+        self._statement_latency.record(sql, time.perf_counter() - start)
+        return rows
+
+    def _execute_many(self, sql, rows):
+        cursor = self._cursor_or_new()
         self._num_executed += 1
-        self._cursor.execute(sql, *params)
+        self._num_batches += 1
+        start = time.perf_counter()
+        cursor.executemany(sql, rows)
+        self._statement_latency.record(sql, time.perf_counter() - start)
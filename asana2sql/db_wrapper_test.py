@@ -80,6 +80,119 @@ class DatabaseWrapperTestCase(unittest.TestCase):
 
         self.assertEqual(self.conn.mock_calls, [])
 
+    def test_batched_write(self):
+        db_wrapper = DatabaseWrapper(self.conn, batch_size=2)
+
+        db_wrapper.write(TEST_SQL, PARAM1, PARAM2)
+
+        self.assertEqual(db_wrapper.num_writes, 1)
+        self.assertEqual(db_wrapper.num_executed, 0)
+        self.assertEqual(self.conn.mock_calls, [])
+
+        db_wrapper.write(TEST_SQL, (PARAM2, PARAM1))
+
+        self.assertEqual(db_wrapper.num_writes, 2)
+        self.assertEqual(db_wrapper.num_executed, 1)
+        self.assertEqual(db_wrapper.num_batches, 1)
+
+        self.assertEqual(self.conn.mock_calls, [
+            mock.call.cursor(),
+            mock.call.cursor().executemany(
+                TEST_SQL, [(PARAM1, PARAM2), (PARAM2, PARAM1)]),
+            ])
+
+    def test_batched_write_flushes_before_read(self):
+        self.conn.cursor().fetchall.return_value = [0, 1]
+        self.conn.reset_mock() # Ignore the call above.
+
+        db_wrapper = DatabaseWrapper(self.conn, batch_size=10)
+
+        db_wrapper.write(TEST_SQL, PARAM1)
+        db_wrapper.write(TEST_SQL, PARAM2)
+        self.assertEqual(db_wrapper.read(TEST_SQL), [0, 1])
+
+        self.assertEqual(db_wrapper.num_executed, 2)
+        self.assertEqual(db_wrapper.num_batches, 1)
+
+        self.assertEqual(self.conn.mock_calls, [
+            mock.call.cursor(),
+            mock.call.cursor().executemany(
+                TEST_SQL, [(PARAM1,), (PARAM2,)]),
+            mock.call.cursor().execute(TEST_SQL),
+            mock.call.cursor().fetchall(),
+            ])
+
+    def test_commit_flushes(self):
+        db_wrapper = DatabaseWrapper(self.conn, batch_size=10)
+
+        db_wrapper.write(TEST_SQL, PARAM1)
+        db_wrapper.commit()
+
+        self.assertEqual(self.conn.mock_calls, [
+            mock.call.cursor(),
+            mock.call.cursor().executemany(TEST_SQL, [(PARAM1,)]),
+            mock.call.commit(),
+            ])
+
+    def test_batched_writes_keep_their_order(self):
+        delete_sql = "DELETE FROM followers WHERE task_id = ?;"
+        insert_sql = "INSERT INTO followers (task_id, user_id) VALUES (?, ?);"
+        db_wrapper = DatabaseWrapper(self.conn, batch_size=2)
+
+        db_wrapper.write(delete_sql, 1)
+        db_wrapper.write(insert_sql, 1, 10)
+        db_wrapper.write(insert_sql, 1, 11)
+        db_wrapper.write(delete_sql, 1)
+        db_wrapper.write(insert_sql, 1, 12)
+        db_wrapper.flush()
+
+        self.assertEqual(self.conn.mock_calls, [
+            mock.call.cursor(),
+            mock.call.cursor().executemany(delete_sql, [(1,)]),
+            mock.call.cursor().executemany(insert_sql, [(1, 10), (1, 11)]),
+            mock.call.cursor().executemany(delete_sql, [(1,)]),
+            mock.call.cursor().executemany(insert_sql, [(1, 12)]),
+            ])
+        self.assertEqual(db_wrapper.num_batches, 4)
+
+    def test_statement_latency(self):
+        db_wrapper = DatabaseWrapper(self.conn, batch_size=2)
+
+        db_wrapper.write(TEST_SQL, PARAM1)
+        db_wrapper.write(TEST_SQL, PARAM2)
+        db_wrapper.read("SELECT 1;")
+
+        summary = db_wrapper.statement_latency.summary()
+        self.assertEqual(summary[TEST_SQL]["count"], 1)
+        self.assertEqual(summary["SELECT 1;"]["count"], 1)
+
+    def test_table_exists_flushes(self):
+        self.conn.cursor().tables().fetchall.return_value = []
+        self.conn.reset_mock() # Ignore the calls above.
+
+        db_wrapper = DatabaseWrapper(self.conn, batch_size=10)
+        db_wrapper.write(TEST_SQL, PARAM1)
+
+        self.assertFalse(db_wrapper.table_exists("stories"))
+        self.assertEqual(db_wrapper.num_reads, 1)
+        self.assertEqual(self.conn.mock_calls, [
+            mock.call.cursor(),
+            mock.call.cursor().executemany(TEST_SQL, [(PARAM1,)]),
+            mock.call.cursor().tables(table="stories"),
+            mock.call.cursor().tables().fetchall(),
+            ])
+
+    def test_table_exists_matches_exact_name(self):
+        # The _ in the name is a wildcard to the ODBC catalog.
+        self.conn.cursor().tables().fetchall.return_value = [
+                mock.Mock(table_name="Task1One")]
+        db_wrapper = DatabaseWrapper(self.conn)
+
+        self.assertFalse(db_wrapper.table_exists("Task_One"))
+
+        self.conn.cursor().tables().fetchall.return_value = [
+                mock.Mock(table_name="Task1One"), mock.Mock(table_name="Task_One")]
+        self.assertTrue(db_wrapper.table_exists("Task_One"))
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,75 @@
+import asana.error
+
+TASK_RESOURCE_TYPE = "task"
+STORY_RESOURCE_TYPE = "story"
+
+
+class ProjectEvents(object):
+    """Applies a project's Asana event stream to the database.
+
+    The events sync token is stored per project in the workspace, so each
+    poll only sees what changed since the previous one.  Affected tasks are
+    refetched by id and written through the project's usual
+    insert_or_replace/delete paths.
+    """
+
+    def __init__(self, asana_client, workspace, project, project_id):
+        self._asana_client = asana_client
+        self._workspace = workspace
+        self._project = project
+        self._project_id = project_id
+
+    def poll(self):
+        """Apply all events since the last poll.
+
+        Returns the tasks that were refreshed and are still in the project,
+        or None if the sync token was missing or expired and the whole
+        project was synchronized instead.
+        """
+        sync_token = self._workspace.get_event_sync_token(self._project_id)
+        task_ids = []
+        seen_task_ids = set()
+
+        while True:
+            query = {"resource": self._project_id}
+            if sync_token:
+                query["sync"] = sync_token
+
+            try:
+                result = self._asana_client.events.get(query)
+            except asana.error.InvalidTokenError as e:
+                # Either this is the first poll or the token is too old and
+                # events were dropped; either way only a full pass is safe.
+                self._project.clear_task_cache()
+                self._project.synchronize()
+                self._workspace.set_event_sync_token(self._project_id, e.sync)
+                return None
+
+            for event in result.get("data") or []:
+                task_id = self._affected_task_id(event)
+                if task_id is not None and task_id not in seen_task_ids:
+                    seen_task_ids.add(task_id)
+                    task_ids.append(task_id)
+
+            sync_token = result.get("sync")
+            if not result.get("has_more"):
+                break
+
+        refreshed = self._project.refresh_tasks(task_ids)
+        self._workspace.set_event_sync_token(self._project_id, sync_token)
+        return refreshed
+
+    @staticmethod
+    def _affected_task_id(event):
+        """The id of the task an event changed, if any.  Story events count
+        against the task they were added to."""
+        resource = event.get("resource") or {}
+        resource_type = resource.get("resource_type") or event.get("type")
+
+        if resource_type == TASK_RESOURCE_TYPE:
+            return resource.get("id")
+        if resource_type == STORY_RESOURCE_TYPE:
+            parent = event.get("parent") or {}
+            if (parent.get("resource_type") or TASK_RESOURCE_TYPE) == TASK_RESOURCE_TYPE:
+                return parent.get("id")
+        return None
@@ -0,0 +1,71 @@
+import unittest
+import mock
+
+from asana2sql.events import ProjectEvents
+from asana2sql import Project
+from asana2sql import test_fixtures as fixtures
+from asana2sql import workspace
+
+
+def task_event(task_id, action="changed"):
+    return {"type": "task", "action": action, "resource": {"id": task_id}}
+
+def story_event(task_id):
+    return {"type": "story", "action": "added",
+            "resource": {"id": 1000 + task_id}, "parent": {"id": task_id}}
+
+
+class ProjectEventsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.workspace = mock.Mock(workspace.Workspace)
+        self.project = mock.Mock(Project.Project)
+
+    def test_first_poll_synchronizes(self):
+        self.client.events = fixtures.FakeEventsEndpoint({}, initial_sync_token="abc")
+        self.workspace.get_event_sync_token.return_value = None
+
+        events = ProjectEvents(self.client, self.workspace, self.project, 1234)
+
+        self.assertIsNone(events.poll())
+
+        self.assertEqual(self.client.events.queries, [{"resource": 1234}])
+        self.project.synchronize.assert_called_once_with()
+        self.project.refresh_tasks.assert_not_called()
+        self.workspace.set_event_sync_token.assert_called_once_with(1234, "abc")
+
+    def test_poll_refreshes_changed_tasks(self):
+        self.client.events = fixtures.FakeEventsEndpoint({
+            "abc": ([task_event(1), task_event(2, "removed")], "def", True),
+            "def": ([story_event(1), task_event(3, "added")], "ghi", False),
+            })
+        self.workspace.get_event_sync_token.return_value = "abc"
+        self.project.refresh_tasks.return_value = [fixtures.task(id=1)]
+
+        events = ProjectEvents(self.client, self.workspace, self.project, 1234)
+
+        self.assertEqual(events.poll(), [fixtures.task(id=1)])
+
+        self.assertEqual(self.client.events.queries, [
+            {"resource": 1234, "sync": "abc"},
+            {"resource": 1234, "sync": "def"},
+            ])
+        self.project.refresh_tasks.assert_called_once_with([1, 2, 3])
+        self.project.synchronize.assert_not_called()
+        self.workspace.set_event_sync_token.assert_called_once_with(1234, "ghi")
+
+    def test_expired_token_resynchronizes(self):
+        self.client.events = fixtures.FakeEventsEndpoint({}, initial_sync_token="new")
+        self.workspace.get_event_sync_token.return_value = "expired"
+
+        events = ProjectEvents(self.client, self.workspace, self.project, 1234)
+
+        self.assertIsNone(events.poll())
+
+        self.project.clear_task_cache.assert_called_once_with()
+        self.project.synchronize.assert_called_once_with()
+        self.workspace.set_event_sync_token.assert_called_once_with(1234, "new")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 
-from asana2sql.field import SqlType, Field, SimpleField
+from asana2sql.Field import SqlType, Field, SimpleField
 
 
 class FieldTestCase(unittest.TestCase):
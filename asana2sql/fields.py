@@ -132,6 +132,9 @@ class CustomFields(Field):
                 for row in self._workspace.task_custom_field_values(task["id"])}
 
         for field_id, custom_field in custom_fields.items():
+            # Cheap unless the field's definition changed.
+            self._workspace.add_custom_field(custom_field)
+
             if field_id in old_fields:
                 old_field = old_fields[field_id]
                 del(old_fields[field_id])
@@ -0,0 +1,107 @@
+import threading
+
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+DEFAULT_POOL_SIZE = 10
+COMPRESSED_ENCODINGS = "gzip, deflate"
+
+
+class ConnectionStats(object):
+    """Counts the HTTP connections opened and the requests sent over them,
+    to check that connection setup (and TLS handshakes) are amortized."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._num_connections = 0
+        self._num_requests = 0
+        self._num_compressed = 0
+
+    @property
+    def num_connections(self):
+        """Number of connections opened."""
+        return self._num_connections
+
+    @property
+    def num_requests(self):
+        """Number of HTTP requests sent."""
+        return self._num_requests
+
+    @property
+    def num_reused(self):
+        """Number of requests sent over an already open connection."""
+        return max(0, self._num_requests - self._num_connections)
+
+    @property
+    def num_compressed(self):
+        """Number of responses received compressed."""
+        return self._num_compressed
+
+    def connection_opened(self):
+        with self._lock:
+            self._num_connections += 1
+
+    def response_received(self, compressed):
+        with self._lock:
+            self._num_requests += 1
+            if compressed:
+                self._num_compressed += 1
+
+
+def _counting_pool_class(pool_class, stats, keep_alive):
+    class CountingConnection(pool_class.ConnectionCls):
+        def connect(self):
+            stats.connection_opened()
+            return pool_class.ConnectionCls.connect(self)
+
+    class CountingConnectionPool(pool_class):
+        ConnectionCls = CountingConnection
+
+        def _put_conn(self, conn):
+            if not keep_alive and conn is not None:
+                conn.close()
+            return pool_class._put_conn(self, conn)
+
+    return CountingConnectionPool
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """A requests transport adapter keeping up to pool_size connections per
+    host open, unless keep_alive is False, and recording its connections in a
+    ConnectionStats."""
+
+    def __init__(self, stats, pool_size=DEFAULT_POOL_SIZE, keep_alive=True, **kwargs):
+        self._stats = stats
+        self._keep_alive = keep_alive
+        HTTPAdapter.__init__(self, pool_connections=pool_size,
+                             pool_maxsize=pool_size, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        HTTPAdapter.init_poolmanager(self, *args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool_class(
+                HTTPConnectionPool, self._stats, self._keep_alive),
+            "https": _counting_pool_class(
+                HTTPSConnectionPool, self._stats, self._keep_alive),
+        }
+
+    def send(self, request, **kwargs):
+        response = HTTPAdapter.send(self, request, **kwargs)
+        self._stats.response_received(
+                bool(response.headers.get("Content-Encoding")))
+        return response
+
+
+def configure_session(session, pool_size=DEFAULT_POOL_SIZE, keep_alive=True,
+                      compression=True):
+    """Mount pooled adapters on a requests session and set its connection
+    headers.  Returns the ConnectionStats the adapters record into."""
+    stats = ConnectionStats()
+    adapter = PooledHTTPAdapter(stats, pool_size=pool_size, keep_alive=keep_alive)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    session.headers["Connection"] = "keep-alive" if keep_alive else "close"
+    session.headers["Accept-Encoding"] = (
+            COMPRESSED_ENCODINGS if compression else "identity")
+    return stats
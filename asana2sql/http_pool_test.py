@@ -0,0 +1,71 @@
+import gzip
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from asana2sql import http_pool
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        payload = json.dumps({"data": {"id": 1}}).encode("utf-8")
+        self.send_response(200)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            payload = gzip.compress(payload)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class ConfigureSessionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        self.url = "http://127.0.0.1:{}/".format(self.server.server_address[1])
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_three_times(self, **options):
+        session = requests.Session()
+        stats = http_pool.configure_session(session, **options)
+        for _ in range(3):
+            self.assertEqual(session.get(self.url).json(), {"data": {"id": 1}})
+        session.close()
+        return stats
+
+    def test_reuses_connections(self):
+        stats = self.get_three_times()
+
+        self.assertEqual(stats.num_requests, 3)
+        self.assertEqual(stats.num_connections, 1)
+        self.assertEqual(stats.num_reused, 2)
+        self.assertEqual(stats.num_compressed, 3)
+
+    def test_without_keep_alive(self):
+        stats = self.get_three_times(keep_alive=False)
+
+        self.assertEqual(stats.num_connections, 3)
+        self.assertEqual(stats.num_reused, 0)
+
+    def test_without_compression(self):
+        stats = self.get_three_times(compression=False)
+
+        self.assertEqual(stats.num_compressed, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+import collections
+import functools
+import json
+import math
+import re
+import threading
+import time
+
+# Histogram buckets grow by this factor, so percentiles are accurate to
+# within about 9%.
+BUCKET_GROWTH = 2 ** (1.0 / 8)
+MIN_SECONDS = 1e-6
+
+PERCENTILES = (50, 95, 99)
+
+_NUMERIC_PATH_SEGMENT = re.compile(r"/\d+(?=/|$)")
+_PARAMETER_LIST = re.compile(r"\(\?(?:\s*,\s*\?)+\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=1024)
+def path_template(path):
+    """The endpoint of an API path, with object ids replaced by {id}."""
+    return _NUMERIC_PATH_SEGMENT.sub("/{id}", path.split("?", 1)[0])
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_template(sql):
+    """The SQL statement with runs of whitespace collapsed and IN lists of
+    any length written as (...)."""
+    return _PARAMETER_LIST.sub("(...)", _WHITESPACE.sub(" ", sql).strip())
+
+
+class Histogram(object):
+    """Latencies bucketed on a log scale, so any number of samples take a
+    bounded amount of memory."""
+
+    def __init__(self):
+        self._buckets = collections.Counter()
+        self._count = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def total_seconds(self):
+        return self._total_seconds
+
+    @property
+    def max_seconds(self):
+        return self._max_seconds
+
+    def record(self, seconds):
+        self._buckets[self._bucket(seconds)] += 1
+        self._count += 1
+        self._total_seconds += seconds
+        self._max_seconds = max(self._max_seconds, seconds)
+
+    def merge(self, other):
+        """Add the samples of another histogram to this one."""
+        self._buckets.update(other._buckets)
+        self._count += other._count
+        self._total_seconds += other._total_seconds
+        self._max_seconds = max(self._max_seconds, other._max_seconds)
+
+    def percentile(self, percent):
+        """The latency below which percent of the samples fall, as the upper
+        bound of its bucket (but never above the slowest sample)."""
+        if not self._count:
+            return 0.0
+        rank = max(1, int(math.ceil(self._count * percent / 100.0)))
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= rank:
+                return min(self._bucket_upper_bound(bucket), self._max_seconds)
+        return self._max_seconds
+
+    def summary(self):
+        summary = {"count": self._count,
+                   "total_seconds": self._total_seconds,
+                   "max_seconds": self._max_seconds}
+        for percent in PERCENTILES:
+            summary["p{}_seconds".format(percent)] = self.percentile(percent)
+        return summary
+
+    @staticmethod
+    def _bucket(seconds):
+        if seconds <= MIN_SECONDS:
+            return 0
+        return int(math.ceil(math.log(seconds / MIN_SECONDS, BUCKET_GROWTH)))
+
+    @staticmethod
+    def _bucket_upper_bound(bucket):
+        return MIN_SECONDS * BUCKET_GROWTH ** bucket
+
+
+class LatencyRecorder(object):
+    """Latency histograms grouped by a key, e.g. an endpoint or a statement.
+
+    Samples may be recorded from several threads at once.
+    """
+
+    def __init__(self, group_fn=None):
+        self._group_fn = group_fn or (lambda key: key)
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, key, seconds):
+        group = self._group_fn(key)
+        with self._lock:
+            histogram = self._histograms.get(group)
+            if histogram is None:
+                histogram = self._histograms[group] = Histogram()
+            histogram.record(seconds)
+
+    def merge(self, histograms):
+        """Add the histograms of another recorder, as returned by its
+        histograms(), to this one's."""
+        with self._lock:
+            for group, other in histograms.items():
+                histogram = self._histograms.get(group)
+                if histogram is None:
+                    histogram = self._histograms[group] = Histogram()
+                histogram.merge(other)
+
+    def timed(self, key, fn, *args, **kwargs):
+        """Returns fn(*args, **kwargs), recording how long it took under
+        key."""
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.record(key, time.perf_counter() - start)
+
+    def histograms(self):
+        with self._lock:
+            return dict(self._histograms)
+
+    def summary(self):
+        """The summary of each group's histogram, keyed by group."""
+        return {group: histogram.summary()
+                for group, histogram in self.histograms().items()}
+
+    def format_lines(self):
+        """One line per group, slowest in total first."""
+        histograms = sorted(self.histograms().items(),
+                            key=lambda item: -item[1].total_seconds)
+        return ["  {}: n = {}, p50 = {:.1f}ms, p95 = {:.1f}ms, p99 = {:.1f}ms, "
+                "total = {:.2f}s".format(
+                    group, histogram.count,
+                    histogram.percentile(50) * 1000,
+                    histogram.percentile(95) * 1000,
+                    histogram.percentile(99) * 1000,
+                    histogram.total_seconds)
+                for group, histogram in histograms]
+
+
+DB_COUNTERS = ("reads", "writes", "executed", "batches", "commits",
+               "commit_seconds")
+
+
+def perf_counters(client, db_wrapper):
+    """The API and database counters and latency histograms of a process,
+    which can be sent to another process and added up with perf_report."""
+    return {
+        "api_requests": client.num_requests,
+        "api_latency": client.request_latency.histograms(),
+        "db": {
+            "reads": db_wrapper.num_reads,
+            "writes": db_wrapper.num_writes,
+            "executed": db_wrapper.num_executed,
+            "batches": db_wrapper.num_batches,
+            "commits": db_wrapper.num_commits,
+            "commit_seconds": db_wrapper.commit_seconds,
+        },
+        "db_latency": db_wrapper.statement_latency.histograms(),
+    }
+
+
+def perf_report(counters_list):
+    """The counters and latency percentiles of a run, for --perf_json,
+    summed over the perf_counters of each of its processes."""
+    api_latency = LatencyRecorder()
+    db_latency = LatencyRecorder()
+    report = {"api": {"requests": 0}, "db": {name: 0 for name in DB_COUNTERS}}
+    for counters in counters_list:
+        report["api"]["requests"] += counters["api_requests"]
+        for name in DB_COUNTERS:
+            report["db"][name] += counters["db"][name]
+        api_latency.merge(counters["api_latency"])
+        db_latency.merge(counters["db_latency"])
+    report["api"]["latency"] = api_latency.summary()
+    report["db"]["latency"] = db_latency.summary()
+    return report
+
+
+def write_perf_json(path, client, db_wrapper, worker_counters=()):
+    """Write the --perf_json report of this process, plus the perf_counters
+    of any worker processes."""
+    report = perf_report(
+            [perf_counters(client, db_wrapper)] + list(worker_counters))
+    with open(path, "w") as perf_file:
+        json.dump(report, perf_file, indent=2, sort_keys=True)
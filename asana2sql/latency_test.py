@@ -0,0 +1,103 @@
+import pickle
+import unittest
+import mock
+
+from asana2sql import latency
+
+
+class TemplateTestCase(unittest.TestCase):
+    def test_path_template(self):
+        self.assertEqual(latency.path_template("GET /projects/1234/tasks"),
+                         "GET /projects/{id}/tasks")
+        self.assertEqual(latency.path_template("GET /tasks/5/stories?offset=abc"),
+                         "GET /tasks/{id}/stories")
+        self.assertEqual(latency.path_template("GET /custom_fields/77"),
+                         "GET /custom_fields/{id}")
+
+    def test_statement_template(self):
+        self.assertEqual(
+                latency.statement_template(
+                    'SELECT * FROM "users" WHERE id IN (?,?,?);'),
+                latency.statement_template(
+                    'SELECT * FROM "users" WHERE id IN (?, ?);'))
+        self.assertEqual(
+                latency.statement_template("CREATE TABLE t (\n    id INTEGER);"),
+                "CREATE TABLE t ( id INTEGER);")
+
+
+class HistogramTestCase(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = latency.Histogram()
+        for _ in range(90):
+            histogram.record(0.010)
+        for _ in range(9):
+            histogram.record(0.100)
+        histogram.record(1.0)
+
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.total_seconds, 2.8)
+        self.assertAlmostEqual(histogram.percentile(50), 0.010, delta=0.001)
+        self.assertAlmostEqual(histogram.percentile(95), 0.100, delta=0.01)
+        self.assertAlmostEqual(histogram.percentile(99), 0.100, delta=0.01)
+        self.assertEqual(histogram.percentile(100), 1.0)
+
+    def test_empty(self):
+        self.assertEqual(latency.Histogram().percentile(99), 0.0)
+
+
+class LatencyRecorderTestCase(unittest.TestCase):
+    def test_groups(self):
+        recorder = latency.LatencyRecorder(latency.path_template)
+
+        recorder.record("GET /tasks/1/stories", 0.5)
+        recorder.record("GET /tasks/2/stories", 1.5)
+        recorder.record("GET /projects/3/tasks", 0.25)
+
+        summary = recorder.summary()
+        self.assertEqual(sorted(summary), ["GET /projects/{id}/tasks",
+                                           "GET /tasks/{id}/stories"])
+        self.assertEqual(summary["GET /tasks/{id}/stories"]["count"], 2)
+        self.assertEqual(summary["GET /tasks/{id}/stories"]["total_seconds"], 2.0)
+        self.assertEqual(summary["GET /tasks/{id}/stories"]["p99_seconds"], 1.5)
+
+        lines = recorder.format_lines()
+        self.assertTrue(lines[0].startswith("  GET /tasks/{id}/stories: n = 2"))
+
+    def test_timed(self):
+        recorder = latency.LatencyRecorder()
+
+        self.assertEqual(recorder.timed("add", lambda a, b=0: a + b, 1, b=2), 3)
+        with self.assertRaises(ZeroDivisionError):
+            recorder.timed("divide", lambda: 1 / 0)
+
+        self.assertEqual(recorder.summary()["add"]["count"], 1)
+        self.assertEqual(recorder.summary()["divide"]["count"], 1)
+
+
+class PerfReportTestCase(unittest.TestCase):
+    def counters(self, requests, reads, seconds):
+        client = mock.Mock(num_requests=requests,
+                           request_latency=latency.LatencyRecorder())
+        client.request_latency.record("GET /tasks", seconds)
+        db_wrapper = mock.Mock(num_reads=reads, num_writes=0, num_executed=reads,
+                               num_batches=0, num_commits=1, commit_seconds=0.5,
+                               statement_latency=latency.LatencyRecorder())
+        # Workers send their counters to the main process pickled.
+        return pickle.loads(pickle.dumps(latency.perf_counters(client, db_wrapper)))
+
+    def test_adds_up_processes(self):
+        report = latency.perf_report([self.counters(1, 0, 0.001),
+                                      self.counters(10, 5, 1.0),
+                                      self.counters(20, 7, 1.0)])
+
+        self.assertEqual(report["api"]["requests"], 31)
+        self.assertEqual(report["db"]["reads"], 12)
+        self.assertEqual(report["db"]["commits"], 3)
+        self.assertEqual(report["db"]["commit_seconds"], 1.5)
+        self.assertEqual(report["api"]["latency"]["GET /tasks"]["count"], 3)
+        self.assertEqual(report["api"]["latency"]["GET /tasks"]["max_seconds"], 1.0)
+        self.assertEqual(report["api"]["latency"]["GET /tasks"]["p50_seconds"], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,10 @@
+import asana.error
+import threading
 import unittest
 import mock
 
-from asana2sql.project import Project
-from asana2sql.field import Field, SimpleField, SqlType
+from asana2sql.Project import Project
+from asana2sql.Field import Field, SimpleField, SqlType
 from asana2sql import test_fixtures as fixtures
 from asana2sql import db_wrapper
 from asana2sql import workspace
@@ -15,7 +17,10 @@ class ProjectTestCase(unittest.TestCase):
         self.config = mock.Mock()
         self.config.project_id = 1234
         self.config.table_name = "test_table"
+        self.config.with_subtasks = False
         self.workspace = mock.Mock(workspace.Workspace)
+        self.workspace.task_claimed.return_value = False
+        self.workspace.claim_task.return_value = True
 
     def test_derived_table_name(self):
         proj = fixtures.project(id=1234, name="Test Table")
@@ -59,7 +64,7 @@ class ProjectTestCase(unittest.TestCase):
         project.export()
 
         self.asana_client.tasks.find_by_project.assert_called_with(
-                1234, fields="id")
+                1234, fields="id", page_size=100)
         self.db_client.read.assert_not_called()
         self.db_client.write.assert_has_calls([
                 mock.call('INSERT OR REPLACE INTO "test_table" (id) VALUES (?);', 1),
@@ -78,7 +83,7 @@ class ProjectTestCase(unittest.TestCase):
         project.synchronize()
 
         self.asana_client.tasks.find_by_project.assert_called_with(
-                1234, fields="id")
+                1234, fields="id", page_size=100)
         self.db_client.read.assert_called_with('SELECT id FROM "test_table";')
         self.db_client.write.assert_called_with(
                 'DELETE FROM "test_table" WHERE id = ?;', 1)
@@ -87,6 +92,341 @@ class ProjectTestCase(unittest.TestCase):
                 mock.call('INSERT OR REPLACE INTO "test_table" (id) VALUES (?);', 3),
                 mock.call('INSERT OR REPLACE INTO "test_table" (id) VALUES (?);', 4)])
 
+    def test_export_prefetches_task_relations(self):
+        self.asana_client.tasks.find_by_project.return_value = [
+                fixtures.task(id=1), fixtures.task(id=2)]
+        indirect_field = mock.Mock(Field)
+        indirect_field.sql_name = None
+        indirect_field.required_fields.return_value = ["id"]
+
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config,
+                          [SimpleField("id", SqlType.INTEGER), indirect_field])
+        project.export()
+
+        self.workspace.prefetch_task_relations.assert_called_once_with([1, 2])
+        self.workspace.clear_prefetched.assert_called_once_with()
+        self.assertEqual(indirect_field.get_data_from_object.call_count, 2)
+
+    def test_subtasks_fetched_in_parallel_in_order(self):
+        self.config.with_subtasks = True
+        self.config.api_concurrency = 4
+        self.asana_client.tasks.find_by_project.return_value = [
+                fixtures.task(id=1), fixtures.task(id=2), fixtures.task(id=3)]
+        self.asana_client.tasks.subtasks.side_effect = (
+                lambda task_id, fields, page_size: iter([fixtures.task(id=task_id * 10)]))
+
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config,
+                          [SimpleField("id", SqlType.INTEGER)])
+
+        self.assertEqual([task["id"] for task in project.tasks()],
+                         [1, 2, 3, 10, 20, 30])
+        self.assertEqual(self.asana_client.tasks.subtasks.call_count, 3)
+
+    def test_incremental_export(self):
+        self.config.incremental = True
+        self.workspace.get_sync_watermark.return_value = "2017-01-01T00:00:00.000Z"
+        self.asana_client.tasks.find_by_project.return_value = [
+                dict(fixtures.task(id=1), modified_at="2017-01-03T00:00:00.000Z"),
+                dict(fixtures.task(id=2), modified_at="2017-01-02T00:00:00.000Z")]
+
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config,
+                          [SimpleField("id", SqlType.INTEGER)])
+        project.export()
+
+        self.asana_client.tasks.find_by_project.assert_called_once_with(
+                1234, fields=mock.ANY, page_size=100,
+                modified_since="2017-01-01T00:00:00.000Z")
+        self.workspace.set_sync_watermark.assert_called_once_with(
+                1234, "2017-01-03T00:00:00.000Z")
+
+    def test_incremental_synchronize_deletes_with_id_only_pass(self):
+        self.config.incremental = True
+        self.workspace.get_sync_watermark.return_value = "2017-01-01T00:00:00.000Z"
+        self.db_client.read.return_value = [
+                fixtures.row(id=1), fixtures.row(id=2), fixtures.row(id=3)]
+        changed_tasks = [dict(fixtures.task(id=2), modified_at="2017-01-02T00:00:00.000Z")]
+        all_task_ids = [{"id": 2}, {"id": 3}]
+        self.asana_client.tasks.find_by_project.side_effect = (
+                lambda project_id, **options:
+                    changed_tasks if "modified_since" in options else all_task_ids)
+
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config,
+                          [SimpleField("id", SqlType.INTEGER)])
+        project.synchronize()
+
+        self.db_client.write.assert_has_calls([
+                mock.call('INSERT OR REPLACE INTO "test_table" (id) VALUES (?);', 2),
+                mock.call('DELETE FROM "test_table" WHERE id = ?;', 1)])
+        self.assertEqual(self.db_client.write.call_count, 2)
+
+    def test_refresh_tasks(self):
+        in_project = dict(fixtures.task(id=1), projects=[{"id": 1234}])
+        moved_away = dict(fixtures.task(id=2), projects=[{"id": 5678}])
+
+        def find_by_id(task_id, fields):
+            if task_id == 3:
+                raise asana.error.NotFoundError()
+            return {1: in_project, 2: moved_away}[task_id]
+        self.asana_client.tasks.find_by_id.side_effect = find_by_id
+
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config,
+                          [SimpleField("id", SqlType.INTEGER)])
+
+        self.assertEqual(project.refresh_tasks([1, 2, 3]), [in_project])
+
+        self.db_client.write.assert_has_calls([
+                mock.call('INSERT OR REPLACE INTO "test_table" (id) VALUES (?);', 1),
+                mock.call('DELETE FROM "test_table" WHERE id = ?;', 2),
+                mock.call('DELETE FROM "test_table" WHERE id = ?;', 3)])
+
+    def test_export_streams_pages(self):
+        self.config.page_size = 2
+        self.asana_client.tasks.find_by_project.return_value = iter([
+                fixtures.task(id=1), fixtures.task(id=2), fixtures.task(id=3)])
+        indirect_field = mock.Mock(Field)
+        indirect_field.sql_name = None
+        indirect_field.required_fields.return_value = ["id"]
+
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config,
+                          [SimpleField("id", SqlType.INTEGER), indirect_field])
+        project.export()
+
+        self.asana_client.tasks.find_by_project.assert_called_once_with(
+                1234, fields="id", page_size=2)
+        self.workspace.prefetch_task_relations.assert_has_calls([
+                mock.call([1, 2]), mock.call([3])])
+        self.assertEqual(project.tasks(), [
+                {"id": 1, "name": "Test Task"},
+                {"id": 2, "name": "Test Task"},
+                {"id": 3, "name": "Test Task"}])
+
+    def test_export_pipelined(self):
+        self.config.page_size = 1
+        self.config.pipeline_depth = 1
+        self.asana_client.tasks.find_by_project.return_value = iter([
+                fixtures.task(id=1), fixtures.task(id=2), fixtures.task(id=3)])
+
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config,
+                          [SimpleField("id", SqlType.INTEGER)])
+        project.export()
+
+        self.db_client.write.assert_has_calls([
+                mock.call('INSERT OR REPLACE INTO "test_table" (id) VALUES (?);', 1),
+                mock.call('INSERT OR REPLACE INTO "test_table" (id) VALUES (?);', 2),
+                mock.call('INSERT OR REPLACE INTO "test_table" (id) VALUES (?);', 3)])
+        self.assertEqual([task["id"] for task in project.tasks()], [1, 2, 3])
+
+    def test_export_pipelined_reads_database_on_calling_thread(self):
+        self.config.incremental = True
+        self.config.pipeline_depth = 1
+        threads = set()
+
+        def get_sync_watermark(project_id):
+            threads.add(threading.current_thread())
+            return "2017-01-01T00:00:00.000Z"
+
+        self.workspace.get_sync_watermark.side_effect = get_sync_watermark
+        self.db_client.read.side_effect = (
+                lambda *args: threads.add(threading.current_thread()))
+        self.asana_client.tasks.find_by_project.return_value = iter([
+                dict(fixtures.task(id=1), modified_at="2017-01-02T00:00:00.000Z")])
+
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config,
+                          [SimpleField("id", SqlType.INTEGER)])
+        project.export()
+
+        self.asana_client.tasks.find_by_project.assert_called_once_with(
+                1234, fields=mock.ANY, page_size=100,
+                modified_since="2017-01-01T00:00:00.000Z")
+        self.assertEqual(threads, {threading.current_thread()})
+
+    def test_export_pipelined_raises_fetch_errors(self):
+        self.config.pipeline_depth = 1
+
+        def failing_pages():
+            yield fixtures.task(id=1)
+            raise asana.error.ServerError()
+
+        self.asana_client.tasks.find_by_project.return_value = failing_pages()
+
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config,
+                          [SimpleField("id", SqlType.INTEGER)])
+        with self.assertRaises(asana.error.ServerError):
+            project.export()
+
+    def test_statements_built_once(self):
+        self.config.table_name = None
+        self.asana_client.projects.find_by_id.return_value = fixtures.project(
+                id=1234, name="Test Table")
+        self.asana_client.tasks.find_by_project.return_value = [
+                fixtures.task(id=1), fixtures.task(id=2)]
+
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config,
+                          [SimpleField("id", SqlType.INTEGER),
+                           SimpleField("name", SqlType.STRING)])
+        project.export()
+
+        self.asana_client.projects.find_by_id.assert_called_once_with(
+                1234, fields="id,name,archived")
+        (first_sql, _, _), (second_sql, _, _) = [
+                call[0] for call in self.db_client.write.call_args_list]
+        self.assertEqual(
+                first_sql,
+                'INSERT OR REPLACE INTO "Test_Table" (id,name) VALUES (?,?);')
+        self.assertIs(first_sql, second_sql)
+
+    def test_checkpoints_each_task(self):
+        self.asana_client.tasks.find_by_project.return_value = [
+                fixtures.task(id=1), fixtures.task(id=2)]
+
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config,
+                          [SimpleField("id", SqlType.INTEGER)])
+        project.export()
+
+        self.assertEqual(self.db_client.mock_calls, [
+                mock.call.write('INSERT OR REPLACE INTO "test_table" (id) VALUES (?);', 1),
+                mock.call.checkpoint(),
+                mock.call.write('INSERT OR REPLACE INTO "test_table" (id) VALUES (?);', 2),
+                mock.call.checkpoint()])
+
+    def test_skip_unchanged_rows(self):
+        self.config.skip_unchanged_rows = True
+        self.asana_client.tasks.find_by_project.return_value = [
+                fixtures.task(id=1), fixtures.task(id=2)]
+
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config,
+                          [SimpleField("id", SqlType.INTEGER)])
+        unchanged_fingerprint = project._fingerprint([1])
+        self.workspace.get_row_fingerprints.return_value = {
+                1: unchanged_fingerprint, 2: "stale"}
+
+        project.export()
+
+        self.workspace.get_row_fingerprints.assert_called_once_with("test_table", [1, 2])
+        self.db_client.write.assert_called_once_with(
+                'INSERT OR REPLACE INTO "test_table" (id) VALUES (?);', 2)
+        self.workspace.set_row_fingerprint.assert_called_once_with(
+                "test_table", 2, project._fingerprint([2]))
+        self.assertEqual(project.num_rows_written, 1)
+        self.assertEqual(project.num_rows_skipped, 1)
+
+    def test_fingerprints_kept_without_skip_unchanged_rows(self):
+        stored = {}
+        self.workspace.get_row_fingerprints.side_effect = (
+                lambda table_name, task_ids: {
+                    task_id: stored[task_id] for task_id in task_ids if task_id in stored})
+        self.workspace.set_row_fingerprint.side_effect = (
+                lambda table_name, task_id, fingerprint: stored.update({task_id: fingerprint}))
+        self.workspace.remove_row_fingerprint.side_effect = (
+                lambda table_name, task_id: stored.pop(task_id, None))
+        self.asana_client.tasks.find_by_project.return_value = [fixtures.task(id=1)]
+
+        def project(skip_unchanged_rows):
+            self.config.skip_unchanged_rows = skip_unchanged_rows
+            return Project(self.asana_client, self.db_client, self.workspace, self.config,
+                           [SimpleField("id", SqlType.INTEGER)])
+
+        project(True).export()
+        project(False).delete(1)
+        self.assertEqual(stored, {})
+
+        rerun = project(True)
+        rerun.export()
+        self.assertEqual(rerun.num_rows_written, 1)
+        self.assertEqual(rerun.num_rows_skipped, 0)
+        self.assertEqual(stored, {1: rerun._fingerprint([1])})
+
+        unflagged = project(False)
+        unflagged.export()
+        self.assertEqual(unflagged.num_rows_written, 1)
+        self.assertEqual(stored, {1: rerun._fingerprint([1])})
+
+    def test_export_skips_tasks_written_by_earlier_projects(self):
+        self.config.with_subtasks = True
+        self.asana_client.tasks.find_by_project.return_value = [
+                fixtures.task(id=1), fixtures.task(id=2)]
+        self.asana_client.tasks.subtasks.return_value = []
+        self.workspace.task_claimed.side_effect = lambda task_id: task_id == 1
+        self.workspace.claim_task.side_effect = lambda task_id: task_id != 1
+
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config,
+                          [SimpleField("id", SqlType.INTEGER)])
+        project.export()
+
+        self.asana_client.tasks.subtasks.assert_called_once_with(
+                2, fields="id", page_size=100)
+        self.db_client.write.assert_called_once_with(
+                'INSERT OR REPLACE INTO "test_table" (id) VALUES (?);', 2)
+        self.assertEqual(project.num_tasks_deduplicated, 1)
+        self.assertEqual([task["id"] for task in project.tasks()], [1, 2])
+
+    def test_export_records_progress_and_stops_at_deadline(self):
+        self.config.page_size = 2
+        self.config.deadline = 0
+        self.asana_client.tasks.find_by_project.return_value = [
+                fixtures.task(id=1), fixtures.task(id=2), fixtures.task(id=3)]
+
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config,
+                          [SimpleField("id", SqlType.INTEGER)])
+        project.export()
+
+        self.workspace.clear_export_progress.assert_called_once_with(1234)
+        self.db_client.write.assert_has_calls([
+                mock.call('INSERT OR REPLACE INTO "test_table" (id) VALUES (?);', 1),
+                mock.call('INSERT OR REPLACE INTO "test_table" (id) VALUES (?);', 2)])
+        self.assertEqual(self.db_client.write.call_count, 2)
+        self.workspace.record_exported_page.assert_called_once_with(
+                1234, 1, [fixtures.task(id=1), fixtures.task(id=2)])
+        self.assertTrue(project.interrupted)
+
+        project.complete_export()
+        self.workspace.complete_export.assert_not_called()
+
+    def test_resumed_export_skips_exported_tasks(self):
+        self.config.with_subtasks = True
+        self.config.resume = True
+        self.asana_client.tasks.find_by_project.return_value = [
+                fixtures.task(id=1), fixtures.task(id=2), fixtures.task(id=3)]
+        self.asana_client.tasks.subtasks.return_value = []
+        self.workspace.get_export_progress.return_value = (2, False)
+        self.workspace.get_exported_tasks.return_value = [
+                (1, "one", True), (2, "two", False), (10, "subtask", False)]
+        self.workspace.claim_task_stories.return_value = True
+
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config,
+                          [SimpleField("id", SqlType.INTEGER)])
+        project.export()
+
+        self.workspace.clear_export_progress.assert_not_called()
+        self.asana_client.tasks.subtasks.assert_called_once_with(
+                3, fields="id", page_size=100)
+        self.db_client.write.assert_called_once_with(
+                'INSERT OR REPLACE INTO "test_table" (id) VALUES (?);', 3)
+        self.assertEqual(project.num_tasks_resumed, 2)
+        self.assertEqual(sorted(task["id"] for task in project.tasks()), [1, 2, 3, 10])
+        self.assertEqual(sorted(task["id"] for task in project.story_tasks()), [2, 3, 10])
+
+        # The tasks fit in one page this time, but two were done before.
+        self.workspace.record_exported_page.assert_called_once_with(
+                1234, 2, [fixtures.task(id=3)])
+        project.complete_export()
+        self.workspace.complete_export.assert_called_once_with(1234, 2)
+
+    def test_export_completed(self):
+        self.config.resume = False
+        self.workspace.get_export_progress.return_value = (3, True)
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config, [])
+        self.assertFalse(project.export_completed())
+
+        self.config.resume = True
+        project = Project(self.asana_client, self.db_client, self.workspace, self.config, [])
+        self.workspace.get_export_progress.return_value = None
+        self.assertFalse(project.export_completed())
+        self.workspace.get_export_progress.return_value = (3, False)
+        self.assertFalse(project.export_completed())
+        self.workspace.get_export_progress.return_value = (3, True)
+        self.assertTrue(project.export_completed())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,166 @@
+import threading
+import time
+
+import asana.error
+
+# Requests slower than this are taken as a sign the API is congested.
+DEFAULT_SLOW_REQUEST_SECONDS = 5.0
+
+# Backoff for server errors, as in asana.Client.
+RETRY_DELAY = 1.0
+RETRY_BACKOFF = 2.0
+
+
+class RequestScheduler(object):
+    """Paces the requests made to the Asana API.
+
+    It combines three mechanisms:
+      - a token bucket allowing at most requests_per_minute requests, if set;
+      - a pause honoring the Retry-After of any 429 response, which applies
+        to every thread;
+      - an adaptive concurrency limit, between 1 and max_concurrency, that is
+        halved whenever a request is throttled or slow and grows back by one
+        after each run of limit consecutive healthy requests.
+    """
+
+    def __init__(self, max_concurrency=1, requests_per_minute=None,
+                 slow_request_seconds=DEFAULT_SLOW_REQUEST_SECONDS):
+        self._max_concurrency = max(1, max_concurrency or 1)
+        self._slow_request_seconds = slow_request_seconds
+        self._condition = threading.Condition()
+
+        self._concurrency_limit = self._max_concurrency
+        self._min_concurrency_limit = self._max_concurrency
+        self._in_flight = 0
+        self._healthy_streak = 0
+        self._paused_until = 0.0
+
+        self._rate = requests_per_minute / 60.0 if requests_per_minute else None
+        self._bucket_capacity = max(1.0, self._rate or 0)
+        self._tokens = self._bucket_capacity
+        self._last_refill = time.monotonic()
+
+        self._num_throttled = 0
+        self._num_slow = 0
+        self._num_server_errors = 0
+        self._throttle_wait_seconds = 0.0
+        self._rate_wait_seconds = 0.0
+
+    @property
+    def num_throttled(self):
+        """Number of requests rejected with a 429."""
+        return self._num_throttled
+
+    @property
+    def num_slow(self):
+        """Number of requests slower than the slow request threshold."""
+        return self._num_slow
+
+    @property
+    def num_server_errors(self):
+        """Number of requests that failed with a server error."""
+        return self._num_server_errors
+
+    @property
+    def throttle_wait_seconds(self):
+        """Total time threads spent waiting out Retry-After pauses."""
+        return self._throttle_wait_seconds
+
+    @property
+    def rate_wait_seconds(self):
+        """Total time threads spent waiting for the request budget."""
+        return self._rate_wait_seconds
+
+    @property
+    def concurrency_limit(self):
+        """The current concurrency limit."""
+        return self._concurrency_limit
+
+    @property
+    def min_concurrency_limit(self):
+        """The lowest the concurrency limit has been this run."""
+        return self._min_concurrency_limit
+
+    def call(self, request_fn, max_retries=5):
+        """Run request_fn, which makes a single API request, once the budget
+        allows it.  Rate limited requests and server errors are retried up to
+        max_retries times."""
+        retry_count = 0
+        while True:
+            self._acquire()
+            start = time.monotonic()
+            try:
+                result = request_fn()
+            except asana.error.RateLimitEnforcedError as e:
+                self._release(time.monotonic() - start, retry_after=e.retry_after or 0)
+                if retry_count >= max_retries:
+                    raise
+            except asana.error.ServerError:
+                self._release(time.monotonic() - start, server_error=True)
+                if retry_count >= max_retries:
+                    raise
+                time.sleep(RETRY_DELAY * (RETRY_BACKOFF ** retry_count))
+            except BaseException:
+                self._release(time.monotonic() - start)
+                raise
+            else:
+                self._release(time.monotonic() - start)
+                return result
+            retry_count += 1
+
+    def _acquire(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    self._condition.wait(self._paused_until - now)
+                    self._throttle_wait_seconds += time.monotonic() - now
+                elif self._in_flight >= self._concurrency_limit:
+                    self._condition.wait()
+                elif not self._take_token(now):
+                    self._condition.wait((1 - self._tokens) / self._rate)
+                    self._rate_wait_seconds += time.monotonic() - now
+                else:
+                    self._in_flight += 1
+                    return
+
+    def _take_token(self, now):
+        if self._rate is None:
+            return True
+        self._tokens = min(self._bucket_capacity,
+                           self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def _release(self, latency, retry_after=None, server_error=False):
+        with self._condition:
+            self._in_flight -= 1
+
+            if retry_after is not None:
+                self._num_throttled += 1
+                self._paused_until = max(self._paused_until,
+                                         time.monotonic() + retry_after)
+                self._back_off()
+            elif server_error:
+                self._num_server_errors += 1
+                self._back_off()
+            elif latency > self._slow_request_seconds:
+                self._num_slow += 1
+                self._back_off()
+            else:
+                self._healthy_streak += 1
+                if (self._healthy_streak >= self._concurrency_limit and
+                        self._concurrency_limit < self._max_concurrency):
+                    self._concurrency_limit += 1
+                    self._healthy_streak = 0
+
+            self._condition.notify_all()
+
+    def _back_off(self):
+        self._concurrency_limit = max(1, self._concurrency_limit // 2)
+        self._min_concurrency_limit = min(self._min_concurrency_limit,
+                                          self._concurrency_limit)
+        self._healthy_streak = 0
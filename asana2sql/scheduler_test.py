@@ -0,0 +1,92 @@
+import threading
+import time
+import unittest
+import mock
+
+import asana.error
+
+from asana2sql.scheduler import RequestScheduler
+
+
+def rate_limited(retry_after):
+    response = mock.Mock()
+    response.headers = {"Retry-After": str(retry_after)}
+    return asana.error.RateLimitEnforcedError(response)
+
+
+class RequestSchedulerTestCase(unittest.TestCase):
+    def test_call(self):
+        scheduler = RequestScheduler()
+
+        self.assertEqual(scheduler.call(lambda: "result"), "result")
+        self.assertEqual(scheduler.num_throttled, 0)
+
+    def test_retries_after_rate_limit(self):
+        scheduler = RequestScheduler(max_concurrency=4)
+        request_fn = mock.Mock(side_effect=[rate_limited(0.05), "result"])
+
+        start = time.monotonic()
+        self.assertEqual(scheduler.call(request_fn), "result")
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertEqual(request_fn.call_count, 2)
+        self.assertEqual(scheduler.num_throttled, 1)
+        self.assertGreater(scheduler.throttle_wait_seconds, 0)
+        self.assertEqual(scheduler.min_concurrency_limit, 2)
+
+    def test_gives_up_after_max_retries(self):
+        scheduler = RequestScheduler()
+        request_fn = mock.Mock(side_effect=rate_limited(0))
+
+        with self.assertRaises(asana.error.RateLimitEnforcedError):
+            scheduler.call(request_fn, max_retries=2)
+
+        self.assertEqual(request_fn.call_count, 3)
+
+    def test_concurrency_recovers(self):
+        scheduler = RequestScheduler(max_concurrency=4)
+        scheduler.call(mock.Mock(side_effect=[rate_limited(0), None]))
+        self.assertEqual(scheduler.concurrency_limit, 2)
+
+        for _ in range(10):
+            scheduler.call(lambda: None)
+
+        self.assertEqual(scheduler.concurrency_limit, 4)
+
+    def test_concurrency_limit(self):
+        scheduler = RequestScheduler(max_concurrency=2)
+        lock = threading.Lock()
+        in_flight = [0]
+        max_in_flight = [0]
+
+        def request():
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+
+        threads = [threading.Thread(target=scheduler.call, args=(request,))
+                   for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(max_in_flight[0], 2)
+
+    def test_requests_per_minute(self):
+        scheduler = RequestScheduler(requests_per_minute=1200)  # 20 per second
+
+        start = time.monotonic()
+        for _ in range(22):
+            scheduler.call(lambda: None)
+
+        # The first 20 fit in the bucket, the rest wait for it to refill.
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        self.assertGreater(scheduler.rate_wait_seconds, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
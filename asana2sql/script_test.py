@@ -0,0 +1,113 @@
+import argparse
+import importlib.util
+import os
+import sys
+import unittest
+import mock
+
+from asana2sql import db_wrapper
+from asana2sql.Project import Project
+
+SCRIPT_PATH = os.path.join(os.path.dirname(__file__), "..", "asana2sql.py")
+
+
+def load_script():
+    """The asana2sql.py script as a module.  It can't be imported by name,
+    as the asana2sql package shadows it, and it doesn't need a database
+    driver to be tested."""
+    spec = importlib.util.spec_from_file_location("asana2sql_script", SCRIPT_PATH)
+    script = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(sys.modules, {"pyodbc": mock.Mock()}):
+        spec.loader.exec_module(script)
+    return script
+
+
+class ProjectMainTestCase(unittest.TestCase):
+    def setUp(self):
+        self.script = load_script()
+        self.client = mock.Mock()
+        self.db_wrapper = mock.Mock(db_wrapper.DatabaseWrapper)
+        self.project = mock.Mock(Project)
+        self.project.interrupted = False
+        self.args = argparse.Namespace(
+                command="export", project_id=1234, table_name="tasks",
+                with_stories=False, dump_perf=True)
+
+    def test_resume_skips_completed_project(self):
+        self.project.export_completed.return_value = True
+
+        with mock.patch("builtins.print") as print_mock:
+            self.script.project_main(self.args, self.client, None,
+                                     self.db_wrapper, self.project)
+
+        self.project.export.assert_not_called()
+        self.project.complete_export.assert_not_called()
+        self.db_wrapper.commit.assert_not_called()
+        print_mock.assert_called_once_with(
+                "Skipping project 1234, already exported.")
+
+    def test_exports_incomplete_project(self):
+        self.args.dump_perf = False
+        self.project.export_completed.return_value = False
+
+        self.script.project_main(self.args, self.client, None,
+                                 self.db_wrapper, self.project)
+
+        self.project.export.assert_called_once_with()
+        self.project.complete_export.assert_called_once_with()
+        self.db_wrapper.commit.assert_called_once_with()
+
+    def test_stories_held_for_a_few_tasks_at_a_time(self):
+        self.args.dump_perf = False
+        self.args.with_stories = True
+        self.args.api_concurrency = 2
+        self.project.export_completed.return_value = False
+        self.project.check_deadline.return_value = False
+        self.project.story_tasks.return_value = [
+                {"id": task_id, "name": "Task"} for task_id in range(20)]
+        exported = []
+
+        class CountedStory(object):
+            """Counts the stories alive when each one is written."""
+            live = 0
+
+            def __init__(self, client, db_client, task, config, fields):
+                self.task = task
+                CountedStory.live += 1
+
+            def __del__(self):
+                CountedStory.live -= 1
+
+            def prefetch(self):
+                return self
+
+            def export(self):
+                exported.append((self.task["id"], CountedStory.live))
+
+        with mock.patch.object(self.script, "Story", CountedStory):
+            self.script.project_main(self.args, self.client, None,
+                                     self.db_wrapper, self.project)
+
+        self.assertEqual([task_id for task_id, _ in exported], list(range(20)))
+        self.assertLessEqual(max(live for _, live in exported),
+                             self.args.api_concurrency + 1)
+
+
+class MainTestCase(unittest.TestCase):
+    def test_closes_client_on_error(self):
+        script = load_script()
+        client = mock.Mock()
+        argv = ["asana2sql.py", "--access_token", "token", "--project_id", "1234",
+                "export"]
+
+        with mock.patch.object(sys, "argv", argv), \
+                mock.patch.object(script, "build_asana_client", return_value=client), \
+                mock.patch.object(script, "command_main", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                script.main()
+
+        client.close.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
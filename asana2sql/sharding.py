@@ -0,0 +1,80 @@
+import multiprocessing
+
+from asana2sql.commit_controller import CommitController
+from asana2sql.db_wrapper import DatabaseWrapper
+
+SET_BUSY_TIMEOUT = "PRAGMA busy_timeout = {milliseconds};"
+
+
+class SharedTableWrites(object):
+    """Stands in for the database client of the tables shared by every
+    project (users, projects, custom fields) inside a worker process.
+
+    The writes are recorded instead of executed so the parent process can
+    merge them once all workers are done, instead of every worker contending
+    for the same rows.
+    """
+
+    def __init__(self):
+        self._writes = []
+
+    def write(self, sql, *params):
+        self._writes.append((sql, params))
+
+    def drain(self):
+        """Returns the writes recorded so far and forgets them."""
+        writes, self._writes = self._writes, []
+        return writes
+
+
+def worker_db_wrapper(db_conn, busy_timeout, commit_every=None,
+                      commit_interval=None, **options):
+    """The database client of a worker process, over its own connection to
+    the database every worker writes to.
+
+    Only one connection can write at a time, and it holds the write lock
+    until it commits.  So a worker commits after every unit of work (or
+    every commit_every of them) rather than once per project, and waits up
+    to busy_timeout seconds for another worker's lock instead of failing
+    with "database is locked".  options are passed to DatabaseWrapper.
+    """
+    if db_conn is not None:
+        db_conn.cursor().execute(SET_BUSY_TIMEOUT.format(
+                milliseconds=int(busy_timeout * 1000)))
+    return CommitController(DatabaseWrapper(db_conn, **options),
+                            commit_every=commit_every or 1,
+                            commit_interval=commit_interval)
+
+
+def merge_shared_writes(db_client, write_lists):
+    """Apply the shared table writes collected from the workers, in order,
+    skipping any write already applied.  Returns the number of writes
+    applied."""
+    applied = set()
+    for writes in write_lists:
+        for sql, params in writes:
+            if (sql, params) in applied:
+                continue
+            applied.add((sql, params))
+            db_client.write(sql, *params)
+    return len(applied)
+
+
+def run_sharded(init_fn, init_args, work_fn, items, workers):
+    """Call work_fn on each item in a pool of worker processes.
+
+    Each worker process is set up once with init_fn(*init_args), which should
+    build any per-process state (API client, database connection) work_fn
+    needs.  Items are handed out one at a time so a slow item doesn't hold up
+    a whole shard.  Yields the results in completion order.
+    """
+    pool = multiprocessing.Pool(workers, initializer=init_fn, initargs=init_args)
+    try:
+        for result in pool.imap_unordered(work_fn, items):
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
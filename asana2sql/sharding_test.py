@@ -0,0 +1,114 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import mock
+
+from asana2sql import sharding
+
+_worker_offset = None
+_worker_db = None
+
+
+def _init_worker(offset):
+    global _worker_offset
+    _worker_offset = offset
+
+
+def _add_offset(x):
+    return (os.getpid(), x + _worker_offset)
+
+
+def _init_db_worker(path):
+    global _worker_db
+    # sqlite3 waits 5 seconds for locks by default; only the busy timeout
+    # set by worker_db_wrapper should.
+    _worker_db = sharding.worker_db_wrapper(
+            sqlite3.connect(path, timeout=0), busy_timeout=30, batch_size=10)
+
+
+def _write_project(project_id):
+    """Writes a project's tasks the way an export does, one task at a time."""
+    for task_id in range(project_id * 1000, project_id * 1000 + 200):
+        _worker_db.write("INSERT INTO tasks VALUES (?, ?);", task_id, project_id)
+        _worker_db.write("DELETE FROM followers WHERE task_id = ?;", task_id)
+        for user_id in range(3):
+            _worker_db.write("INSERT INTO followers VALUES (?, ?);", task_id, user_id)
+        _worker_db.checkpoint()
+    _worker_db.commit()
+    return (os.getpid(), project_id)
+
+
+class SharedTableWritesTestCase(unittest.TestCase):
+    def test_drain(self):
+        writes = sharding.SharedTableWrites()
+
+        writes.write("INSERT 1", 1, "foo")
+        writes.write("INSERT 2")
+
+        self.assertEqual(writes.drain(),
+                         [("INSERT 1", (1, "foo")), ("INSERT 2", ())])
+        self.assertEqual(writes.drain(), [])
+
+
+class MergeSharedWritesTestCase(unittest.TestCase):
+    def test_skips_duplicates(self):
+        db_client = mock.Mock()
+
+        applied = sharding.merge_shared_writes(db_client, [
+            [("INSERT", (1, "foo")), ("INSERT", (2, "bar"))],
+            [("INSERT", (1, "foo")), ("INSERT", (1, "baz"))],
+            ])
+
+        self.assertEqual(applied, 3)
+        self.assertEqual(db_client.mock_calls, [
+            mock.call.write("INSERT", 1, "foo"),
+            mock.call.write("INSERT", 2, "bar"),
+            mock.call.write("INSERT", 1, "baz"),
+            ])
+
+
+class RunShardedTestCase(unittest.TestCase):
+    def test_runs_in_worker_processes(self):
+        results = list(sharding.run_sharded(
+            _init_worker, (10,), _add_offset, range(5), 2))
+
+        self.assertEqual(sorted(x for _, x in results), [10, 11, 12, 13, 14])
+        self.assertNotIn(os.getpid(), [pid for pid, _ in results])
+
+    def test_workers_share_one_sqlite_database(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "export.db")
+        db = sqlite3.connect(path)
+        db.execute("CREATE TABLE tasks (id INTEGER PRIMARY KEY, project_id INTEGER);")
+        db.execute("CREATE TABLE followers (task_id INTEGER, user_id INTEGER);")
+        db.commit()
+
+        results = list(sharding.run_sharded(
+            _init_db_worker, (path,), _write_project, range(1, 9), 2))
+
+        self.assertEqual(sorted(project_id for _, project_id in results),
+                         list(range(1, 9)))
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM tasks;").fetchone(), (1600,))
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM followers;").fetchone(), (4800,))
+        db.close()
+
+
+class WorkerDbWrapperTestCase(unittest.TestCase):
+    def test_sets_busy_timeout_and_commits_each_task(self):
+        db_conn = mock.Mock()
+
+        db_wrapper = sharding.worker_db_wrapper(db_conn, busy_timeout=2.5)
+        db_wrapper.checkpoint()
+
+        self.assertEqual(db_conn.mock_calls, [
+            mock.call.cursor(),
+            mock.call.cursor().execute("PRAGMA busy_timeout = 2500;"),
+            mock.call.commit(),
+            ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import mock
+
+from asana2sql.Story import Story
+from asana2sql.Field import SimpleField, SqlType
+from asana2sql import test_fixtures as fixtures
+from asana2sql import db_wrapper
+
+
+def story_fields():
+    return [SimpleField("id", SqlType.INTEGER, primary_key=True),
+            SimpleField("created_at", SqlType.DATETIME),
+            SimpleField("target_id", SqlType.INTEGER)]
+
+
+class StoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.asana_client = mock.Mock()
+        self.db_client = mock.Mock(db_wrapper.DatabaseWrapper)
+        self.config = mock.Mock()
+        self.config.stories_table_name = "stories"
+        self.config.page_size = None
+        self.task = fixtures.task(id=2, name="Test Task")
+
+    def test_per_task_table_name(self):
+        self.config.stories_table_name = None
+
+        story = Story(self.asana_client, self.db_client, self.task, self.config, story_fields())
+
+        self.assertEqual(story.stories_table_name(), "Test_Task")
+
+    def test_create_shared_table_with_indexes(self):
+        story = Story(self.asana_client, self.db_client, self.task, self.config, story_fields())
+
+        story.create_table()
+
+        self.assertEqual(self.db_client.write.mock_calls, [
+            mock.call('''CREATE TABLE IF NOT EXISTS "stories" ('''
+                      '''"id" INTEGER NOT NULL PRIMARY KEY,'''
+                      '''"created_at" DATETIME,'''
+                      '''"target_id" INTEGER);'''),
+            mock.call('''CREATE INDEX IF NOT EXISTS "stories_target_id" ON "stories" (target_id);'''),
+            mock.call('''CREATE INDEX IF NOT EXISTS "stories_created_at" ON "stories" (created_at);'''),
+            ])
+
+    def test_create_per_task_table_without_indexes(self):
+        self.config.stories_table_name = None
+        story = Story(self.asana_client, self.db_client, self.task, self.config, story_fields())
+
+        story.create_table()
+
+        self.assertEqual(self.db_client.write.call_count, 1)
+
+    def test_synchronize_shared_table_only_deletes_task_stories(self):
+        self.asana_client.stories.find_by_task.return_value = [
+                {"id": 10, "created_at": "2017-01-01", "target": {"id": 2}}]
+        self.db_client.read.return_value = [(10,), (11,)]
+
+        story = Story(self.asana_client, self.db_client, self.task, self.config, story_fields())
+        story.synchronize()
+
+        self.db_client.read.assert_called_once_with(
+                '''SELECT id FROM "stories" WHERE target_id = ?;''', 2)
+        self.db_client.write.assert_called_with(
+                '''DELETE FROM "stories" WHERE id = ?;''', 11)
+
+    def test_merge_table(self):
+        story = Story(self.asana_client, self.db_client, None, self.config, story_fields())
+
+        story.merge_table("Test_Task")
+
+        self.assertEqual(self.db_client.write.mock_calls, [
+            mock.call('''INSERT OR REPLACE INTO "stories" (id,created_at,target_id) '''
+                      '''SELECT id,created_at,target_id FROM "Test_Task";'''),
+            mock.call('''DROP TABLE "Test_Task";'''),
+            ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,9 @@
+import asana.error
+import asyncio
+import json
 import mock
+import threading
+import urllib.parse
 
 
 def project(id=1,
@@ -43,9 +48,130 @@ def task(id=2,
 def row(**kwargs):
     row = mock.MagicMock()
     column_definitions = []
-    row.__getitem__.side_effect = lambda i: kwargs.values()[i]
+    row.__getitem__.side_effect = lambda i: list(kwargs.values())[i]
     for k, v in kwargs.items():
         column_definitions.append((k, None, None, None, None, None, None))
         setattr(row, k, v)
     row.cursor_description = column_definitions
     return row
+
+class FakeEventsEndpoint(object):
+    """Stands in for the Asana client's events resource.
+
+    `pages` maps a sync token to the (events, next_sync_token, has_more) page
+    returned for it.  Unknown or missing tokens get a 412, as from Asana,
+    carrying `initial_sync_token`.
+    """
+
+    def __init__(self, pages, initial_sync_token="initial"):
+        self._pages = pages
+        self._initial_sync_token = initial_sync_token
+        self.queries = []
+
+    def get(self, query, **options):
+        self.queries.append(dict(query))
+        sync_token = query.get("sync")
+        if sync_token not in self._pages:
+            response = mock.Mock()
+            response.json.return_value = {"sync": self._initial_sync_token}
+            raise asana.error.InvalidTokenError(response)
+        events, next_sync_token, has_more = self._pages[sync_token]
+        return {"data": events, "sync": next_sync_token, "has_more": has_more}
+
+
+class FakeAsanaServer(object):
+    """An asyncio HTTP server that answers GET requests like the Asana API.
+
+    `collections` maps a path to the list of items returned for it, a page of
+    `limit` items at a time.  `objects` maps a path to a single object.  Other
+    paths get a 404.  The next `throttle` requests get a 429 asking to retry
+    after `retry_after` seconds, and every response is delayed by `delay`.
+    """
+
+    def __init__(self, collections=None, objects=None, delay=0):
+        self.collections = collections or {}
+        self.objects = objects or {}
+        self.delay = delay
+        self.throttle = 0
+        self.retry_after = 0
+        self.requests = []
+        self.num_connections = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self.base_url = "http://127.0.0.1:{}/api/1.0".format(port)
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def start_in_thread(self):
+        """Run the server on its own event loop in a background thread, for
+        testing blocking callers."""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), self._loop).result()
+
+    def stop_thread(self):
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _serve(self, reader, writer):
+        self.num_connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                while (await reader.readline()) not in (b"\r\n", b""):
+                    pass
+
+                target = request_line.split()[1].decode("latin-1")
+                self._in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self._in_flight)
+                try:
+                    await asyncio.sleep(self.delay)
+                    status, headers, payload = self._respond(target)
+                finally:
+                    self._in_flight -= 1
+
+                body = json.dumps(payload).encode("utf-8")
+                head = "HTTP/1.1 {}\r\nContent-Type: application/json\r\n".format(status)
+                for name, value in headers.items():
+                    head += "{}: {}\r\n".format(name, value)
+                head += "Content-Length: {}\r\n\r\n".format(len(body))
+                writer.write(head.encode("latin-1") + body)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, target):
+        url = urllib.parse.urlsplit(target)
+        path = url.path[len("/api/1.0"):]
+        query = dict(urllib.parse.parse_qsl(url.query))
+        self.requests.append((path, query))
+
+        if self.throttle > 0:
+            self.throttle -= 1
+            return (429, {"Retry-After": self.retry_after},
+                    {"errors": [{"message": "Rate limited"}]})
+        if path in self.objects:
+            return 200, {}, {"data": self.objects[path]}
+        if path in self.collections:
+            items = self.collections[path]
+            offset = int(query.get("offset", 0))
+            limit = int(query.get("limit", 100))
+            next_page = None
+            if offset + limit < len(items):
+                next_page = {"offset": str(offset + limit)}
+            return 200, {}, {"data": items[offset:offset + limit],
+                             "next_page": next_page}
+        return 404, {}, {"errors": [{"message": "Not found"}]}
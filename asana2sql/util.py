@@ -1,5 +1,148 @@
+import collections
+import concurrent.futures
+import functools
+import queue
 import re
+import threading
+import time
 
 
+WHITESPACE = re.compile(r"\s")
+NON_WORD = re.compile(r"\W")
+
+
+@functools.lru_cache(maxsize=1024)
 def sql_safe_name(name):
-    return re.sub("\W", "", re.sub("\s", "_", name))
+    return NON_WORD.sub("", WHITESPACE.sub("_", name))
+
+
+def index_name(table_name, column):
+    return sql_safe_name("{}_{}".format(table_name, column))
+
+
+def chunks(items, size):
+    """Lazily split an iterable into lists of at most `size` items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parallel_map(fn, items, concurrency=1):
+    """Lazily apply fn to each item, running up to `concurrency` calls at once
+    on a thread pool.
+
+    Results are yielded in the order of the input items regardless of the
+    order in which the calls complete, and at most `concurrency` calls are
+    in flight or buffered at any time.
+    """
+    if concurrency is None or concurrency <= 1:
+        for item in items:
+            yield fn(item)
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = collections.deque()
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= concurrency:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class StageTimes(object):
+    """Time a pipeline stage spent working and waiting on its neighbours."""
+
+    def __init__(self):
+        self.busy_seconds = 0.0
+        self.idle_seconds = 0.0
+
+
+_END = object()
+
+
+class _ProducerError(object):
+    def __init__(self, error):
+        self.error = error
+
+
+def pipelined(items, depth, producer_times=None, consumer_times=None):
+    """Iterate over items, producing them on a background thread.
+
+    The thread runs ahead of the consumer by at most `depth` items, so slow
+    producers (e.g. API calls) and slow consumers (e.g. database writes)
+    overlap while memory stays bounded.  With a depth of 0 or less items are
+    produced on the calling thread.
+
+    If given, producer_times and consumer_times accumulate the time each side
+    spent busy and idle, waiting on the other.  The consumer is busy between
+    receiving an item and asking for the next.
+    """
+    producer_times = producer_times or StageTimes()
+    consumer_times = consumer_times or StageTimes()
+
+    if depth is None or depth <= 0:
+        items = iter(items)
+        while True:
+            start = time.monotonic()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            producer_times.busy_seconds += time.monotonic() - start
+            consumer_times.idle_seconds += time.monotonic() - start
+            start = time.monotonic()
+            yield item
+            consumer_times.busy_seconds += time.monotonic() - start
+
+    pending = queue.Queue(depth)
+    stopped = threading.Event()
+
+    def put(item):
+        start = time.monotonic()
+        while not stopped.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        producer_times.idle_seconds += time.monotonic() - start
+
+    def produce():
+        try:
+            iterator = iter(items)
+            while not stopped.is_set():
+                start = time.monotonic()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                producer_times.busy_seconds += time.monotonic() - start
+                put(item)
+        except BaseException as e:
+            put(_ProducerError(e))
+        else:
+            put(_END)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            start = time.monotonic()
+            item = pending.get()
+            consumer_times.idle_seconds += time.monotonic() - start
+            if item is _END:
+                break
+            if isinstance(item, _ProducerError):
+                raise item.error
+            start = time.monotonic()
+            yield item
+            consumer_times.busy_seconds += time.monotonic() - start
+    finally:
+        stopped.set()
+        producer.join()
@@ -0,0 +1,103 @@
+import threading
+import time
+import unittest
+
+from asana2sql import util
+
+
+class SqlSafeNameTestCase(unittest.TestCase):
+    def test_sql_safe_name(self):
+        self.assertEqual(util.sql_safe_name("Test Project (2017)!"),
+                         "Test_Project_2017")
+
+
+class ParallelMapTestCase(unittest.TestCase):
+    def test_serial(self):
+        self.assertEqual(list(util.parallel_map(lambda x: x * 2, [1, 2, 3])),
+                         [2, 4, 6])
+
+    def test_parallel_preserves_order(self):
+        def slow_for_small(x):
+            time.sleep(0.01 * (5 - x))
+            return x
+
+        self.assertEqual(
+                list(util.parallel_map(slow_for_small, range(5), concurrency=5)),
+                [0, 1, 2, 3, 4])
+
+    def test_parallel_bounds_in_flight(self):
+        lock = threading.Lock()
+        in_flight = [0]
+        max_in_flight = [0]
+
+        def track(x):
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            time.sleep(0.005)
+            with lock:
+                in_flight[0] -= 1
+            return x
+
+        self.assertEqual(
+                list(util.parallel_map(track, range(20), concurrency=3)),
+                list(range(20)))
+        self.assertLessEqual(max_in_flight[0], 3)
+
+
+class PipelinedTestCase(unittest.TestCase):
+    def test_serial(self):
+        producer_times = util.StageTimes()
+        consumer_times = util.StageTimes()
+
+        self.assertEqual(
+                list(util.pipelined(range(3), 0, producer_times, consumer_times)),
+                [0, 1, 2])
+
+    def test_runs_producer_ahead(self):
+        produced = []
+
+        def produce():
+            for x in range(5):
+                produced.append(x)
+                yield x
+
+        consumed = []
+        for x in util.pipelined(produce(), 2):
+            time.sleep(0.02)
+            consumed.append(x)
+            # The producer runs ahead by at most the depth, plus the item it
+            # is blocked on handing over.
+            self.assertLessEqual(len(produced) - len(consumed), 3)
+
+        self.assertEqual(consumed, list(range(5)))
+
+    def test_times_stages(self):
+        def slow_produce():
+            for x in range(3):
+                time.sleep(0.02)
+                yield x
+
+        producer_times = util.StageTimes()
+        consumer_times = util.StageTimes()
+        list(util.pipelined(slow_produce(), 2, producer_times, consumer_times))
+
+        self.assertGreaterEqual(producer_times.busy_seconds, 0.05)
+        self.assertGreaterEqual(consumer_times.idle_seconds, 0.05)
+
+    def test_reraises_producer_error(self):
+        def failing_produce():
+            yield 1
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            list(util.pipelined(failing_produce(), 2))
+
+    def test_consumer_stops_early(self):
+        pages = util.pipelined(iter(range(100)), 1)
+        self.assertEqual(next(pages), 0)
+        pages.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,6 @@
+from asana2sql import util
 from asana2sql.cache import Cache
+from asana2sql.custom_field_catalog import CustomFieldCatalog
 
 PROJECTS_TABLE_NAME = "projects"
 CREATE_PROJECTS_TABLE = (
@@ -8,6 +10,8 @@ CREATE_PROJECTS_TABLE = (
         archived BOOLEAN NOT NULL);
         """)
 SELECT_PROJECTS = """SELECT * FROM "{table_name}";"""
+SELECT_PROJECTS_FOR_IDS = (
+        """SELECT * FROM "{table_name}" WHERE id IN ({ids});""")
 INSERT_PROJECT = (
         """INSERT OR REPLACE INTO "{table_name}" VALUES (?, ?, ?);""")
 
@@ -20,6 +24,8 @@ CREATE_PROJECT_MEMBERSHIPS_TABLE = (
         """)
 SELECT_PROJECT_MEMBERSHIPS = (
         """SELECT project_id FROM "{table_name}" WHERE task_id = ?;""")
+SELECT_PROJECT_MEMBERSHIPS_FOR_TASKS = (
+        """SELECT task_id, project_id FROM "{table_name}" WHERE task_id IN ({task_ids});""")
 INSERT_PROJECT_MEMBERSHIP = (
         """INSERT OR REPLACE INTO "{table_name}" VALUES (?, ?);""")
 DELETE_PROJECT_MEMBERSHIP = (
@@ -32,6 +38,8 @@ CREATE_USERS_TABLE = (
         name VARCHAR(1024));
         """)
 SELECT_USERS = 'SELECT * FROM "{table_name}";';
+SELECT_USERS_FOR_IDS = (
+        """SELECT * FROM "{table_name}" WHERE id IN ({ids});""")
 INSERT_USER = (
         """INSERT OR REPLACE INTO "{table_name}" VALUES (?, ?);""")
 
@@ -42,7 +50,9 @@ CREATE_FOLLOWERS_TABLE = (
         user_id INTEGER NOT NULL,
         PRIMARY KEY (task_id, user_id));
         """)
-SELECT_FOLLOWERS = 'SELECT * from "{table_name}" WHERE task_id = ?;';
+SELECT_FOLLOWERS = 'SELECT user_id from "{table_name}" WHERE task_id = ?;';
+SELECT_FOLLOWERS_FOR_TASKS = (
+        """SELECT task_id, user_id FROM "{table_name}" WHERE task_id IN ({task_ids});""")
 INSERT_FOLLOWER = (
         """INSERT OR REPLACE INTO "{table_name}" VALUES (?, ?);""")
 DELETE_FOLLOWER = (
@@ -55,6 +65,7 @@ CREATE_CUSTOM_FIELDS_TABLE = (
         name VARCHAR(1024),
         type INTEGER NOT NULL);
         """)
+SELECT_CUSTOM_FIELDS = """SELECT * FROM "{table_name}";"""
 INSERT_CUSTOM_FIELD = (
         """INSERT OR REPLACE INTO "{table_name}" VALUES (?, ?, ?);""")
 
@@ -68,13 +79,13 @@ CREATE_CUSTOM_FIELD_ENUM_VALUES_TABLE = (
         color VARCHAR(64) NOT NULL,
         PRIMARY KEY (custom_field_id, id));
         """)
-SELECT_CUSTOM_FIELD_ENUM_VALUES = """SELECT * FROM {table_name};"""
+SELECT_CUSTOM_FIELD_ENUM_VALUES = """SELECT * FROM "{table_name}";"""
 SELECT_CUSTOM_FIELD_ENUM_VALUES_FOR_CUSTOM_FIELD = (
         """SELECT * FROM {table_name} WHERE custom_field_id = ?;""")
 INSERT_CUSTOM_FIELD_ENUM_VALUE = (
         """INSERT OR REPLACE INTO "{table_name}" VALUES (?, ?, ?, ?, ?);""")
 DELETE_CUSTOM_FIELD_ENUM_VALUE = (
-        """DELETE FROM "{table_name}" WHERE id = ?;""")
+        """DELETE FROM "{table_name}" WHERE custom_field_id = ? AND id = ?;""")
 
 CUSTOM_FIELD_VALUES_TABLE_NAME = "custom_field_values"
 CREATE_CUSTOM_FIELD_VALUES_TABLE = (
@@ -88,16 +99,94 @@ CREATE_CUSTOM_FIELD_VALUES_TABLE = (
         """)
 SELECT_CUSTOM_FIELD_VALUES_FOR_TASK = (
         "SELECT * FROM {table_name} WHERE task_id = ?;")
+SELECT_CUSTOM_FIELD_VALUES_FOR_TASKS = (
+        "SELECT * FROM {table_name} WHERE task_id IN ({task_ids});")
 INSERT_CUSTOM_FIELD_VALUE = (
         "INSERT OR REPLACE INTO {table_name} VALUES (?, ?, ?, ?, ?);")
 DELETE_CUSTOM_FIELD_VALUE = (
         "DELETE FROM {table_name} WHERE task_id = ? AND custom_field_id = ?;")
 
+SYNC_STATE_TABLE_NAME = "sync_state"
+CREATE_SYNC_STATE_TABLE = (
+        """CREATE TABLE IF NOT EXISTS "{table_name}" (
+        project_id INTEGER NOT NULL PRIMARY KEY,
+        modified_at VARCHAR(64));
+        """)
+SELECT_SYNC_STATE = (
+        """SELECT modified_at FROM "{table_name}" WHERE project_id = ?;""")
+INSERT_SYNC_STATE = (
+        """INSERT OR REPLACE INTO "{table_name}" VALUES (?, ?);""")
+
+EVENT_SYNC_TOKENS_TABLE_NAME = "event_sync_tokens"
+CREATE_EVENT_SYNC_TOKENS_TABLE = (
+        """CREATE TABLE IF NOT EXISTS "{table_name}" (
+        project_id INTEGER NOT NULL PRIMARY KEY,
+        sync_token VARCHAR(1024));
+        """)
+SELECT_EVENT_SYNC_TOKEN = (
+        """SELECT sync_token FROM "{table_name}" WHERE project_id = ?;""")
+INSERT_EVENT_SYNC_TOKEN = (
+        """INSERT OR REPLACE INTO "{table_name}" VALUES (?, ?);""")
+
+ROW_FINGERPRINTS_TABLE_NAME = "row_fingerprints"
+CREATE_ROW_FINGERPRINTS_TABLE = (
+        """CREATE TABLE IF NOT EXISTS "{table_name}" (
+        tasks_table_name VARCHAR(1024) NOT NULL,
+        task_id INTEGER NOT NULL,
+        fingerprint VARCHAR(64) NOT NULL,
+        PRIMARY KEY (tasks_table_name, task_id));
+        """)
+SELECT_ROW_FINGERPRINTS_FOR_TASKS = (
+        """SELECT task_id, fingerprint FROM "{table_name}" WHERE tasks_table_name = ? AND task_id IN ({task_ids});""")
+INSERT_ROW_FINGERPRINT = (
+        """INSERT OR REPLACE INTO "{table_name}" VALUES (?, ?, ?);""")
+DELETE_ROW_FINGERPRINT = (
+        """DELETE FROM "{table_name}" WHERE tasks_table_name = ? AND task_id = ?;""")
+
+EXPORT_PROGRESS_TABLE_NAME = "export_progress"
+CREATE_EXPORT_PROGRESS_TABLE = (
+        """CREATE TABLE IF NOT EXISTS "{table_name}" (
+        project_id INTEGER NOT NULL PRIMARY KEY,
+        pages_done INTEGER NOT NULL,
+        completed BOOLEAN NOT NULL);
+        """)
+SELECT_EXPORT_PROGRESS = (
+        """SELECT pages_done, completed FROM "{table_name}" WHERE project_id = ?;""")
+INSERT_EXPORT_PROGRESS = (
+        """INSERT OR REPLACE INTO "{table_name}" VALUES (?, ?, ?);""")
+DELETE_EXPORT_PROGRESS = (
+        """DELETE FROM "{table_name}" WHERE project_id = ?;""")
+
+EXPORTED_TASKS_TABLE_NAME = "exported_tasks"
+CREATE_EXPORTED_TASKS_TABLE = (
+        """CREATE TABLE IF NOT EXISTS "{table_name}" (
+        project_id INTEGER NOT NULL,
+        task_id INTEGER NOT NULL,
+        name VARCHAR(1024),
+        stories_done BOOLEAN NOT NULL,
+        PRIMARY KEY (project_id, task_id));
+        """)
+SELECT_EXPORTED_TASKS = (
+        """SELECT task_id, name, stories_done FROM "{table_name}" WHERE project_id = ?;""")
+INSERT_EXPORTED_TASK = (
+        """INSERT OR REPLACE INTO "{table_name}" VALUES (?, ?, ?, ?);""")
+UPDATE_EXPORTED_TASK_STORIES = (
+        """UPDATE "{table_name}" SET stories_done = 1 WHERE project_id = ? AND task_id = ?;""")
+DELETE_EXPORTED_TASKS = (
+        """DELETE FROM "{table_name}" WHERE project_id = ?;""")
+
+CREATE_INDEX = (
+        """CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table_name}" ({column});""")
+
 SELECT_TEMPLATE = (
         """SELECT {columns} FROM "{table_name}";""")
 SELECT_WHERE_TEMPLATE = (
         """SELECT {columns} FROM "{table_name}" WHERE {where};""")
 
+# Maximum number of task ids bound into a single IN (...) prefetch query.
+# SQLite limits a statement to 999 parameters.
+PREFETCH_CHUNK_SIZE = 500
+
 class Workspace(object):
     """Abstraction around all the supporting values for a project that are
     global to the workspace, such as users and custom fields."""
@@ -105,27 +194,55 @@ class Workspace(object):
     # TODO: Read and cache the database values so we know what needs updates
     # and can avoid unnecessary database calls.
 
-    def __init__(self, asana_client, db_client, config):
+    def __init__(self, asana_client, db_client, config, shared_db_client=None):
         self._asana_client = asana_client
         self._db_client = db_client
+        # Writes to the tables shared by every project (projects, users and
+        # custom fields) go through this client, which may defer them.
+        self._shared_db_client = shared_db_client or db_client
         self._config = config
         self._cache = {}
-        self._custom_fields_written = set()
 
+        # Relation rows prefetched for a batch of tasks, keyed by relation
+        # name and then by task_id.
+        self._prefetched = {}
+
+        # Tasks whose rows, and whose stories, have already been written this
+        # run, so tasks multihomed in several projects are only handled once.
+        self._claimed_task_ids = set()
+        self._claimed_story_task_ids = set()
+
+        # With a cache_size, the projects and users are loaded on demand and
+        # only the most recently used are kept.
+        cache_size = vars(self._config).get("cache_size")
         self.projects = Cache(
                 self._fetch_all_fn(SELECT_PROJECTS, self.projects_table_name()),
                 self._insert_fn(INSERT_PROJECT, self.projects_table_name(),
-                    ["id", "name", "archived"]))
+                    ["id", "name", "archived"]),
+                lookup_fn=self._fetch_ids_fn(
+                    SELECT_PROJECTS_FOR_IDS, self.projects_table_name()),
+                max_size=cache_size,
+                columns=["id", "name", "archived"])
         self.users = Cache(
                 self._fetch_all_fn(SELECT_USERS, self.users_table_name()),
                 self._insert_fn(INSERT_USER, self.users_table_name(),
-                    ["id", "name"]))
-        self.custom_field_enum_values = Cache(
+                    ["id", "name"]),
+                lookup_fn=self._fetch_ids_fn(
+                    SELECT_USERS_FOR_IDS, self.users_table_name()),
+                max_size=cache_size,
+                columns=["id", "name"])
+        self.custom_fields = CustomFieldCatalog(
+                self._fetch_all_fn(SELECT_CUSTOM_FIELDS,
+                    self.custom_fields_table_name()),
                 self._fetch_all_fn(SELECT_CUSTOM_FIELD_ENUM_VALUES,
                     self.custom_field_enum_values_table_name()),
-                self._insert_fn(INSERT_CUSTOM_FIELD_ENUM_VALUE,
-                    self.custom_field_enum_values_table_name(),
-                    ["custom_field_id", "id", "name", "enabled", "color"]))
+                self.get_custom_field,
+                self._write_fn(INSERT_CUSTOM_FIELD,
+                    self.custom_fields_table_name()),
+                self._write_fn(INSERT_CUSTOM_FIELD_ENUM_VALUE,
+                    self.custom_field_enum_values_table_name()),
+                self._write_fn(DELETE_CUSTOM_FIELD_ENUM_VALUE,
+                    self.custom_field_enum_values_table_name()))
 
     def projects_table_name(self):
         return self._config.projects_table_name or PROJECTS_TABLE_NAME
@@ -148,6 +265,21 @@ class Workspace(object):
     def custom_field_values_table_name(self):
         return self._config.custom_field_values_table_name or CUSTOM_FIELD_VALUES_TABLE_NAME
 
+    def sync_state_table_name(self):
+        return self._config.sync_state_table_name or SYNC_STATE_TABLE_NAME
+
+    def event_sync_tokens_table_name(self):
+        return self._config.event_sync_tokens_table_name or EVENT_SYNC_TOKENS_TABLE_NAME
+
+    def row_fingerprints_table_name(self):
+        return self._config.row_fingerprints_table_name or ROW_FINGERPRINTS_TABLE_NAME
+
+    def export_progress_table_name(self):
+        return self._config.export_progress_table_name or EXPORT_PROGRESS_TABLE_NAME
+
+    def exported_tasks_table_name(self):
+        return self._config.exported_tasks_table_name or EXPORTED_TASKS_TABLE_NAME
+
     def create_tables(self):
         self._db_client.write(
                 CREATE_PROJECTS_TABLE.format(
@@ -170,12 +302,59 @@ class Workspace(object):
         self._db_client.write(
                 CREATE_CUSTOM_FIELD_VALUES_TABLE.format(
                     table_name=self.custom_field_values_table_name()))
+        self._db_client.write(
+                CREATE_SYNC_STATE_TABLE.format(
+                    table_name=self.sync_state_table_name()))
+        self._db_client.write(
+                CREATE_EVENT_SYNC_TOKENS_TABLE.format(
+                    table_name=self.event_sync_tokens_table_name()))
+        self._db_client.write(
+                CREATE_ROW_FINGERPRINTS_TABLE.format(
+                    table_name=self.row_fingerprints_table_name()))
+        self._db_client.write(
+                CREATE_EXPORT_PROGRESS_TABLE.format(
+                    table_name=self.export_progress_table_name()))
+        self._db_client.write(
+                CREATE_EXPORTED_TASKS_TABLE.format(
+                    table_name=self.exported_tasks_table_name()))
+        self.create_indexes()
+
+    def indexes(self):
+        """The (table name, column) pairs of the secondary indexes.
+
+        Lookups by task_id, and by the leading column of any other primary
+        key, are already served by the primary key.
+        """
+        return [(self.project_memberships_table_name(), "project_id")]
+
+    def create_indexes(self):
+        for table_name, column in self.indexes():
+            self._db_client.write(
+                    CREATE_INDEX.format(
+                        index_name=util.index_name(table_name, column),
+                        table_name=table_name,
+                        column=column))
 
     def _fetch_all_fn(self, SQL, table_name):
         return lambda: self._db_client.read(SQL.format(table_name=table_name))
 
+    def _fetch_ids_fn(self, SQL, table_name):
+        def fetch(ids):
+            rows = []
+            for chunk in util.chunks(ids, PREFETCH_CHUNK_SIZE):
+                rows.extend(self._db_client.read(
+                        SQL.format(table_name=table_name,
+                                   ids=",".join("?" for _ in chunk)),
+                        *chunk))
+            return rows
+        return fetch
+
+    def _write_fn(self, SQL, table_name):
+        return lambda *params: self._shared_db_client.write(
+                SQL.format(table_name=table_name), *params)
+
     def _insert_fn(self, SQL, table_name, column_keys):
-        return lambda obj: self._db_client.write(
+        return lambda obj: self._shared_db_client.write(
                 SQL.format(table_name=table_name),
                 *[obj[key] for key in column_keys])
 
@@ -199,8 +378,99 @@ class Workspace(object):
                     SELECT_TEMPLATE.format(
                     table_name=PROJECTS_TABLE_NAME,
                     columns=",".join(field_names)))]
+    # Run-level deduplication
+    def task_claimed(self, task_id):
+        """Whether the task was already written this run."""
+        return task_id in self._claimed_task_ids
+
+    def claim_task(self, task_id):
+        """Returns True if the task hasn't been written yet this run, and
+        marks it as written."""
+        if task_id in self._claimed_task_ids:
+            return False
+        self._claimed_task_ids.add(task_id)
+        return True
+
+    def claim_task_stories(self, task_id):
+        """Returns True if the task's stories haven't been written yet this
+        run, and marks them as written."""
+        if task_id in self._claimed_story_task_ids:
+            return False
+        self._claimed_story_task_ids.add(task_id)
+        return True
+
+    # Prefetching
+    def prefetch_task_references(self, tasks):
+        """Load the users and projects the given tasks refer to with one
+        query per table, when they are cached on demand."""
+        user_ids = []
+        project_ids = []
+        for task in tasks:
+            if task.get("assignee"):
+                user_ids.append(task["assignee"]["id"])
+            user_ids.extend(follower["id"] for follower in task.get("followers") or [])
+            project_ids.extend(project["id"] for project in task.get("projects") or [])
+        self.users.prefetch(user_ids)
+        self.projects.prefetch(project_ids)
+
+    def prefetch_task_relations(self, task_ids):
+        """Load the followers, project memberships and custom field values
+        of all the given tasks with one query per table (per chunk of
+        PREFETCH_CHUNK_SIZE ids).
+
+        Subsequent per-task lookups are served from memory.  Each prefetched
+        entry is consumed by its first lookup, so a task diffed twice falls
+        back to reading the database and sees its own writes.
+        """
+        task_ids = list(task_ids)
+        followers = {task_id: set() for task_id in task_ids}
+        memberships = {task_id: [] for task_id in task_ids}
+        custom_field_values = {task_id: [] for task_id in task_ids}
+
+        for row in self._read_for_tasks(
+                SELECT_FOLLOWERS_FOR_TASKS, self.followers_table_name(), task_ids):
+            followers[row[0]].add(row[1])
+        for row in self._read_for_tasks(
+                SELECT_PROJECT_MEMBERSHIPS_FOR_TASKS,
+                self.project_memberships_table_name(), task_ids):
+            memberships[row[0]].append(row[1])
+        for row in self._read_for_tasks(
+                SELECT_CUSTOM_FIELD_VALUES_FOR_TASKS,
+                self.custom_field_values_table_name(), task_ids):
+            custom_field_values[row.task_id].append(row)
+
+        self._prefetched = {
+                "followers": followers,
+                "memberships": memberships,
+                "custom_field_values": custom_field_values,
+                }
+
+    def clear_prefetched(self):
+        self._prefetched = {}
+
+    def _read_for_tasks(self, SQL, table_name, task_ids, *params):
+        """Runs SQL once per chunk of task_ids, binding params followed by
+        the chunk's ids."""
+        rows = []
+        for start in range(0, len(task_ids), PREFETCH_CHUNK_SIZE):
+            chunk = task_ids[start:start + PREFETCH_CHUNK_SIZE]
+            rows.extend(self._db_client.read(
+                    SQL.format(
+                        table_name=table_name,
+                        task_ids=",".join("?" for _ in chunk)),
+                    *(list(params) + chunk)))
+        return rows
+
+    def _take_prefetched(self, relation, task_id):
+        """Returns and forgets the prefetched rows for the task, or None if
+        they were not prefetched."""
+        return self._prefetched.get(relation, {}).pop(task_id, None)
+
     # Followers
     def get_followers(self, task_id):
+        prefetched = self._take_prefetched("followers", task_id)
+        if prefetched is not None:
+            return prefetched
         return {row[0] for row in self._db_client.read(
                 SELECT_FOLLOWERS.format(table_name=self.followers_table_name()), task_id)}
 
@@ -220,6 +490,9 @@ class Workspace(object):
 
     # Task Membership
     def task_memberships(self, task_id):
+        prefetched = self._take_prefetched("memberships", task_id)
+        if prefetched is not None:
+            return prefetched
         return [row[0] for row in self._db_client.read(
                 SELECT_PROJECT_MEMBERSHIPS.format(
                     table_name=self.project_memberships_table_name()),
@@ -240,66 +513,24 @@ class Workspace(object):
 
     # Custom fields
     def add_custom_field(self, custom_field_value):
-        """Adds a custom field to the database.
+        """Adds a custom field to the database if its definition changed.
 
         NB: This depends on the data for the custom field being available in
         the custom_field_value parameter, which is true if custom_fields are
         fetched via the task API.
         """
-        if custom_field_value["id"] in self._custom_fields_written:
-            return
-
-        self._db_client.write(
-                INSERT_CUSTOM_FIELD.format(
-                    table_name=self.custom_fields_table_name()),
-                custom_field_value["id"],
-                custom_field_value["name"],
-                custom_field_value["type"]);
-
-        if custom_field_value["type"] == "enum":
-            self.add_custom_field_enum_values(custom_field_value["id"])
-
-        self._custom_fields_written.add(custom_field_value["id"])
+        self.custom_fields.add(custom_field_value)
 
     def get_custom_field(self, custom_field_id):
         # NB: The python client doesn't support custom fields yet, so we have
         # to fetch manually.
         return self._asana_client.get("/custom_fields/{}".format(custom_field_id), "")
 
-    # Custom field enum values
-    def add_custom_field_enum_values(self, custom_field_id):
-        custom_field_def = self.get_custom_field(custom_field_id)
-        new_enum_options = custom_field_def.get("enum_options", [])
-
-        old_enum_options = {row.id: row
-                for row in self.custom_field_enum_values.get(custom_field_id) or []}
-
-        for enum_option in new_enum_options:
-            if enum_option["id"] in old_enum_options:
-                old_option = old_enum_options[enum_option["id"]]
-                del(old_enum_options[enum_option["id"]])
-                if (old_option.name == enum_option["name"] and
-                    old_option.enabled == enum_option["enabled"] and
-                    old_option.color == enum_option["color"]):
-                        continue;
-
-            self._db_client.write(
-                    INSERT_CUSTOM_FIELD_ENUM_VALUE.format(
-                        table_name=self.custom_field_enum_values_table_name()),
-                    custom_field_id,
-                    enum_option["id"],
-                    enum_option["name"],
-                    enum_option["enabled"],
-                    enum_option["color"])
-
-        for id in old_enum_options.keys():
-            self._db_client.write(
-                    DELETE_CUSTOM_FIELD_ENUM_VALUE.format(
-                        table_name=self.custom_field_enum_values_table_name()),
-                    id)
-
     # Custom field values
     def task_custom_field_values(self, task_id):
+        prefetched = self._take_prefetched("custom_field_values", task_id)
+        if prefetched is not None:
+            return prefetched
         return self._db_client.read(
                     SELECT_CUSTOM_FIELD_VALUES_FOR_TASK.format(
                         table_name=self.custom_field_values_table_name()),
@@ -325,3 +556,122 @@ class Workspace(object):
                 task_id,
                 custom_field_id)
 
+    # Sync state
+    def get_sync_watermark(self, project_id):
+        """Returns the highest task modified_at recorded for the project by a
+        previous export, or None."""
+        rows = self._db_client.read(
+                SELECT_SYNC_STATE.format(
+                    table_name=self.sync_state_table_name()),
+                project_id)
+        return rows[0][0] if rows else None
+
+    def set_sync_watermark(self, project_id, modified_at):
+        self._db_client.write(
+                INSERT_SYNC_STATE.format(
+                    table_name=self.sync_state_table_name()),
+                project_id,
+                modified_at)
+
+    # Event sync tokens
+    def get_event_sync_token(self, project_id):
+        """Returns the Asana events sync token stored for the project, or
+        None."""
+        rows = self._db_client.read(
+                SELECT_EVENT_SYNC_TOKEN.format(
+                    table_name=self.event_sync_tokens_table_name()),
+                project_id)
+        return rows[0][0] if rows else None
+
+    def set_event_sync_token(self, project_id, sync_token):
+        self._db_client.write(
+                INSERT_EVENT_SYNC_TOKEN.format(
+                    table_name=self.event_sync_tokens_table_name()),
+                project_id,
+                sync_token)
+
+    # Export progress
+    def get_export_progress(self, project_id):
+        """Returns (pages_done, completed) as recorded by the last export of
+        the project that tracked its progress, or None."""
+        rows = self._db_client.read(
+                SELECT_EXPORT_PROGRESS.format(
+                    table_name=self.export_progress_table_name()),
+                project_id)
+        return (rows[0][0], bool(rows[0][1])) if rows else None
+
+    def get_exported_tasks(self, project_id):
+        """Returns (task_id, name, stories_done) for each task recorded as
+        exported by the last export of the project."""
+        return [(row[0], row[1], bool(row[2])) for row in self._db_client.read(
+                SELECT_EXPORTED_TASKS.format(
+                    table_name=self.exported_tasks_table_name()),
+                project_id)]
+
+    def record_exported_page(self, project_id, pages_done, tasks):
+        """Record that the project's tasks up to and including the
+        pages_done'th page have been written."""
+        for task in tasks:
+            self._db_client.write(
+                    INSERT_EXPORTED_TASK.format(
+                        table_name=self.exported_tasks_table_name()),
+                    project_id,
+                    task.get("id"),
+                    task.get("name"),
+                    False)
+        self._db_client.write(
+                INSERT_EXPORT_PROGRESS.format(
+                    table_name=self.export_progress_table_name()),
+                project_id,
+                pages_done,
+                False)
+
+    def record_exported_stories(self, project_id, task_id):
+        self._db_client.write(
+                UPDATE_EXPORTED_TASK_STORIES.format(
+                    table_name=self.exported_tasks_table_name()),
+                project_id,
+                task_id)
+
+    def complete_export(self, project_id, pages_done):
+        self._db_client.write(
+                INSERT_EXPORT_PROGRESS.format(
+                    table_name=self.export_progress_table_name()),
+                project_id,
+                pages_done,
+                True)
+
+    def clear_export_progress(self, project_id):
+        self._db_client.write(
+                DELETE_EXPORTED_TASKS.format(
+                    table_name=self.exported_tasks_table_name()),
+                project_id)
+        self._db_client.write(
+                DELETE_EXPORT_PROGRESS.format(
+                    table_name=self.export_progress_table_name()),
+                project_id)
+
+    # Row fingerprints
+    def get_row_fingerprints(self, tasks_table_name, task_ids):
+        """Returns the stored fingerprints of the given tasks' rows, keyed by
+        task id.  Rows without a fingerprint are omitted."""
+        return {row[0]: row[1] for row in self._read_for_tasks(
+                SELECT_ROW_FINGERPRINTS_FOR_TASKS,
+                self.row_fingerprints_table_name(),
+                list(task_ids),
+                tasks_table_name)}
+
+    def set_row_fingerprint(self, tasks_table_name, task_id, fingerprint):
+        self._db_client.write(
+                INSERT_ROW_FINGERPRINT.format(
+                    table_name=self.row_fingerprints_table_name()),
+                tasks_table_name,
+                task_id,
+                fingerprint)
+
+    def remove_row_fingerprint(self, tasks_table_name, task_id):
+        self._db_client.write(
+                DELETE_ROW_FINGERPRINT.format(
+                    table_name=self.row_fingerprints_table_name()),
+                tasks_table_name,
+                task_id)
@@ -20,6 +20,11 @@ class WorkspaceTestCase(unittest.TestCase):
         self.config.custom_fields_table_name = None
         self.config.custom_field_enum_values_table_name = None
         self.config.custom_field_values_table_name = None
+        self.config.sync_state_table_name = None
+        self.config.event_sync_tokens_table_name = None
+        self.config.row_fingerprints_table_name = None
+        self.config.export_progress_table_name = None
+        self.config.exported_tasks_table_name = None
 
     def test_default_table_names(self):
         ws = Workspace(self.client, self.db_client, self.config)
@@ -83,8 +88,38 @@ class WorkspaceTestCase(unittest.TestCase):
             mock.call.write(
                 workspace.CREATE_CUSTOM_FIELD_VALUES_TABLE.format(
                     table_name=workspace.CUSTOM_FIELD_VALUES_TABLE_NAME)),
+            mock.call.write(
+                workspace.CREATE_SYNC_STATE_TABLE.format(
+                    table_name=workspace.SYNC_STATE_TABLE_NAME)),
+            mock.call.write(
+                workspace.CREATE_EVENT_SYNC_TOKENS_TABLE.format(
+                    table_name=workspace.EVENT_SYNC_TOKENS_TABLE_NAME)),
+            mock.call.write(
+                workspace.CREATE_ROW_FINGERPRINTS_TABLE.format(
+                    table_name=workspace.ROW_FINGERPRINTS_TABLE_NAME)),
+            mock.call.write(
+                workspace.CREATE_EXPORT_PROGRESS_TABLE.format(
+                    table_name=workspace.EXPORT_PROGRESS_TABLE_NAME)),
+            mock.call.write(
+                workspace.CREATE_EXPORTED_TASKS_TABLE.format(
+                    table_name=workspace.EXPORTED_TASKS_TABLE_NAME)),
+            mock.call.write(
+                workspace.CREATE_INDEX.format(
+                    index_name="project_memberships_project_id",
+                    table_name=workspace.PROJECT_MEMBERSHIPS_TABLE_NAME,
+                    column="project_id")),
         ], any_order=True)
 
+    def test_create_indexes(self):
+        self.config.project_memberships_table_name = "custom project_memberships"
+        ws = Workspace(self.client, self.db_client, self.config)
+
+        ws.create_indexes()
+
+        self.db_client.write.assert_called_once_with(
+                '''CREATE INDEX IF NOT EXISTS "custom_project_memberships_project_id" '''
+                '''ON "custom project_memberships" (project_id);''')
+
     def test_add_new_user(self):
         self.db_client.read.return_value = [fixtures.row(id=1, name="foo")]
 
@@ -163,6 +198,116 @@ class WorkspaceTestCase(unittest.TestCase):
                             table_name=workspace.FOLLOWERS_TABLE_NAME),
                         (1, 2))
 
+    def test_prefetch_task_relations(self):
+        follower_rows = [(1, 10), (1, 11)]
+        membership_rows = [(2, 20)]
+        custom_field_value_rows = [fixtures.row(task_id=1, custom_field_id=30)]
+        self.db_client.read.side_effect = [
+                follower_rows, membership_rows, custom_field_value_rows]
+
+        ws = Workspace(self.client, self.db_client, self.config)
+
+        ws.prefetch_task_relations([1, 2])
+
+        self.assertEqual(self.db_client.read.call_count, 3)
+        self.db_client.read.assert_any_call(
+                workspace.SELECT_FOLLOWERS_FOR_TASKS.format(
+                    table_name=workspace.FOLLOWERS_TABLE_NAME,
+                    task_ids="?,?"),
+                1, 2)
+
+        self.assertEqual(ws.get_followers(1), {10, 11})
+        self.assertEqual(ws.get_followers(2), set())
+        self.assertEqual(ws.task_memberships(1), [])
+        self.assertEqual(ws.task_memberships(2), [20])
+        self.assertEqual(ws.task_custom_field_values(1), custom_field_value_rows)
+        self.assertEqual(ws.task_custom_field_values(2), [])
+
+        self.assertEqual(self.db_client.read.call_count, 3)
+
+        # Prefetched entries are consumed by their first lookup.
+        self.db_client.read.side_effect = None
+        self.db_client.read.return_value = [(12,)]
+        self.assertEqual(ws.get_followers(1), {12})
+        self.assertEqual(self.db_client.read.call_count, 4)
+
+    def test_claim_task(self):
+        ws = Workspace(self.client, self.db_client, self.config)
+
+        self.assertFalse(ws.task_claimed(1))
+        self.assertTrue(ws.claim_task(1))
+        self.assertTrue(ws.task_claimed(1))
+        self.assertFalse(ws.claim_task(1))
+
+        # Stories are claimed separately from the task rows.
+        self.assertTrue(ws.claim_task_stories(1))
+        self.assertFalse(ws.claim_task_stories(1))
+
+    def test_record_export_progress(self):
+        ws = Workspace(self.client, self.db_client, self.config)
+
+        ws.record_exported_page(1234, 2, [fixtures.task(id=5, name="five")])
+        ws.record_exported_stories(1234, 5)
+        ws.complete_export(1234, 2)
+
+        self.db_client.write.assert_has_calls([
+            mock.call(workspace.INSERT_EXPORTED_TASK.format(
+                table_name=workspace.EXPORTED_TASKS_TABLE_NAME),
+                1234, 5, "five", False),
+            mock.call(workspace.INSERT_EXPORT_PROGRESS.format(
+                table_name=workspace.EXPORT_PROGRESS_TABLE_NAME),
+                1234, 2, False),
+            mock.call(workspace.UPDATE_EXPORTED_TASK_STORIES.format(
+                table_name=workspace.EXPORTED_TASKS_TABLE_NAME),
+                1234, 5),
+            mock.call(workspace.INSERT_EXPORT_PROGRESS.format(
+                table_name=workspace.EXPORT_PROGRESS_TABLE_NAME),
+                1234, 2, True)])
+
+    def test_get_export_progress(self):
+        ws = Workspace(self.client, self.db_client, self.config)
+
+        self.db_client.read.return_value = []
+        self.assertIsNone(ws.get_export_progress(1234))
+
+        self.db_client.read.return_value = [(3, 1)]
+        self.assertEqual(ws.get_export_progress(1234), (3, True))
+        self.db_client.read.assert_called_with(
+                workspace.SELECT_EXPORT_PROGRESS.format(
+                    table_name=workspace.EXPORT_PROGRESS_TABLE_NAME),
+                1234)
+
+    def test_shared_table_writes_use_shared_client(self):
+        self.db_client.read.return_value = []
+        shared_db_client = mock.Mock()
+
+        ws = Workspace(self.client, self.db_client, self.config,
+                       shared_db_client=shared_db_client)
+
+        ws.add_user(fixtures.user(id=1, name="foo"))
+
+        self.db_client.write.assert_not_called()
+        shared_db_client.write.assert_called_once_with(
+                workspace.INSERT_USER.format(
+                    table_name=workspace.USERS_TABLE_NAME),
+                1, "foo")
+
+    def test_bounded_user_cache(self):
+        self.config.cache_size = 10
+        self.db_client.read.return_value = [fixtures.row(id=1, name="foo")]
+
+        ws = Workspace(self.client, self.db_client, self.config)
+
+        ws.prefetch_task_references([
+            {"id": 5, "assignee": {"id": 1}, "followers": [{"id": 2}]}])
+        ws.add_user(fixtures.user(id=1, name="foo"))
+
+        self.db_client.read.assert_any_call(
+                workspace.SELECT_USERS_FOR_IDS.format(
+                    table_name=workspace.USERS_TABLE_NAME, ids="?,?"),
+                1, 2)
+        self.db_client.write.assert_not_called()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""Runs asana2sql.py and sql2asana.py end to end against a fake Asana
+server (see fake_asana.py) and a temporary SQLite database, and reports the
+wall time, API requests and SQL commands of each step.
+
+The scripts run as they would in production, in subprocesses connecting
+through pyodbc, so the SQLite ODBC driver must be installed; pass
+--odbc_template if it isn't registered as "SQLite3".
+
+Usage: python benchmarks/end_to_end.py [--projects N] [--tasks_per_project N]
+           [--latency_ms MS] [--extra_args "--api_concurrency 8 ..."]
+           [--import_args "..."] [--json FILE]
+"""
+
+import argparse
+import json
+import os
+import shlex
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_asana
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ASANA2SQL = os.path.join(ROOT, "asana2sql.py")
+SQL2ASANA = os.path.join(ROOT, "sql2asana.py")
+
+TASKS_TABLE = "tasks"
+STORIES_TABLE = "stories"
+
+
+class Runner(object):
+    """Runs the scripts against one server and database, recording the
+    figures of each step."""
+
+    def __init__(self, server, db_path, odbc_template, extra_args, import_args,
+                 tmp_dir):
+        self._server = server
+        self._db_path = db_path
+        self._odbc_template = odbc_template
+        self._extra_args = {ASANA2SQL: extra_args, SQL2ASANA: import_args}
+        self._tmp_dir = tmp_dir
+        self.results = []
+
+    def _command(self, script, scope, command_args, db_path=None,
+                 tasks_table=True):
+        command = [sys.executable, script,
+                   "--access_token", "benchmark",
+                   "--base_url", self._server.base_url,
+                   "--odbc_string", self._odbc_template.format(
+                       path=db_path or self._db_path),
+                   "--stories_table_name", STORIES_TABLE]
+        if tasks_table:
+            command += ["--table_name", TASKS_TABLE]
+        return command + scope + self._extra_args[script] + command_args
+
+    def run(self, step, commands):
+        """Run the commands in turn as one step."""
+        self._server.reset_counts()
+        totals = {"step": step, "seconds": 0.0, "api_requests": 0,
+                  "db_reads": 0, "db_writes": 0, "db_executed": 0,
+                  "db_commits": 0}
+        perf_json = os.path.join(self._tmp_dir, "perf.json")
+        # The fake server speaks plain http, which OAuth refuses by default.
+        env = dict(os.environ, OAUTHLIB_INSECURE_TRANSPORT="1")
+
+        for command in commands:
+            command = command[:2] + ["--perf_json", perf_json] + command[2:]
+            start = time.perf_counter()
+            process = subprocess.run(command, stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE, universal_newlines=True,
+                                     env=env)
+            totals["seconds"] += time.perf_counter() - start
+            if process.returncode != 0:
+                raise RuntimeError("{} failed:\n{}".format(
+                    " ".join(command), process.stderr))
+
+            with open(perf_json) as perf_file:
+                perf = json.load(perf_file)
+            totals["db_reads"] += perf["db"]["reads"]
+            totals["db_writes"] += perf["db"]["writes"]
+            totals["db_executed"] += perf["db"]["executed"]
+            totals["db_commits"] += perf["db"]["commits"]
+
+        totals["api_requests"] = self._server.num_requests
+        totals["api_requests_by_endpoint"] = dict(self._server.request_counts)
+        self.results.append(totals)
+        return totals
+
+    def export_steps(self):
+        source = ["--workspace_id", str(fake_asana.SOURCE_WORKSPACE_ID)]
+        self.run("create", [self._command(
+            ASANA2SQL, source, ["--with_stories", "create"])])
+        self.run("export", [self._command(
+            ASANA2SQL, source, ["--with_subtasks", "--with_stories", "export"])])
+
+    def synchronize_steps(self, project_ids):
+        """Synchronize each project into its own tasks table, as synchronize
+        can't share one tasks table across a workspace, in a copy of the
+        database so the import sees the export untouched."""
+        sync_db_path = os.path.join(self._tmp_dir, "synchronize.db")
+        shutil.copyfile(self._db_path, sync_db_path)
+
+        def commands(command_args):
+            return [self._command(
+                ASANA2SQL, ["--project_id", str(project_id)], command_args,
+                db_path=sync_db_path, tasks_table=False)
+                for project_id in project_ids]
+
+        self.run("sync create", commands(["--with_stories", "create"]))
+        self.run("synchronize", commands(
+            ["--with_subtasks", "--with_stories", "synchronize"]))
+
+    def import_steps(self):
+        target = ["--workspace_id", str(fake_asana.TARGET_WORKSPACE_ID)]
+        self.run("import create", [self._command(SQL2ASANA, target, ["create"])])
+        self.run("import", [self._command(
+            SQL2ASANA, target, ["--with_stories", "import", "--import_all"])])
+
+    def count_rows(self, table_name):
+        with sqlite3.connect(self._db_path) as connection:
+            return connection.execute(
+                    'SELECT COUNT(*) FROM "{}";'.format(table_name)).fetchone()[0]
+
+
+def print_results(results):
+    print("{:<14} {:>9} {:>9} {:>9} {:>9} {:>9} {:>8}".format(
+        "step", "seconds", "requests", "reads", "writes", "executed", "commits"))
+    for result in results:
+        print("{step:<14} {seconds:>9.2f} {api_requests:>9} {db_reads:>9} "
+              "{db_writes:>9} {db_executed:>9} {db_commits:>8}".format(**result))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--projects", type=int, default=5)
+    parser.add_argument("--tasks_per_project", type=int, default=100)
+    parser.add_argument("--subtask_depth", type=int, default=1)
+    parser.add_argument("--subtasks_per_task", type=int, default=2)
+    parser.add_argument("--stories_per_task", type=int, default=3)
+    parser.add_argument("--followers_per_task", type=int, default=2)
+    parser.add_argument("--custom_fields", type=int, default=3)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--multihoming", type=float, default=0.1,
+                        help="Fraction of tasks also in a second project.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency_ms", type=float, default=0,
+                        help="Delay every API response by this much.")
+    parser.add_argument("--extra_args", default="",
+                        help="Options passed to every asana2sql.py run.")
+    parser.add_argument("--import_args", default="",
+                        help="Options passed to every sql2asana.py run.")
+    parser.add_argument("--odbc_template", default="Driver=SQLite3;Database={path}")
+    parser.add_argument("--skip_import", action="store_true", default=False)
+    parser.add_argument("--json", metavar="FILE",
+                        help="Also write the results to FILE as JSON.")
+    args = parser.parse_args()
+
+    workspace = fake_asana.SyntheticWorkspace(
+            projects=args.projects, tasks_per_project=args.tasks_per_project,
+            subtask_depth=args.subtask_depth,
+            subtasks_per_task=args.subtasks_per_task,
+            stories_per_task=args.stories_per_task,
+            followers_per_task=args.followers_per_task,
+            custom_fields=args.custom_fields, users=args.users,
+            multihoming=args.multihoming, seed=args.seed)
+    project_ids = list(workspace.workspace_projects[fake_asana.SOURCE_WORKSPACE_ID])
+    print("Synthetic workspace: {} projects, {} tasks, {} stories.".format(
+        len(project_ids), workspace.num_tasks, workspace.num_stories))
+
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            fake_asana.FakeAsanaServer(workspace, args.latency_ms / 1000.0) as server:
+        runner = Runner(server, os.path.join(tmp_dir, "benchmark.db"),
+                        args.odbc_template, shlex.split(args.extra_args),
+                        shlex.split(args.import_args), tmp_dir)
+        runner.export_steps()
+        exported = {"tasks": runner.count_rows(TASKS_TABLE),
+                    "stories": runner.count_rows(STORIES_TABLE)}
+        runner.synchronize_steps(project_ids)
+        if not args.skip_import:
+            runner.import_steps()
+
+    print_results(runner.results)
+    print("Exported rows: tasks = {tasks}, stories = {stories}".format(**exported))
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"options": vars(args), "exported": exported,
+                       "steps": runner.results}, json_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
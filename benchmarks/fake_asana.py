@@ -0,0 +1,440 @@
+"""A local, in-memory stand-in for the parts of the Asana API that
+asana2sql.py and sql2asana.py use, serving a synthetic workspace.
+
+    workspace = SyntheticWorkspace(projects=5, tasks_per_project=200)
+    with FakeAsanaServer(workspace, latency=0.05) as server:
+        ... --base_url server.base_url ...
+
+Only the endpoints the scripts call are implemented.  Objects are always
+returned in full; opt_fields is ignored.
+"""
+
+import collections
+import datetime
+import gzip
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from asana2sql import latency
+
+SOURCE_WORKSPACE_ID = 1
+TARGET_WORKSPACE_ID = 2
+ME_USER_ID = 100
+
+ENUM_COLORS = ["red", "green", "blue", "yellow"]
+EPOCH = datetime.datetime(2017, 1, 1)
+
+
+def _timestamp(seconds):
+    return (EPOCH + datetime.timedelta(seconds=seconds)).strftime(
+            "%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _compact(obj, keys=("id", "name")):
+    return {key: obj[key] for key in keys if key in obj}
+
+
+class SyntheticWorkspace(object):
+    """A randomly generated, but reproducible, workspace.
+
+    Every project has tasks_per_project top-level tasks.  Each task has
+    subtasks_per_task subtasks, nested subtask_depth levels deep, and
+    stories_per_task comments, followers_per_task followers and a value for
+    every one of the custom_fields.  A multihoming fraction of the tasks are
+    also in the next project.  A second, empty workspace is the target of
+    sql2asana imports.
+    """
+
+    def __init__(self, projects=5, tasks_per_project=100, subtask_depth=1,
+                 subtasks_per_task=2, stories_per_task=3, followers_per_task=2,
+                 custom_fields=3, users=20, multihoming=0.1, seed=0):
+        self._random = random.Random(seed)
+        self._next_id = 1000
+        self._clock = 0
+
+        self.workspaces = {
+            SOURCE_WORKSPACE_ID: {"id": SOURCE_WORKSPACE_ID, "name": "Source"},
+            TARGET_WORKSPACE_ID: {"id": TARGET_WORKSPACE_ID, "name": "Target"},
+        }
+        self.users = {ME_USER_ID: {"id": ME_USER_ID, "name": "Benchmark User"}}
+        self.projects = {}
+        self.tasks = {}
+        self.custom_fields = {}
+        # Parent id -> subtask ids, project id -> top-level task ids,
+        # task id -> story ids, workspace id -> project ids.
+        self.subtasks = collections.defaultdict(list)
+        self.project_tasks = collections.defaultdict(list)
+        self.task_stories = collections.defaultdict(list)
+        self.workspace_projects = collections.defaultdict(list)
+        self.stories = {}
+
+        for _ in range(users):
+            user = {"id": self.new_id(), "name": self._words(2)}
+            self.users[user["id"]] = user
+
+        for i in range(custom_fields):
+            self._add_custom_field(("text", "number", "enum")[i % 3])
+
+        for _ in range(projects):
+            self.add_project(SOURCE_WORKSPACE_ID, {"name": self._words(3)})
+
+        project_ids = list(self.workspace_projects[SOURCE_WORKSPACE_ID])
+        for index, project_id in enumerate(project_ids):
+            for _ in range(tasks_per_project):
+                memberships = [project_id]
+                if (len(project_ids) > 1 and
+                        self._random.random() < multihoming):
+                    memberships.append(project_ids[(index + 1) % len(project_ids)])
+                task = self._generate_task(memberships, None, followers_per_task)
+                self._generate_subtasks(task, subtask_depth, subtasks_per_task,
+                                        followers_per_task)
+                for task_id in [task["id"]] + self._descendants(task["id"]):
+                    for _ in range(stories_per_task):
+                        self.add_story(task_id, {"text": self._words(12)},
+                                       self._random.choice(list(self.users.values())))
+
+    @property
+    def num_tasks(self):
+        return len(self.tasks)
+
+    @property
+    def num_stories(self):
+        return len(self.stories)
+
+    def new_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    def _now(self):
+        self._clock += 60
+        return _timestamp(self._clock)
+
+    def _words(self, count):
+        return " ".join("".join(self._random.choice("abcdefghijklmnopqrstuvwxyz")
+                                for _ in range(self._random.randint(3, 9)))
+                        for _ in range(count))
+
+    def _descendants(self, task_id):
+        ids = []
+        for subtask_id in self.subtasks[task_id]:
+            ids.append(subtask_id)
+            ids.extend(self._descendants(subtask_id))
+        return ids
+
+    def _add_custom_field(self, field_type):
+        field = {"id": self.new_id(), "name": self._words(2), "type": field_type}
+        if field_type == "enum":
+            field["enum_options"] = [
+                {"id": self.new_id(), "name": self._words(1), "enabled": True,
+                 "color": color} for color in ENUM_COLORS]
+        self.custom_fields[field["id"]] = field
+
+    def _custom_field_value(self, field):
+        value = dict(field)
+        value["text_value"] = None
+        value["number_value"] = None
+        value["enum_value"] = None
+        if field["type"] == "text":
+            value["text_value"] = self._words(2)
+        elif field["type"] == "number":
+            value["number_value"] = self._random.randint(0, 1000)
+        else:
+            value["enum_value"] = self._random.choice(field["enum_options"])
+        return value
+
+    def _generate_task(self, project_ids, parent_id, num_followers):
+        users = list(self.users.values())
+        completed = self._random.random() < 0.3
+        created_at = self._now()
+        task = self.add_task({
+            "name": self._words(4),
+            "notes": self._words(20),
+            "completed": completed,
+            "due_on": (EPOCH + datetime.timedelta(
+                days=self._random.randint(0, 365))).strftime("%Y-%m-%d"),
+        }, project_ids)
+        task.update({
+            "created_at": created_at,
+            "modified_at": created_at,
+            "completed_at": created_at if completed else None,
+            "num_hearts": self._random.randint(0, 3),
+            "assignee": _compact(self._random.choice(users)),
+            "assignee_status": "upcoming",
+            "followers": [_compact(user) for user in
+                          self._random.sample(users, min(num_followers, len(users)))],
+            "custom_fields": [self._custom_field_value(field)
+                              for field in self.custom_fields.values()],
+        })
+        if parent_id:
+            self.set_parent(task["id"], parent_id)
+        return task
+
+    def _generate_subtasks(self, task, depth, count, num_followers):
+        if depth <= 0:
+            return
+        for _ in range(count):
+            subtask = self._generate_task([], task["id"], num_followers)
+            self._generate_subtasks(subtask, depth - 1, count, num_followers)
+
+    # Writes, also used by the server for sql2asana imports.
+    def add_project(self, workspace_id, data):
+        project = {"id": self.new_id(), "name": data.get("name"),
+                   "archived": bool(data.get("archived", False))}
+        self.projects[project["id"]] = project
+        self.workspace_projects[workspace_id].append(project["id"])
+        return project
+
+    def add_task(self, data, project_ids=()):
+        now = self._now()
+        task = {
+            "id": self.new_id(),
+            "name": data.get("name"),
+            "notes": data.get("notes"),
+            "completed": bool(data.get("completed", False)),
+            "completed_at": None,
+            "created_at": now,
+            "modified_at": now,
+            "due_on": data.get("due_on"),
+            "due_at": data.get("due_at"),
+            "num_hearts": 1 if data.get("hearted") else 0,
+            "assignee": None,
+            "assignee_status": data.get("assignee_status"),
+            "parent": None,
+            "projects": [],
+            "followers": [],
+            "custom_fields": [],
+        }
+        assignee = data.get("assignee")
+        if assignee and assignee != "null" and int(assignee) in self.users:
+            task["assignee"] = _compact(self.users[int(assignee)])
+        self.tasks[task["id"]] = task
+        for project_id in project_ids:
+            self.add_to_project(task["id"], project_id)
+        return task
+
+    def add_to_project(self, task_id, project_id):
+        task = self.tasks[task_id]
+        project = self.projects[project_id]
+        if any(membership["id"] == project_id for membership in task["projects"]):
+            return task
+        task["projects"].append(_compact(project, ("id", "name", "archived")))
+        self.project_tasks[project_id].append(task_id)
+        return task
+
+    def set_parent(self, task_id, parent_id):
+        task = self.tasks[task_id]
+        task["parent"] = _compact(self.tasks[parent_id])
+        self.subtasks[parent_id].append(task_id)
+        return task
+
+    def add_story(self, task_id, data, created_by=None):
+        task = self.tasks[task_id]
+        text = data.get("text") or ""
+        story = {
+            "id": self.new_id(),
+            "created_at": self._now(),
+            "created_by": _compact(created_by or self.users[ME_USER_ID]),
+            "num_hearts": 0,
+            "text": text,
+            "html_text": "<body>{}</body>".format(text),
+            "target": _compact(task),
+            "type": data.get("type") or "comment",
+        }
+        self.stories[story["id"]] = story
+        self.task_stories[task_id].append(story["id"])
+        return story
+
+
+class _NotFound(Exception):
+    pass
+
+
+class FakeAsanaServer(object):
+    """Serves a SyntheticWorkspace over HTTP on localhost, delaying every
+    response by `latency` seconds.  Counts the requests it receives by
+    endpoint."""
+
+    def __init__(self, workspace, latency=0.0):
+        self.workspace = workspace
+        self.latency = latency
+        self.request_counts = collections.Counter()
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # The headers and body go out in separate writes; with Nagle on,
+            # the body waits for the client's delayed ACK on kept-alive
+            # connections.
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                server._handle(self, "GET")
+
+            def do_POST(self):
+                server._handle(self, "POST")
+
+            def do_PUT(self):
+                server._handle(self, "PUT")
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:{}/api/1.0".format(self._httpd.server_address[1])
+
+    @property
+    def num_requests(self):
+        return sum(self.request_counts.values())
+
+    def reset_counts(self):
+        with self._lock:
+            self.request_counts.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _handle(self, handler, method):
+        url = urllib.parse.urlsplit(handler.path)
+        path = url.path[len("/api/1.0"):] if url.path.startswith("/api/1.0") else url.path
+        query = dict(urllib.parse.parse_qsl(url.query))
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+        data = json.loads(body.decode("utf-8")).get("data", {}) if body else {}
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self.request_counts[latency.path_template(
+                    "{} {}".format(method, path))] += 1
+            try:
+                if method == "GET":
+                    status, payload = 200, self._get(path, query)
+                else:
+                    status, payload = 201, {"data": self._write(path, data)}
+            except _NotFound:
+                status, payload = 404, {"errors": [{"message": "Not found"}]}
+            payload = json.dumps(payload).encode("utf-8")
+
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        if "gzip" in handler.headers.get("Accept-Encoding", ""):
+            payload = gzip.compress(payload)
+            handler.send_header("Content-Encoding", "gzip")
+        handler.send_header("Content-Length", str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def _get(self, path, query):
+        ws = self.workspace
+        match = _route(path)
+        if match is None:
+            raise _NotFound()
+        name, object_id = match
+
+        if name == "users/me":
+            return {"data": ws.users[ME_USER_ID]}
+        if name == "collection workspaces/projects":
+            return self._page(path, query, [ws.projects[project_id] for project_id
+                                            in ws.workspace_projects[object_id]])
+        if name == "collection projects/tasks":
+            tasks = [ws.tasks[task_id] for task_id in ws.project_tasks[object_id]]
+            modified_since = query.get("modified_since")
+            if modified_since:
+                tasks = [task for task in tasks if task["modified_at"] >= modified_since]
+            return self._page(path, query, tasks)
+        if name == "collection tasks/subtasks":
+            return self._page(path, query, [ws.tasks[task_id] for task_id
+                                            in ws.subtasks[object_id]])
+        if name == "collection tasks/stories":
+            return self._page(path, query, [ws.stories[story_id] for story_id
+                                            in ws.task_stories[object_id]])
+
+        objects = {"workspaces": ws.workspaces, "projects": ws.projects,
+                   "tasks": ws.tasks, "stories": ws.stories, "users": ws.users,
+                   "custom_fields": ws.custom_fields}[name]
+        if object_id not in objects:
+            raise _NotFound()
+        return {"data": objects[object_id]}
+
+    def _page(self, path, query, items):
+        offset = int(query.get("offset") or 0)
+        limit = int(query.get("limit") or 100)
+        next_page = None
+        if offset + limit < len(items):
+            next_offset = str(offset + limit)
+            next_page = {"offset": next_offset,
+                         "path": "{}?offset={}".format(path, next_offset),
+                         "uri": "{}{}?offset={}".format(self.base_url, path, next_offset)}
+        return {"data": items[offset:offset + limit], "next_page": next_page}
+
+    def _write(self, path, data):
+        ws = self.workspace
+        match = _route(path)
+        if match is None:
+            raise _NotFound()
+        name, object_id = match
+
+        try:
+            if name == "collection workspaces/projects":
+                return ws.add_project(object_id, data)
+            if name == "collection workspaces/tasks":
+                return ws.add_task(data)
+            if name == "tasks/setParent":
+                return ws.set_parent(object_id, int(data["parent"]))
+            if name == "tasks/addProject":
+                return ws.add_to_project(object_id, int(data["project"]))
+            if name == "collection tasks/stories":
+                return ws.add_story(object_id, data)
+        except KeyError:
+            raise _NotFound()
+        raise _NotFound()
+
+
+_ROUTE = re.compile(r"^/(\w+)/(\d+|me)(?:/(\w+))?$")
+
+
+def _route(path):
+    """Returns (name, id) for a path such as /tasks/12/stories, where name
+    is "collection tasks/stories" for collections, "tasks/setParent" for
+    actions and "tasks" for objects."""
+    match = _ROUTE.match(path)
+    if match is None:
+        return None
+    resource, object_id, child = match.groups()
+    if object_id == "me":
+        return "users/me", None
+    if child in ("setParent", "addProject"):
+        return "{}/{}".format(resource, child), int(object_id)
+    if child:
+        return "collection {}/{}".format(resource, child), int(object_id)
+    return resource, int(object_id)
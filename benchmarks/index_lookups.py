@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+"""Measures the per-task database lookups of export, synchronize and import
+on a synthetic SQLite database, first without the secondary indexes, as in
+a database created before `create' made them, and then after
+`ensure_indexes'.  Prints each lookup's query plan and mean time.
+
+The lookups run through the same Workspace, Project, Story and Import code
+as the scripts, against sqlite3 directly, so no ODBC driver is needed.
+
+Usage: python benchmarks/index_lookups.py [--tasks N] [--projects N]
+           [--lookups N] [--rounds N] [--json FILE]
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from asana2sql import workspace
+from asana2sql.fields import default_fields, default_story_fields
+from asana2sql.Import import ImportSomething
+from asana2sql.Project import Project
+from asana2sql.Story import Story
+from asana2sql.workspace import Workspace
+
+TABLE_NAME_OPTIONS = [
+        "table_name", "projects_table_name", "project_memberships_table_name",
+        "users_table_name", "followers_table_name", "custom_fields_table_name",
+        "custom_field_enum_values_table_name", "custom_field_values_table_name",
+        "sync_state_table_name", "event_sync_tokens_table_name",
+        "row_fingerprints_table_name", "export_progress_table_name",
+        "exported_tasks_table_name"]
+
+
+class SQLiteDatabase(object):
+    """The read and write interface of DatabaseWrapper over sqlite3, which
+    remembers the last statement read so its plan can be shown."""
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path)
+        self.last_read = None
+
+    def read(self, sql, *params):
+        self.last_read = (sql, params)
+        return self._connection.execute(sql, params).fetchall()
+
+    def write(self, sql, *params):
+        self._connection.execute(sql, params)
+
+    def write_many(self, sql, rows):
+        self._connection.executemany(sql, rows)
+
+    def commit(self):
+        self._connection.commit()
+
+    def drop_secondary_indexes(self):
+        for (name,) in self._connection.execute(
+                "SELECT name FROM sqlite_master "
+                "WHERE type = 'index' AND sql IS NOT NULL;").fetchall():
+            self._connection.execute('DROP INDEX "{}";'.format(name))
+        self._connection.commit()
+
+    def query_plan(self):
+        sql, params = self.last_read
+        return "; ".join(row[-1] for row in self._connection.execute(
+                "EXPLAIN QUERY PLAN " + sql, params).fetchall())
+
+
+class Database(object):
+    """A synthetic export, and the objects that look things up in it."""
+
+    def __init__(self, path, args):
+        self.db = SQLiteDatabase(path)
+        config = argparse.Namespace(**{name: None for name in TABLE_NAME_OPTIONS})
+        config.table_name = "tasks"
+        config.stories_table_name = "stories"
+        config.workspace_id = 2
+
+        self._config = config
+        self.workspace = Workspace(None, self.db, config)
+        self.project = Project(None, self.db, self.workspace, config,
+                               default_fields(self.workspace))
+        self.stories = Story(None, self.db, None, config, default_story_fields(None))
+        self.import_tasks = ImportSomething("tasks", None, None, self.db, config)
+
+        self.task_ids = list(range(1, args.tasks + 1))
+        self.project_ids = list(range(1, args.projects + 1))
+
+    def create(self, args):
+        self.workspace.create_tables()
+        self.project.create_table()
+        self.stories.create_table()
+        self.import_tasks.create_table()
+        self._populate(args)
+        self.db.commit()
+
+    def ensure_indexes(self):
+        self.workspace.create_indexes()
+        self.stories.create_indexes()
+        self.db.commit()
+
+    def _populate(self, args):
+        rand = random.Random(args.seed)
+        num_custom_fields = 10
+        memberships = []
+        followers = []
+        custom_field_values = []
+        stories = []
+        for task_id in self.task_ids:
+            projects = rand.sample(self.project_ids, 2 if rand.random() < 0.1 else 1)
+            memberships.extend((task_id, project_id) for project_id in projects)
+            followers.extend((task_id, user_id)
+                             for user_id in rand.sample(range(1, 101), 3))
+            custom_field_values.extend(
+                    (task_id, custom_field_id, None, 1.0, None)
+                    for custom_field_id in rand.sample(range(1, num_custom_fields + 1), 3))
+            stories.extend((task_id * 10 + i, task_id, "2017-01-01T00:00:{:02}.000Z".format(i))
+                           for i in range(args.stories_per_task))
+
+        self.db.write_many(
+                'INSERT INTO "tasks" (id, name) VALUES (?, ?);',
+                [(task_id, "Task {}".format(task_id)) for task_id in self.task_ids])
+        self.db.write_many(
+                workspace.INSERT_PROJECT_MEMBERSHIP.format(
+                    table_name=self.workspace.project_memberships_table_name()),
+                memberships)
+        self.db.write_many(
+                workspace.INSERT_FOLLOWER.format(
+                    table_name=self.workspace.followers_table_name()),
+                followers)
+        self.db.write_many(
+                workspace.INSERT_CUSTOM_FIELD_VALUE.format(
+                    table_name=self.workspace.custom_field_values_table_name()),
+                custom_field_values)
+        self.db.write_many(
+                'INSERT INTO "stories" (id, target_id, created_at) VALUES (?, ?, ?);',
+                stories)
+        self.db.write_many(
+                'INSERT INTO "{}" (id, new_id) VALUES (?, ?);'.format(
+                    self.import_tasks.table_name()),
+                [(task_id, task_id + 1000000) for task_id in self.task_ids])
+
+    def _task_story_ids(self, task_id):
+        task = {"id": task_id}
+        return Story(None, self.db, task, self._config,
+                     default_story_fields(task)).db_story_ids()
+
+    def lookups(self):
+        """(name, lookup function, argument ids) of each lookup."""
+        return [
+            ("followers by task_id", self.workspace.get_followers, self.task_ids),
+            ("project_memberships by task_id", self.workspace.task_memberships,
+             self.task_ids),
+            ("custom_field_values by task_id",
+             self.workspace.task_custom_field_values, self.task_ids),
+            ("tasks in project (import)", self.project.db_select_all_in_project,
+             self.project_ids),
+            ("stories by target_id (synchronize)", self._task_story_ids,
+             self.task_ids),
+            ("stories by target_id (import)",
+             lambda task_id: self.stories.db_select_where("target_id = {}".format(task_id)),
+             self.task_ids),
+            ("import mapping by id", self.import_tasks.get_mapping, self.task_ids),
+        ]
+
+
+def samples(database, num_lookups, seed):
+    """The ids each lookup is timed on, the same with and without the
+    indexes."""
+    rand = random.Random(seed)
+    return {name: [rand.choice(ids) for _ in range(num_lookups)]
+            for name, _, ids in database.lookups()}
+
+
+def measure(database, samples, results):
+    """Time each lookup on its sample, keeping its fastest time in
+    results.  Every sample is looked up once untimed first, so that each
+    is timed on warm caches."""
+    for name, lookup, ids in database.lookups():
+        sample = samples[name]
+        lookup(sample[0])
+        plan = database.db.query_plan()
+        for id in sample:
+            lookup(id)
+        seconds = min(timeit.repeat(
+                lambda: [lookup(id) for id in sample], number=1, repeat=5))
+        us = seconds / len(sample) * 1e6
+        if name not in results or us < results[name]["us"]:
+            results[name] = {"plan": plan, "us": us}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=20000)
+    parser.add_argument("--projects", type=int, default=50)
+    parser.add_argument("--stories_per_task", type=int, default=5)
+    parser.add_argument("--lookups", type=int, default=200,
+                        help="Number of lookups timed of each kind.")
+    parser.add_argument("--rounds", type=int, default=5,
+                        help=("Number of times the lookups are timed without "
+                              "and then with the indexes, keeping the fastest."))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="FILE",
+                        help="Also write the results to FILE as JSON.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database = Database(os.path.join(tmp_dir, "benchmark.db"), args)
+        database.create(args)
+
+        lookup_samples = samples(database, args.lookups, args.seed)
+        before = {}
+        after = {}
+        for _ in range(args.rounds):
+            database.db.drop_secondary_indexes()
+            measure(database, lookup_samples, before)
+            database.ensure_indexes()
+            measure(database, lookup_samples, after)
+
+    print("Lookups on {} tasks in {} projects, mean of {} each, "
+          "fastest of {} rounds:".format(
+        args.tasks, args.projects, args.lookups, args.rounds))
+    for name in before:
+        print("{}: {:.1f} us -> {:.1f} us ({:.1f}x)".format(
+            name, before[name]["us"], after[name]["us"],
+            before[name]["us"] / after[name]["us"]))
+        print("  before: {}".format(before[name]["plan"]))
+        print("  after:  {}".format(after[name]["plan"]))
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"options": vars(args), "before": before, "after": after},
+                      json_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""Measures the per-row overhead of Project.insert_or_replace, with the
+database write itself stubbed out, against rebuilding the statement for
+every row as the code used to.
+
+Usage: python benchmarks/statement_overhead.py [--rows N] [--columns N]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from asana2sql import util
+from asana2sql.Field import SimpleField, SqlType
+from asana2sql.Project import Project
+
+
+class NullDatabase(object):
+    def write(self, sql, *params):
+        pass
+
+
+class RebuildingProject(Project):
+    """The statement handling before it was cached: the table name and the
+    statement are rebuilt for every row."""
+
+    def table_name(self):
+        return util.sql_safe_name.__wrapped__(
+                self._table_name if self._table_name else self.project_name())
+
+    def _statement(self, template):
+        return template.format(
+                table_name=self.table_name(),
+                columns=",".join(field.sql_name for field in self._direct_fields),
+                values=",".join("?" for field in self._direct_fields),
+                id_column=self._id_field().sql_name)
+
+
+def time_per_row(project_class, rows, columns):
+    config = argparse.Namespace(project_id=1, table_name="Benchmark Tasks (all)")
+    fields = [SimpleField("column_{}".format(i), SqlType.STRING)
+              for i in range(columns)]
+    project = project_class(None, NullDatabase(), None, config, fields)
+    task = {"column_{}".format(i): "value" for i in range(columns)}
+
+    seconds = min(timeit.repeat(
+            lambda: project.insert_or_replace(task), number=rows, repeat=5))
+    return seconds / rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--columns", type=int, default=20)
+    args = parser.parse_args()
+
+    before = time_per_row(RebuildingProject, args.rows, args.columns)
+    after = time_per_row(Project, args.rows, args.columns)
+    print("Per-row overhead of insert_or_replace ({} columns):".format(args.columns))
+    print("  statement rebuilt per row: {:.2f} us".format(before * 1e6))
+    print("  statement built once:      {:.2f} us".format(after * 1e6))
+    print("  speedup: {:.1f}x".format(before / after))
+
+
+if __name__ == '__main__':
+    main()
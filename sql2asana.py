@@ -5,13 +5,16 @@ import pyodbc
 import requests
 import sys
 
+from asana2sql import cassette
+from asana2sql import latency
 from asana2sql.fields import default_fields, default_story_fields
 from asana2sql.Import import ImportUsers, ImportProjects, ImportTasks, ImportTaskParents, ImportProjectMemberships, ImportStories
 from asana2sql.Project import Project
 from asana2sql.Story import Story
 from asana2sql.workspace import Workspace
 from asana2sql.db_wrapper import DatabaseWrapper
-from asana import Client, session
+from asana2sql.commit_controller import CommitController
+from asana2sql.client import build_asana_client
 
 def arg_parser():
     parser = argparse.ArgumentParser()
@@ -34,6 +37,13 @@ def arg_parser():
             default=False,
             help="Print performance information on completion.")
 
+    parser.add_argument(
+            '--perf_json',
+            metavar="FILE",
+            help=("Write the API and database counters and latency "
+                  "percentiles, by endpoint and by SQL statement, to FILE "
+                  "as JSON on completion."))
+
     parser.add_argument(
         '--with_stories',
         action="store_true",
@@ -75,6 +85,51 @@ def arg_parser():
             default=False,
             help="Dump API requests to STDOUT")
 
+    asana_args.add_argument(
+            "--requests_per_minute",
+            type=int,
+            help=("Maximum number of Asana API requests to issue per minute. "
+                  "429 responses are always honored."))
+
+    asana_args.add_argument(
+            "--http_pool_size",
+            type=int,
+            help=("Number of HTTP connections to keep open to the Asana API. "
+                  "Defaults to 10; the import issues one request at a time."))
+
+    asana_args.add_argument(
+            "--no_keep_alive",
+            dest="keep_alive",
+            default=True,
+            action="store_false",
+            help="Open a new HTTP connection for every API request.")
+
+    asana_args.add_argument(
+            "--no_compression",
+            dest="compression",
+            default=True,
+            action="store_false",
+            help="Don't ask for gzip compressed API responses.")
+
+    cassette_args = asana_args.add_mutually_exclusive_group()
+
+    cassette_args.add_argument(
+            "--record",
+            metavar="DIR",
+            help="Record every API response to a cassette in DIR.")
+
+    cassette_args.add_argument(
+            "--replay",
+            metavar="DIR",
+            help=("Serve the API responses recorded in DIR instead of "
+                  "calling Asana, failing on any request not recorded."))
+
+    asana_args.add_argument(
+            "--replay_latency",
+            type=cassette.replay_latency,
+            help=("Delay each replayed response by this many seconds, or by "
+                  "the time it took when recorded with `recorded'."))
+
     # DB options
     db_args = parser.add_argument_group('Database Options')
 
@@ -94,6 +149,27 @@ def arg_parser():
             default=False,
             help="Dry run.  Do not actually run any writes to the database.")
 
+    db_args.add_argument(
+            "--write_batch_size",
+            type=int,
+            default=0,
+            help=("Buffer consecutive writes of the same statement and "
+                  "execute them in batches of up to this many rows.  0 "
+                  "executes every write immediately."))
+
+    db_args.add_argument(
+            "--commit_every",
+            type=int,
+            default=1,
+            help=("Commit after every this many imported objects.  Each object "
+                  "is created in Asana before its mapping is committed, so a "
+                  "crash may import up to this many objects again on restart."))
+
+    db_args.add_argument(
+            "--commit_interval",
+            type=float,
+            help="Also commit once this many seconds have passed since the last commit.")
+
     # Commands
     subparsers = parser.add_subparsers(
             title="Commands",
@@ -141,49 +217,27 @@ def arg_parser():
 
     return parser
 
-def build_asana_client(args):
-    options = {
-        'session': session.AsanaOAuth2Session(
-            token={'access_token': args.access_token})}
-
-    if args.base_url:
-        options['base_url'] = args.base_url
-    if args.verify is not None:
-        # urllib3.disable_warnings()
-        options['verify'] = args.verify
-    if args.dump_api:
-        options['dump_api'] = args.dump_api
-
-    return RequestCountingClient(**options);
-
-class RequestCountingClient(Client):
-    def __init__(self, dump_api=False, session=None, auth=None, **options):
-        Client.__init__(self, session=session, auth=auth, **options)
-        self._dump_api = dump_api
-        self._num_requests = 0
-
-    @property
-    def num_requests(self):
-        return self._num_requests
-
-    def request(self, method, path, **options):
-        if self._dump_api:
-            print("{}: {}".format(method, path))
-        self._num_requests += 1
-        return Client.request(self, method, path, **options)
-
 def main():
     parser = arg_parser()
     args = parser.parse_args()
 
     client = build_asana_client(args)
+    try:
+        command_main(parser, args, client)
+    finally:
+        client.close()
 
+
+def command_main(parser, args, client):
     db_client = None
     if args.odbc_string:
         print("Connecting to database.")
         db_client = pyodbc.connect(args.odbc_string)
 
-    db_wrapper = DatabaseWrapper(db_client, dump_sql=args.dump_sql, dry=args.dry)
+    db_wrapper = CommitController(
+            DatabaseWrapper(db_client, dump_sql=args.dump_sql, dry=args.dry,
+                            batch_size=args.write_batch_size),
+            commit_every=args.commit_every, commit_interval=args.commit_interval)
 
     workspace = Workspace(client, db_wrapper, args)
     asana_workspace = client.workspaces.find_by_id(args.workspace_id)
@@ -197,10 +251,6 @@ def main():
     import_project_memberships = ImportProjectMemberships(client, db_wrapper, args, import_projects, import_tasks)
     import_stories = ImportStories(client, db_wrapper, args, import_tasks)
 
-    def commit():
-        if not args.dry:
-            db_client.commit()
-
     if args.command == 'create':
         import_users.create_table()
         import_projects.create_table()
@@ -232,37 +282,64 @@ def main():
 
         for project in projects:
             import_projects.import_once(project)
-            commit()
+            db_wrapper.checkpoint()
         
         for task in tasks:
             task_id = task["id"]
             import_tasks.import_once(task)
-            commit()
+            db_wrapper.checkpoint()
 
             # tasks are added to the end of each project by default,
             # so we add them in order we exported them.
             memberships = workspace.task_memberships(task_id)
             import_project_memberships.import_once(task, memberships)
-            commit()
+            db_wrapper.checkpoint()
 
             stories = stories_singleton.db_select_where("target_id = {}".format(task_id))
             for story in stories:
                 import_stories.import_once(task, story)
-                commit()
+                db_wrapper.checkpoint()
 
         # subtasks are added to the TOP of the subtask list by default,
         # so we need to add them in reverse order.
         for task in reversed(tasks):
             import_task_parents.import_once(task)
-            commit()
+            db_wrapper.checkpoint()
            
-    commit()
+    db_wrapper.commit()
 
     if args.dump_perf:
         print("Finished `{}' for workspace {} ({})".format(args.command, asana_workspace.get("name"), asana_workspace.get("id")))
         print("API Requests: {}".format(client.num_requests))
-        print("DB Commands: reads = {}, writes = {}, executed = {}".format(
-            db_wrapper.num_reads, db_wrapper.num_writes, db_wrapper.num_executed))
+        print("API Throttling: 429s = {}, slow = {}, server errors = {}, "
+              "retry-after wait = {:.1f}s, rate limit wait = {:.1f}s, "
+              "concurrency = {} (min {})".format(
+            client.scheduler.num_throttled, client.scheduler.num_slow,
+            client.scheduler.num_server_errors,
+            client.scheduler.throttle_wait_seconds,
+            client.scheduler.rate_wait_seconds,
+            client.scheduler.concurrency_limit,
+            client.scheduler.min_concurrency_limit))
+        print("HTTP Connections: opened = {}, requests = {}, reused = {}, compressed responses = {}".format(
+            client.connection_stats.num_connections,
+            client.connection_stats.num_requests,
+            client.connection_stats.num_reused,
+            client.connection_stats.num_compressed))
+        print("Commits: {} (total {:.2f}s, max {:.3f}s)".format(
+            db_wrapper.num_commits, db_wrapper.commit_seconds,
+            db_wrapper.max_commit_seconds))
+        print("DB Commands: reads = {}, writes = {}, executed = {} (batches = {})".format(
+            db_wrapper.num_reads, db_wrapper.num_writes, db_wrapper.num_executed,
+            db_wrapper.num_batches))
+        print("API Latency by endpoint:")
+        for line in client.request_latency.format_lines():
+            print(line)
+        print("DB Latency by statement:")
+        for line in db_wrapper.statement_latency.format_lines():
+            print(line)
+
+    if args.perf_json:
+        latency.write_perf_json(args.perf_json, client, db_wrapper)
         
 if __name__ == '__main__':
     main()